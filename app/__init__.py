@@ -39,8 +39,9 @@ except ImportError:
     print("⚠️  Instale com: pip install Flask-CORS")
 from config import Config
 from app.models.professor import db
+from app.migracoes import MigracaoBloqueada
 
-def create_app():
+def create_app(bloquear_migracoes=True):
     # Obter o diretório raiz do projeto
     base_dir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
     template_dir = os.path.join(base_dir, 'templates')
@@ -140,22 +141,15 @@ def create_app():
             if stop is None:
                 return list(range(start))
             return list(range(start, stop, step))
-        return dict(range=range_func)
+        # Miniatura dos comprovantes nas listagens de pagamentos
+        from app.services.preview_service import url_preview
+        return dict(range=range_func, url_preview=url_preview)
     
     # Importar modelos para garantir que as tabelas sejam criadas
-    from app.models import professor, aluno, matricula, usuario, horario_professor, nota, pagamento, senha_reset
+    from app.models import professor, aluno, matricula, usuario, horario_professor, nota, pagamento, senha_reset, versao_tabela, modalidade
     
-    # Configurar Cloudinary
-    import cloudinary
-    import cloudinary.uploader
-    import cloudinary.api
-    
-    cloudinary.config(
-        cloud_name=app.config.get('CLOUDINARY_CLOUD_NAME', ''),
-        api_key=app.config.get('CLOUDINARY_API_KEY', ''),
-        api_secret=app.config.get('CLOUDINARY_API_SECRET', ''),
-        secure=True
-    )
+    # O armazenamento dos comprovantes (Cloudinary, S3, disco local) é configurado sob demanda
+    # pelo backend escolhido em ARMAZENAMENTO_BACKEND (app/services/armazenamento_service.py)
     
     with app.app_context():
         try:
@@ -212,8 +206,30 @@ def create_app():
                 if 'does not exist' not in error_str and 'no such table' not in error_str:
                     print(f"⚠️  Aviso na migração: {e}")
             
+            # Migração: colunas novas em tabelas existentes (antes de qualquer query do ORM)
+            from app.migracoes import (
+                adicionar_colunas_faltantes, criar_indices_faltantes, verificar_notas_duplicadas,
+                liberar_comprovantes_duplicados, preencher_medias_notas
+            )
+            adicionar_colunas_faltantes()
+            
             db.create_all()
             
+            # Índices declarados nos modelos (create_all só cria índices de tabelas novas);
+            # notas duplicadas ou um índice único que não pode ser criado interrompem a
+            # inicialização (scripts de manutenção passam bloquear_migracoes=False)
+            if bloquear_migracoes:
+                verificar_notas_duplicadas()
+            liberar_comprovantes_duplicados()
+            criar_indices_faltantes(bloquear=bloquear_migracoes)
+            
+            # Notas anteriores à coluna media (lida sem fallback nas listagens e no boletim)
+            preencher_medias_notas()
+            
+            # Tabela de referência de modalidades (e associações na primeira execução)
+            from app.models.modalidade import inicializar_modalidades
+            inicializar_modalidades()
+            
             # Verificar e criar usuário admin se não existir (apenas em produção)
             env = app.config.get('ENVIRONMENT', 'dev')
             if env == 'prd':
@@ -245,6 +261,9 @@ def create_app():
             print(f"✓ Ambiente: {env.upper()}")
             print(f"✓ Banco de dados: {db_uri}")
             print("✓ Tabelas criadas/verificadas com sucesso")
+        except MigracaoBloqueada as e:
+            print(f"✗ Migração bloqueada: {e}")
+            raise
         except Exception as e:
             print(f"✗ Erro ao criar tabelas: {e}")
             import traceback
@@ -2,7 +2,7 @@
 API REST para integração com frontend moderno (Lovable, React, etc.)
 Mantém as rotas atuais funcionando, adiciona endpoints API em paralelo
 """
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, make_response
 from flask_login import login_user, current_user
 from app.models.professor import db, Professor
 from app.models.aluno import Aluno
@@ -11,16 +11,19 @@ from app.models.usuario import Usuario
 from app.models.pagamento import Pagamento
 from app.models.nota import Nota
 from app.models.senha_reset import SenhaReset
+from app.models.versao_tabela import obter_versoes
 from datetime import datetime, date
 from functools import wraps
 import hashlib
+import base64
+import json
 from calendar import monthrange
-from werkzeug.utils import secure_filename
 import os
 import re
 import unicodedata
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import or_, and_
+from sqlalchemy.orm import joinedload
 
 api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
 
@@ -46,7 +49,9 @@ def api_root():
             'professores': '/api/v1/professores',
             'pagamentos': '/api/v1/pagamentos',
             'notas': '/api/v1/notas',
-            'dashboard': '/api/v1/dashboard/stats'
+            'boletim': '/api/v1/turmas/<professor_id>/<tipo_curso>/boletim',
+            'dashboard': '/api/v1/dashboard/stats',
+            'export': '/api/v1/export/<alunos|pagamentos|notas|matriculas>?formato=csv|xlsx'
         }
     })
 
@@ -123,6 +128,119 @@ def api_write_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def api_etag(*tabelas):
+    """
+    Decorador de GET condicional para listagens
+    
+    O ETag é derivado das versões das tabelas informadas (incrementadas a cada escrita),
+    dos parâmetros da query e do usuário/role. Se o cliente enviar If-None-Match com o
+    mesmo ETag, responde 304 sem consultar as tabelas de dados.
+    Além de nomes de tabela, aceita funções que recebem os argumentos da rota e retornam
+    chaves de versão mais finas (ex: chave_turma, versão das notas de uma turma).
+    Deve ser aplicado abaixo de @api_login_required.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+            
+            chaves = []
+            for tabela in tabelas:
+                chaves.extend(tabela(**kwargs) if callable(tabela) else [tabela])
+            versoes = obter_versoes(chaves)
+            chave = '|'.join([
+                ','.join(f'{tabela}:{versoes[tabela]}' for tabela in sorted(versoes)),
+                request.path,
+                '&'.join(sorted(f'{k}={v}' for k, v in request.args.items(multi=True))),
+                f'{current_user.role}:{current_user.id}',
+                # Status de vencimento/atraso depende do dia atual
+                date.today().isoformat()
+            ])
+            etag = hashlib.sha1(chave.encode('utf-8')).hexdigest()
+            
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+            
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+# Paginação por cursor (keyset) das listagens: tamanho padrão e máximo da página
+LIMITE_PADRAO_PAGINA = 100
+LIMITE_MAXIMO_PAGINA = 500
+
+def _codificar_cursor(valor, id_):
+    if isinstance(valor, (datetime, date)):
+        valor = valor.isoformat()
+    dados = json.dumps([valor, id_]).encode('utf-8')
+    return base64.urlsafe_b64encode(dados).decode('ascii').rstrip('=')
+
+def _decodificar_cursor(cursor, coluna):
+    """Retorna (valor, id) do cursor, convertendo o valor para o tipo Python da coluna"""
+    try:
+        dados = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valor, id_ = json.loads(dados)
+        if valor is not None:
+            tipo = coluna.type.python_type
+            if tipo is datetime:
+                valor = datetime.fromisoformat(valor)
+            elif tipo is date:
+                valor = date.fromisoformat(valor)
+        return valor, int(id_)
+    except (ValueError, TypeError, NotImplementedError):
+        raise ValueError('Cursor inválido')
+
+def paginar_por_cursor(query, coluna_id, coluna=None):
+    """
+    Aplica paginação por cursor em ordem decrescente de (coluna, id), ou só de id
+    
+    Lê ?limite= e ?cursor= da requisição. Em vez de OFFSET, a página seguinte continua a
+    partir da última linha retornada, então o custo não cresce com o número da página.
+    Valores nulos de coluna ficam no final.
+    
+    Returns:
+        (itens, proximo_cursor) - proximo_cursor é None na última página
+    Raises:
+        ValueError: se o cursor for inválido
+    """
+    limite = request.args.get('limite', LIMITE_PADRAO_PAGINA, type=int)
+    limite = max(1, min(limite, LIMITE_MAXIMO_PAGINA))
+    
+    cursor = request.args.get('cursor', '').strip()
+    if cursor:
+        valor, ultimo_id = _decodificar_cursor(cursor, coluna if coluna is not None else coluna_id)
+        if coluna is None:
+            query = query.filter(coluna_id < ultimo_id)
+        elif valor is None:
+            query = query.filter(coluna.is_(None), coluna_id < ultimo_id)
+        else:
+            query = query.filter(or_(
+                coluna < valor,
+                and_(coluna == valor, coluna_id < ultimo_id),
+                coluna.is_(None)
+            ))
+    
+    ordem = [coluna_id.desc()]
+    if coluna is not None:
+        ordem.insert(0, coluna.desc().nulls_last())
+    
+    # Busca uma linha a mais só para saber se existe próxima página
+    itens = query.order_by(*ordem).limit(limite + 1).all()
+    proximo_cursor = None
+    if len(itens) > limite:
+        itens = itens[:limite]
+        ultimo = itens[-1]
+        valor = getattr(ultimo, coluna.key) if coluna is not None else None
+        proximo_cursor = _codificar_cursor(valor, getattr(ultimo, coluna_id.key))
+    return itens, proximo_cursor
+
 def gerar_username_voxen(nome, role='aluno'):
     """
     Gera um username único baseado no nome + 'voxen'
@@ -469,6 +587,7 @@ def api_alterar_senha():
 
 @api_bp.route('/alunos', methods=['GET'])
 @api_login_required
+@api_etag('alunos', 'matriculas')
 def api_listar_alunos():
     """Lista todos os alunos (com filtros opcionais e filtragem por role)"""
     try:
@@ -477,6 +596,7 @@ def api_listar_alunos():
         aprovado = request.args.get('aprovado')
         search = request.args.get('search', '').strip()
         professor_id = request.args.get('professor_id')
+        modalidade = request.args.get('modalidade', '').strip()
         
         query = Aluno.query
         
@@ -511,6 +631,13 @@ def api_listar_alunos():
                 )
             )
         
+        # Filtrar por modalidade (várias separadas por vírgula; modo=todas exige todas)
+        if modalidade:
+            from app.models.modalidade import filtro_modalidades
+            codigos = [c.strip() for c in modalidade.split(',') if c.strip()]
+            todas = request.args.get('modo', 'qualquer') == 'todas'
+            query = query.filter(filtro_modalidades(Aluno, codigos, todas=todas))
+        
         alunos = query.order_by(Aluno.nome).all()
         
         resultado = []
@@ -633,6 +760,7 @@ def api_get_aluno(aluno_id):
 
 @api_bp.route('/professores', methods=['GET'])
 @api_login_required
+@api_etag('professores', 'horarios_professor')
 def api_listar_professores():
     """Lista todos os professores"""
     try:
@@ -643,14 +771,13 @@ def api_listar_professores():
         if ativo:
             query = query.filter_by(ativo=True)
         
-        # Filtrar por tipo de curso se especificado
+        # Filtrar por tipo de curso se especificado (qualquer modalidade; várias separadas por vírgula)
+        # modo=todas exige que o professor tenha todas as modalidades informadas
         if tipo_curso:
-            from sqlalchemy import or_
-            if tipo_curso == 'dublagem_online':
-                query = query.filter(Professor.dublagem_online == True)
-            elif tipo_curso == 'dublagem_presencial':
-                query = query.filter(Professor.dublagem_presencial == True)
-            # ... adicionar outros tipos conforme necessário
+            from app.models.modalidade import filtro_modalidades
+            codigos = [c.strip() for c in tipo_curso.split(',') if c.strip()]
+            todas = request.args.get('modo', 'qualquer') == 'todas'
+            query = query.filter(filtro_modalidades(Professor, codigos, todas=todas))
         
         professores = query.order_by(Professor.nome).all()
         
@@ -708,6 +835,28 @@ def api_listar_professores():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/modalidades', methods=['GET'])
+@api_login_required
+def api_listar_modalidades():
+    """Lista as modalidades com o total de professores e alunos ativos em cada uma"""
+    try:
+        from app.models.modalidade import contar_por_modalidade
+        
+        resultado = []
+        for modalidade, total_professores, total_alunos in contar_por_modalidade():
+            dados = modalidade.to_dict()
+            dados['total_professores'] = total_professores
+            dados['total_alunos'] = total_alunos
+            resultado.append(dados)
+        
+        return jsonify({
+            'success': True,
+            'count': len(resultado),
+            'data': resultado
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @api_bp.route('/professores/por-modalidade', methods=['GET', 'OPTIONS'])
 @api_login_required
 def api_professores_por_modalidade():
@@ -730,36 +879,21 @@ def api_professores_por_modalidade():
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
         
-        # Mapear modalidade para campo do modelo
-        modalidade_map = {
-            'dublagem_online': 'dublagem_online',
-            'dublagem_presencial': 'dublagem_presencial',
-            'teatro_online': 'teatro_online',
-            'teatro_presencial': 'teatro_presencial',
-            'locucao': 'locucao',
-            'teatro_tv_cinema': 'teatro_tv_cinema',
-            'musical': 'musical',
-            'curso_apresentador': 'curso_apresentador'
-        }
+        from app.services.referencia_service import professores_por_modalidade
         
-        campo_modalidade = modalidade_map.get(modalidade)
-        if not campo_modalidade:
+        # Professores ativos com essa modalidade, servidos do cache de referência em memória
+        professores = professores_por_modalidade(modalidade)
+        if professores is None:
             response = jsonify({'error': 'Modalidade inválida'})
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
         
-        # Buscar professores com essa modalidade
-        query = Professor.query.filter_by(ativo=True)
-        query = query.filter(getattr(Professor, campo_modalidade) == True)
-        
-        professores = query.order_by(Professor.nome).all()
-        
         resultado = []
         for prof in professores:
             resultado.append({
-                'id': prof.id,
-                'nome': prof.nome,
-                'telefone': prof.telefone
+                'id': prof['id'],
+                'nome': prof['nome'],
+                'telefone': prof['telefone']
             })
         
         response = jsonify({
@@ -789,28 +923,18 @@ def api_horarios_professor(professor_id):
     print(f"🔍 GET /professores/{professor_id}/horarios - Usuário autenticado: {current_user.is_authenticated}")
     
     try:
-        from app.models.horario_professor import HorarioProfessor
+        from app.services.referencia_service import horarios_do_professor
         
         modalidade = request.args.get('modalidade', '').strip()
         print(f"🔍 Modalidade filtro: '{modalidade}'")
         
-        query = HorarioProfessor.query.filter_by(professor_id=professor_id)
-        if modalidade:
-            query = query.filter_by(modalidade=modalidade)
-        
-        horarios = query.order_by(HorarioProfessor.dia_semana, HorarioProfessor.horario_aula).all()
+        # Horários do cache de referência, já ordenados por dia/horário estruturados
+        horarios = horarios_do_professor(professor_id, modalidade) or []
         print(f"🔍 Horários encontrados: {len(horarios)}")
         
-        resultado = []
-        for horario in horarios:
-            resultado.append({
-                'id': horario.id,
-                'dia_semana': horario.dia_semana,
-                'horario_aula': horario.horario_aula,
-                'modalidade': horario.modalidade,
-                'idade_minima': horario.idade_minima,
-                'idade_maxima': horario.idade_maxima
-            })
+        campos = ['id', 'dia_semana', 'horario_aula', 'dia_semana_num', 'inicio_min', 'fim_min',
+                  'modalidade', 'idade_minima', 'idade_maxima', 'capacidade']
+        resultado = [{campo: horario[campo] for campo in campos} for horario in horarios]
         
         print(f"✅ Retornando {len(resultado)} horários")
         response = jsonify({
@@ -828,6 +952,188 @@ def api_horarios_professor(professor_id):
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
+@api_bp.route('/horarios/livres', methods=['GET'])
+@api_login_required
+def api_horarios_livres():
+    """
+    Busca horários de aula com vaga por dia e faixa de horário
+    Ex: /horarios/livres?dia_semana=terca&inicio_apos=18:00 (turmas de terça com vaga a partir das 18h)
+    
+    Parâmetros: dia_semana (nome ou 0-6, obrigatório), inicio_apos, fim_ate, modalidade, professor_id,
+    incluir_lotados=true (mantém as turmas sem vaga na resposta, com lotado=true).
+    Usa o índice (dia_semana_num, inicio_min), então a busca é um range scan; a ocupação vem de
+    uma única consulta agrupada (ocupacao_service).
+    """
+    try:
+        from sqlalchemy.orm import contains_eager
+        from app.models.horario_professor import HorarioProfessor, converter_dia_semana, converter_hora
+        from app.services.ocupacao_service import contar_ocupacao, resumo_ocupacao
+        
+        dia_semana = converter_dia_semana(request.args.get('dia_semana'))
+        if dia_semana is None:
+            return jsonify({'error': 'Informe dia_semana (ex: segunda, terca ou 0-6)'}), 400
+        
+        inicio_apos = request.args.get('inicio_apos')
+        fim_ate = request.args.get('fim_ate')
+        inicio_min = converter_hora(inicio_apos) if inicio_apos else None
+        fim_min = converter_hora(fim_ate) if fim_ate else None
+        if (inicio_apos and inicio_min is None) or (fim_ate and fim_min is None):
+            return jsonify({'error': 'Horário inválido. Use o formato HH:MM'}), 400
+        
+        query = HorarioProfessor.query.join(Professor).options(contains_eager(HorarioProfessor.professor)).filter(
+            HorarioProfessor.dia_semana_num == dia_semana,
+            Professor.ativo == True
+        )
+        if inicio_min is not None:
+            query = query.filter(HorarioProfessor.inicio_min >= inicio_min)
+        if fim_min is not None:
+            query = query.filter(HorarioProfessor.fim_min <= fim_min)
+        
+        modalidade = request.args.get('modalidade', '').strip()
+        if modalidade:
+            query = query.filter(HorarioProfessor.modalidade == modalidade)
+        professor_id = request.args.get('professor_id', type=int)
+        if professor_id:
+            query = query.filter(HorarioProfessor.professor_id == professor_id)
+        
+        incluir_lotados = request.args.get('incluir_lotados', 'false').lower() == 'true'
+        
+        horarios = query.order_by(HorarioProfessor.inicio_min, HorarioProfessor.professor_id).all()
+        ocupacao = contar_ocupacao(professor_id)
+        
+        resultado = []
+        for horario in horarios:
+            dados = horario.to_dict()
+            dados['professor_nome'] = horario.professor.nome if horario.professor else None
+            dados.update(resumo_ocupacao(horario, ocupacao))
+            if dados['lotado'] and not incluir_lotados:
+                continue
+            resultado.append(dados)
+        
+        return jsonify({
+            'success': True,
+            'count': len(resultado),
+            'data': resultado
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/horarios/elegiveis', methods=['GET'])
+@api_login_required
+def api_horarios_elegiveis():
+    """
+    Todas as turmas de professores ativos compatíveis com a modalidade e a idade do aluno
+    Ex: /horarios/elegiveis?modalidade=dublagem_online&idade=12&vagas=true
+    
+    Substitui /professores/por-modalidade + /professores/<id>/horarios por professor + filtro no frontend.
+    Parâmetros: modalidade (obrigatório), idade ou aluno_id, vagas=true (inclui capacidade restante),
+    somente_com_vaga=true (remove turmas lotadas).
+    """
+    try:
+        from sqlalchemy.orm import contains_eager
+        from app.models.horario_professor import HorarioProfessor
+        
+        modalidade = request.args.get('modalidade', '').strip()
+        if not modalidade:
+            return jsonify({'error': 'Parâmetro modalidade é obrigatório'}), 400
+        
+        idade = request.args.get('idade', type=int)
+        aluno_id = request.args.get('aluno_id', type=int)
+        if idade is None and aluno_id:
+            aluno = Aluno.query.get_or_404(aluno_id)
+            idade = aluno.calcular_idade()
+        
+        somente_com_vaga = request.args.get('somente_com_vaga', 'false').lower() == 'true'
+        incluir_vagas = somente_com_vaga or request.args.get('vagas', 'false').lower() == 'true'
+        
+        # Usa o índice (modalidade, idade_minima, idade_maxima)
+        query = HorarioProfessor.query.join(Professor).options(contains_eager(HorarioProfessor.professor)).filter(
+            HorarioProfessor.modalidade == modalidade,
+            Professor.ativo == True
+        )
+        if idade is not None:
+            query = query.filter(
+                db.or_(HorarioProfessor.idade_minima.is_(None), HorarioProfessor.idade_minima <= idade),
+                db.or_(HorarioProfessor.idade_maxima.is_(None), HorarioProfessor.idade_maxima >= idade)
+            )
+        
+        horarios = query.order_by(
+            Professor.nome, HorarioProfessor.dia_semana_num, HorarioProfessor.inicio_min
+        ).all()
+        
+        ocupacao = None
+        if incluir_vagas:
+            from app.services.ocupacao_service import contar_ocupacao, resumo_ocupacao
+            ocupacao = contar_ocupacao()
+        
+        resultado = []
+        for horario in horarios:
+            dados = horario.to_dict()
+            dados['professor_nome'] = horario.professor.nome
+            if ocupacao is not None:
+                dados.update(resumo_ocupacao(horario, ocupacao))
+                if somente_com_vaga and dados['lotado']:
+                    continue
+            resultado.append(dados)
+        
+        return jsonify({
+            'success': True,
+            'modalidade': modalidade,
+            'idade': idade,
+            'count': len(resultado),
+            'data': resultado
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/horarios/ocupacao', methods=['GET'])
+@api_login_required
+def api_horarios_ocupacao():
+    """
+    Ocupação de todas as turmas de todos os professores ativos (capacidade, ocupadas, vagas)
+    
+    Usa uma consulta para os horários e uma única consulta agrupada para as matrículas ativas.
+    Filtros opcionais: professor_id, modalidade.
+    """
+    try:
+        from sqlalchemy.orm import contains_eager
+        from app.models.horario_professor import HorarioProfessor
+        from app.services.ocupacao_service import contar_ocupacao, resumo_ocupacao
+        
+        professor_id = request.args.get('professor_id', type=int)
+        # Professor logado vê apenas as próprias turmas
+        if current_user.is_professor() and current_user.professor_id:
+            professor_id = current_user.professor_id
+        modalidade = request.args.get('modalidade', '').strip()
+        
+        query = HorarioProfessor.query.join(Professor).options(contains_eager(HorarioProfessor.professor)).filter(
+            Professor.ativo == True
+        )
+        if professor_id:
+            query = query.filter(HorarioProfessor.professor_id == professor_id)
+        if modalidade:
+            query = query.filter(HorarioProfessor.modalidade == modalidade)
+        
+        horarios = query.order_by(
+            Professor.nome, HorarioProfessor.dia_semana_num, HorarioProfessor.inicio_min
+        ).all()
+        ocupacao = contar_ocupacao(professor_id)
+        
+        resultado = []
+        for horario in horarios:
+            dados = horario.to_dict()
+            dados['professor_nome'] = horario.professor.nome
+            dados.update(resumo_ocupacao(horario, ocupacao))
+            resultado.append(dados)
+        
+        return jsonify({
+            'success': True,
+            'count': len(resultado),
+            'data': resultado
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @api_bp.route('/professores/<int:professor_id>', methods=['GET'])
 @api_login_required
 def api_get_professor(professor_id):
@@ -897,9 +1203,12 @@ def api_get_professor(professor_id):
 
 @api_bp.route('/pagamentos', methods=['GET'])
 @api_login_required
+@api_etag('pagamentos', 'alunos', 'matriculas')
 def api_listar_pagamentos():
     """Lista alunos com status de pagamento calculado (como no sistema antigo)"""
     try:
+        from app.services.preview_service import url_preview
+        
         status_filtro = request.args.get('status')
         aluno_id_filtro = request.args.get('aluno_id', type=int)
         professor_id_filtro = request.args.get('professor_id', type=int)
@@ -1028,6 +1337,7 @@ def api_listar_pagamentos():
                     'status': status_pagamento,
                     'status_label': 'Pago' if status_pagamento == 'pago' else 'Pendente' if status_pagamento == 'pendente' else 'Atrasado',
                     'url_comprovante': pagamento.url_comprovante,
+                    'url_preview': url_preview(pagamento),
                     'observacoes': pagamento.observacoes,
                     'data_cadastro': pagamento.data_cadastro.isoformat() if pagamento.data_cadastro else None
                 })
@@ -1039,7 +1349,9 @@ def api_listar_pagamentos():
                 
                 # FILTRAGEM AUTOMÁTICA POR ROLE
                 if current_user.is_professor() and current_user.professor_id:
-                    query_alunos = query_alunos.join(Matricula).filter(Matricula.professor_id == current_user.professor_id).distinct()
+                    query_alunos = query_alunos.join(Matricula).filter(
+                        Matricula.professor_id == current_user.professor_id, Matricula.ativa
+                    ).distinct()
                 elif current_user.is_aluno() and current_user.aluno_id:
                     query_alunos = query_alunos.filter_by(id=current_user.aluno_id)
                 
@@ -1048,7 +1360,7 @@ def api_listar_pagamentos():
                 
                 if professor_id_filtro and not current_user.is_professor():
                     query_alunos = query_alunos.join(Matricula).filter(
-                        Matricula.professor_id == professor_id_filtro
+                        Matricula.professor_id == professor_id_filtro, Matricula.ativa
                     ).distinct()
                 
                 alunos = query_alunos.order_by(Aluno.nome).all()
@@ -1092,6 +1404,7 @@ def api_listar_pagamentos():
                                         'status': 'atrasado',
                                         'status_label': 'Atrasado',
                                         'url_comprovante': None,
+                                        'url_preview': None,
                                         'observacoes': None,
                                         'data_cadastro': None
                                     })
@@ -1110,6 +1423,7 @@ def api_listar_pagamentos():
                                         'status': 'atrasado',
                                         'status_label': 'Atrasado',
                                         'url_comprovante': None,
+                                        'url_preview': None,
                                         'observacoes': None,
                                         'data_cadastro': None
                                     })
@@ -1123,7 +1437,9 @@ def api_listar_pagamentos():
             
             # FILTRAGEM AUTOMÁTICA POR ROLE
             if current_user.is_professor() and current_user.professor_id:
-                query_alunos = query_alunos.join(Matricula).filter(Matricula.professor_id == current_user.professor_id).distinct()
+                query_alunos = query_alunos.join(Matricula).filter(
+                    Matricula.professor_id == current_user.professor_id, Matricula.ativa
+                ).distinct()
             elif current_user.is_aluno() and current_user.aluno_id:
                 query_alunos = query_alunos.filter_by(id=current_user.aluno_id)
             
@@ -1132,7 +1448,7 @@ def api_listar_pagamentos():
             
             if professor_id_filtro and not current_user.is_professor():
                 query_alunos = query_alunos.join(Matricula).filter(
-                    Matricula.professor_id == professor_id_filtro
+                    Matricula.professor_id == professor_id_filtro, Matricula.ativa
                 ).distinct()
             
             alunos = query_alunos.order_by(Aluno.nome).all()
@@ -1158,6 +1474,7 @@ def api_listar_pagamentos():
                 valor_pago = 0
                 data_pagamento = None
                 url_comprovante = None
+                url_miniatura = None
                 pagamento_id = None
                 
                 if pagamento:
@@ -1165,6 +1482,7 @@ def api_listar_pagamentos():
                     valor_pago = float(pagamento.valor_pago) if pagamento.valor_pago else 0
                     data_pagamento = pagamento.data_pagamento.isoformat() if pagamento.data_pagamento else None
                     url_comprovante = pagamento.url_comprovante
+                    url_miniatura = url_preview(pagamento)
                     
                     if pagamento.status == 'aprovado':
                         status_pagamento = 'pago'
@@ -1207,6 +1525,7 @@ def api_listar_pagamentos():
                     'status': status_pagamento or 'atrasado',
                     'status_label': 'Pago' if status_pagamento == 'pago' else 'Pendente' if status_pagamento == 'pendente' else 'Atrasado',
                     'url_comprovante': url_comprovante,
+                    'url_preview': url_miniatura,
                     'observacoes': pagamento.observacoes if pagamento else None,
                     'data_cadastro': pagamento.data_cadastro.isoformat() if pagamento and pagamento.data_cadastro else None
                 })
@@ -1234,15 +1553,12 @@ def api_dashboard_stats():
         # Isso garante que estamos contando alunos que realmente se matricularam
         hoje = date.today()
         
-        # Alunos com matrícula ativa (sem data_encerramento ou data_encerramento no futuro)
+        # Alunos com matrícula vigente (Matricula.vigente: aluno ativo e matrícula sem
+        # data_encerramento ou com encerramento no futuro)
         alunos_com_matricula = db.session.query(Aluno.id).distinct().join(
             Matricula, Aluno.id == Matricula.aluno_id
         ).filter(
-            Aluno.ativo == True,
-            db.or_(
-                Matricula.data_encerramento.is_(None),
-                Matricula.data_encerramento > hoje
-            )
+            Matricula.vigente
         ).subquery()
         
         total_alunos = db.session.query(db.func.count()).select_from(alunos_com_matricula).scalar() or 0
@@ -1251,23 +1567,15 @@ def api_dashboard_stats():
         alunos_aprovados_com_matricula = db.session.query(Aluno.id).distinct().join(
             Matricula, Aluno.id == Matricula.aluno_id
         ).filter(
-            Aluno.ativo == True,
             Aluno.aprovado == True,
-            db.or_(
-                Matricula.data_encerramento.is_(None),
-                Matricula.data_encerramento > hoje
-            )
+            Matricula.vigente
         ).count()
         
         alunos_pendentes_com_matricula = db.session.query(Aluno.id).distinct().join(
             Matricula, Aluno.id == Matricula.aluno_id
         ).filter(
-            Aluno.ativo == True,
             Aluno.aprovado == False,
-            db.or_(
-                Matricula.data_encerramento.is_(None),
-                Matricula.data_encerramento > hoje
-            )
+            Matricula.vigente
         ).count()
         
         total_professores = Professor.query.filter_by(ativo=True).count()
@@ -1296,11 +1604,7 @@ def api_dashboard_stats():
         alunos_com_matricula_ativa = db.session.query(Aluno.id).distinct().join(
             Matricula, Aluno.id == Matricula.aluno_id
         ).filter(
-            Aluno.ativo == True,
-            db.or_(
-                Matricula.data_encerramento.is_(None),
-                Matricula.data_encerramento > hoje
-            )
+            Matricula.vigente
         ).subquery()
         
         alunos_ativos_ids = [row[0] for row in db.session.query(alunos_com_matricula_ativa.c.id).all()]
@@ -1489,13 +1793,21 @@ def api_alunos_evolucao():
 @api_bp.route('/notas', methods=['GET'])
 @api_login_required
 def api_listar_notas():
-    """Lista notas (filtros opcionais)"""
+    """
+    Lista notas (filtros opcionais), da avaliação mais recente para a mais antiga
+    
+    Paginada por cursor: ?limite= (padrão 100, máx. 500) e ?cursor= (next_cursor da página anterior).
+    """
     try:
         aluno_id = request.args.get('aluno_id', type=int)
         professor_id = request.args.get('professor_id', type=int)
         tipo_curso = request.args.get('tipo_curso', '').strip()
         
-        query = Nota.query
+        # Aluno e professor carregados no mesmo SELECT (evita 2 consultas por nota)
+        query = Nota.query.options(
+            joinedload(Nota.aluno).load_only(Aluno.id, Aluno.nome),
+            joinedload(Nota.professor).load_only(Professor.id, Professor.nome)
+        )
         
         if aluno_id:
             query = query.filter_by(aluno_id=aluno_id)
@@ -1517,7 +1829,10 @@ def api_listar_notas():
             query = query.filter_by(aluno_id=current_user.aluno_id)
         # Admin e Gerente: vêem todas as notas
         
-        notas = query.order_by(Nota.data_avaliacao.desc()).all()
+        try:
+            notas, proximo_cursor = paginar_por_cursor(query, Nota.id, Nota.data_avaliacao)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         resultado = []
         for nota in notas:
@@ -1529,7 +1844,7 @@ def api_listar_notas():
                 'professor_nome': nota.professor.nome if nota.professor else None,
                 'tipo_curso': nota.tipo_curso,
                 'valor': float(nota.valor) if nota.valor is not None else None,
-                'media': nota.calcular_media(),
+                'media': nota.media,
                 'criterio1': float(nota.criterio1) if nota.criterio1 is not None else None,
                 'criterio2': float(nota.criterio2) if nota.criterio2 is not None else None,
                 'criterio3': float(nota.criterio3) if nota.criterio3 is not None else None,
@@ -1544,6 +1859,62 @@ def api_listar_notas():
         return jsonify({
             'success': True,
             'count': len(resultado),
+            'data': resultado,
+            'next_cursor': proximo_cursor
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/notas/estatisticas', methods=['GET'])
+@api_login_required
+@api_etag('notas')
+def api_estatisticas_notas():
+    """
+    Estatísticas das notas por modalidade, turma ou prova, calculadas no banco
+    Ex: /notas/estatisticas?agrupar=prova&tipo_curso=dublagem_online&data_inicio=2025-01-01
+    
+    Parâmetros: agrupar (modalidade|turma|prova, padrão turma), professor_id, tipo_curso,
+    numero_prova, data_inicio, data_fim (YYYY-MM-DD).
+    Retorna por grupo: total, media, minimo, maximo, percentis (p25, mediana, p75, p90) e
+    distribuicao (quantidade de notas por faixa).
+    """
+    try:
+        if current_user.is_aluno():
+            return jsonify({'error': 'Acesso negado'}), 403
+        
+        from app.services.estatisticas_notas_service import calcular_estatisticas
+        
+        professor_id = request.args.get('professor_id', type=int)
+        # Professor vê apenas as estatísticas das próprias turmas
+        if current_user.is_professor():
+            professor = current_user.get_professor()
+            professor_id = professor.id if professor else -1
+        
+        try:
+            data_inicio = request.args.get('data_inicio', '').strip()
+            data_fim = request.args.get('data_fim', '').strip()
+            data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date() if data_inicio else None
+            data_fim = datetime.strptime(data_fim, '%Y-%m-%d').date() if data_fim else None
+        except ValueError:
+            return jsonify({'error': 'Data inválida. Use o formato YYYY-MM-DD'}), 400
+        
+        agrupar = request.args.get('agrupar', 'turma').strip()
+        try:
+            resultado = calcular_estatisticas(
+                agrupar=agrupar,
+                professor_id=professor_id,
+                tipo_curso=request.args.get('tipo_curso', '').strip() or None,
+                numero_prova=request.args.get('numero_prova', type=int),
+                data_inicio=data_inicio,
+                data_fim=data_fim
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'agrupar': agrupar,
+            'count': len(resultado),
             'data': resultado
         })
     except Exception as e:
@@ -1573,7 +1944,7 @@ def api_get_nota(nota_id):
                 'matricula_id': nota.matricula_id,
                 'tipo_curso': nota.tipo_curso,
                 'valor': float(nota.valor) if nota.valor is not None else None,
-                'media': nota.calcular_media(),
+                'media': nota.media,
                 'criterio1': float(nota.criterio1) if nota.criterio1 is not None else None,
                 'criterio2': float(nota.criterio2) if nota.criterio2 is not None else None,
                 'criterio3': float(nota.criterio3) if nota.criterio3 is not None else None,
@@ -1649,9 +2020,153 @@ def api_criar_nota():
                 'id': nota.id,
                 'aluno_nome': nota.aluno.nome if nota.aluno else None,
                 'valor': float(nota.valor) if nota.valor else None,
-                'media': nota.calcular_media()
+                'media': nota.media
             }
         }), 201
+    except IntegrityError:
+        # Índice único uq_notas_aluno_professor_curso_prova
+        db.session.rollback()
+        return jsonify({'error': f'Este aluno já tem a prova {numero_prova} lançada neste curso com este professor. Edite a nota existente.'}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+# Máximo de notas por requisição em /notas/batch
+LIMITE_NOTAS_LOTE = 500
+
+@api_bp.route('/notas/batch', methods=['POST'])
+@api_write_required
+def api_salvar_notas_lote():
+    """
+    Criar/atualizar as notas de uma prova para vários alunos da turma de uma vez
+    
+    Body: {"professor_id": 1 (ignorado para professor), "tipo_curso": "dublagem_online",
+           "numero_prova": 1, "data_avaliacao": "YYYY-MM-DD",
+           "notas": [{"aluno_id": 10, "criterio1": 8, "criterio2": 7.5, "observacao": "..."}, ...]}
+    
+    A permissão e as matrículas são verificadas uma vez para a turma inteira. Se algum item
+    for inválido nada é gravado; caso contrário tudo é gravado em uma transação com um
+    único upsert (insere notas novas e atualiza as da mesma prova).
+    """
+    try:
+        data = request.get_json() or {}
+        
+        tipo_curso = (data.get('tipo_curso') or '').strip()
+        numero_prova = data.get('numero_prova')
+        data_avaliacao_str = (data.get('data_avaliacao') or '').strip()
+        itens = data.get('notas')
+        
+        if not tipo_curso or not numero_prova:
+            return jsonify({'error': 'Tipo de curso e número da prova são obrigatórios'}), 400
+        try:
+            numero_prova = int(numero_prova)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Número da prova inválido'}), 400
+        if not isinstance(itens, list) or not itens:
+            return jsonify({'error': 'Informe a lista de notas'}), 400
+        if len(itens) > LIMITE_NOTAS_LOTE:
+            return jsonify({'error': f'Máximo de {LIMITE_NOTAS_LOTE} notas por requisição'}), 400
+        
+        try:
+            data_avaliacao = datetime.strptime(data_avaliacao_str, '%Y-%m-%d').date() if data_avaliacao_str else date.today()
+        except ValueError:
+            return jsonify({'error': 'Data de avaliação inválida'}), 400
+        
+        # Professor só lança notas nas próprias turmas
+        if current_user.is_professor():
+            professor = current_user.get_professor()
+            if not professor:
+                return jsonify({'error': 'Professor não encontrado'}), 404
+        else:
+            professor_id = data.get('professor_id')
+            if not professor_id:
+                return jsonify({'error': 'professor_id é obrigatório'}), 400
+            professor = Professor.query.get(professor_id)
+            if not professor:
+                return jsonify({'error': 'Professor não encontrado'}), 404
+        
+        from app.routes import obter_matriculas_professor
+        from app.models.nota import CRITERIOS, media_criterios, upsert_notas
+        
+        # Matrículas da turma (uma consulta): define quais alunos podem receber nota
+        matriculas_por_aluno = obter_matriculas_professor(professor, tipo_curso)
+        
+        erros = []
+        linhas = []
+        vistos = set()
+        for posicao, item in enumerate(itens):
+            if not isinstance(item, dict):
+                erros.append(f'Item {posicao}: formato inválido')
+                continue
+            try:
+                aluno_id = int(item.get('aluno_id'))
+            except (TypeError, ValueError):
+                erros.append(f'Item {posicao}: aluno_id inválido')
+                continue
+            if aluno_id in vistos:
+                erros.append(f'Aluno {aluno_id}: informado mais de uma vez')
+                continue
+            vistos.add(aluno_id)
+            
+            matricula = matriculas_por_aluno.get(aluno_id)
+            if not matricula:
+                erros.append(f'Aluno {aluno_id}: não está matriculado nesta turma')
+                continue
+            
+            try:
+                criterios = {c: float(item[c]) if item.get(c) is not None else None for c in CRITERIOS}
+                valor = float(item['valor']) if item.get('valor') is not None else None
+            except (TypeError, ValueError):
+                erros.append(f'Aluno {aluno_id}: critérios e valor devem ser numéricos')
+                continue
+            
+            preenchidos = [v for v in list(criterios.values()) + [valor] if v is not None]
+            if not preenchidos:
+                erros.append(f'Aluno {aluno_id}: valor ou critérios são obrigatórios')
+                continue
+            if any(v < 0 or v > 10 for v in preenchidos):
+                erros.append(f'Aluno {aluno_id}: notas devem estar entre 0 e 10')
+                continue
+            
+            if valor is None:
+                valor = media_criterios(list(criterios.values()))
+            observacao = (item.get('observacao') or '').strip()
+            linhas.append(dict(
+                criterios,
+                aluno_id=aluno_id,
+                professor_id=professor.id,
+                matricula_id=matricula.id,
+                tipo_curso=tipo_curso,
+                numero_prova=numero_prova,
+                valor=valor,
+                data_avaliacao=data_avaliacao,
+                tipo_avaliacao=f'Prova {numero_prova}',
+                observacao=observacao if observacao else None,
+                cadastrado_por=current_user.id
+            ))
+        
+        if erros:
+            return jsonify({'error': 'Nenhuma nota foi salva', 'erros': erros}), 400
+        
+        # Notas que já existem nesta prova (só para separar criadas/atualizadas na resposta)
+        existentes = {aluno_id for (aluno_id,) in db.session.query(Nota.aluno_id).filter(
+            Nota.professor_id == professor.id,
+            Nota.tipo_curso == tipo_curso,
+            Nota.numero_prova == numero_prova,
+            Nota.aluno_id.in_([linha['aluno_id'] for linha in linhas])
+        ).all()}
+        
+        upsert_notas(linhas)
+        db.session.commit()
+        
+        atualizadas = sum(1 for linha in linhas if linha['aluno_id'] in existentes)
+        return jsonify({
+            'success': True,
+            'message': 'Notas salvas com sucesso',
+            'count': len(linhas),
+            'criadas': len(linhas) - atualizadas,
+            'atualizadas': atualizadas
+        })
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -1708,9 +2223,13 @@ def api_editar_nota(nota_id):
             'data': {
                 'id': nota.id,
                 'valor': float(nota.valor) if nota.valor else None,
-                'media': nota.calcular_media()
+                'media': nota.media
             }
         })
+    except IntegrityError:
+        # Índice único uq_notas_aluno_professor_curso_prova (numero_prova já usado por outra nota)
+        db.session.rollback()
+        return jsonify({'error': f'Este aluno já tem a prova {data.get("numero_prova")} lançada neste curso com este professor.'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -1733,6 +2252,38 @@ def api_excluir_nota(nota_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# ==================== TURMAS ====================
+
+def _chaves_boletim(professor_id, tipo_curso):
+    from app.models.versao_tabela import chave_turma
+    return [chave_turma(professor_id, tipo_curso)]
+
+@api_bp.route('/turmas/<int:professor_id>/<tipo_curso>/boletim', methods=['GET'])
+@api_login_required
+@api_etag(_chaves_boletim, 'matriculas', 'alunos')
+def api_boletim_turma(professor_id, tipo_curso):
+    """
+    Boletim da turma: matriz alunos × provas com média de cada aluno e da turma por prova
+    
+    Calculado no banco (uma consulta agrupada) e com ETag que só muda quando uma nota
+    desta turma, as matrículas ou os alunos mudam.
+    """
+    try:
+        if current_user.is_aluno():
+            return jsonify({'error': 'Acesso negado'}), 403
+        if current_user.is_professor() and current_user.professor_id != professor_id:
+            return jsonify({'error': 'Acesso negado'}), 403
+        
+        from app.services.boletim_service import gerar_boletim
+        
+        boletim = gerar_boletim(professor_id, tipo_curso)
+        return jsonify({
+            'success': True,
+            'data': boletim
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ==================== CRUD ALUNOS ====================
 
 @api_bp.route('/alunos', methods=['POST'])
@@ -1740,6 +2291,7 @@ def api_excluir_nota(nota_id):
 @api_admin_required
 def api_criar_aluno():
     """Criar novo aluno"""
+    from app.services.ocupacao_service import reservar_vaga_matricula, TurmaLotada
     try:
         import traceback
         data = request.get_json()
@@ -1970,7 +2522,6 @@ def api_criar_aluno():
                         print(f"⚠️ Horário {horario_id} não encontrado no banco")
                 except Exception as e:
                     print(f"⚠️ Erro ao buscar horário {horario_id}: {e}")
-                    import traceback
                     print(traceback.format_exc())
             
             data_inicio = None
@@ -2008,6 +2559,8 @@ def api_criar_aluno():
                 continue
             
             try:
+                # Capacidade da turma (trava o horário até o commit; lotada -> 409)
+                reservar_vaga_matricula(professor_id, modalidade, dia_semana, horario_aula)
                 matricula = Matricula(
                     aluno_id=aluno.id,
                     professor_id=professor_id,
@@ -2019,6 +2572,8 @@ def api_criar_aluno():
                 )
                 db.session.add(matricula)
                 print(f"✅ Matrícula {idx + 1} adicionada: aluno_id={aluno.id}, professor_id={professor_id}, modalidade={modalidade}")
+            except TurmaLotada:
+                raise
             except Exception as e:
                 print(f"❌ Erro ao criar matrícula {idx + 1}: {str(e)}")
                 import traceback
@@ -2038,6 +2593,11 @@ def api_criar_aluno():
         })
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 201
+    except TurmaLotada as e:
+        db.session.rollback()
+        response = jsonify({'error': 'Turma lotada', 'message': str(e)})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 409
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
@@ -2053,8 +2613,9 @@ def api_criar_aluno():
 @api_admin_required
 def api_editar_aluno(aluno_id):
     """Editar aluno existente"""
+    from app.services.ocupacao_service import TurmaLotada
     try:
-        from app.routes import normalizar_texto
+        from app.routes import normalizar_texto, sincronizar_matriculas_aluno
         
         aluno = Aluno.query.get_or_404(aluno_id)
         data = request.get_json()
@@ -2092,9 +2653,6 @@ def api_editar_aluno(aluno_id):
         if 'matriculas' in data:
             matriculas = data.get('matriculas', [])
             
-            # Deletar matrículas antigas
-            Matricula.query.filter_by(aluno_id=aluno_id).delete()
-            
             # Determinar modalidades do aluno baseado nas novas matrículas
             modalidades_set = set()
             for mat in matriculas:
@@ -2111,26 +2669,43 @@ def api_editar_aluno(aluno_id):
             aluno.teatro_tv_cinema = 'teatro_tv_cinema' in modalidades_set
             aluno.musical = 'musical' in modalidades_set
             
-            # Criar novas matrículas
-            for matricula_data in matriculas:
+            # Validar os ids antes de consultar os horários
+            itens = []
+            for posicao, matricula_data in enumerate(matriculas, start=1):
                 professor_id = matricula_data.get('professor_id')
-                modalidade = matricula_data.get('modalidade', '').strip()
-                valor_mensalidade = matricula_data.get('valor_mensalidade')
-                horario_id = matricula_data.get('horario_id')
-                data_inicio_str = (matricula_data.get('data_inicio') or '').strip()
-                
+                modalidade = (matricula_data.get('modalidade') or '').strip()
                 if not professor_id or not modalidade:
                     continue
+                try:
+                    professor_id = int(professor_id)
+                except (TypeError, ValueError):
+                    return jsonify({'error': f'Matrícula {posicao}: professor_id inválido'}), 400
+                horario_id = matricula_data.get('horario_id')
+                try:
+                    horario_id = int(horario_id) if horario_id else None
+                except (TypeError, ValueError):
+                    return jsonify({'error': f'Matrícula {posicao}: horario_id inválido'}), 400
+                itens.append((matricula_data, professor_id, modalidade, horario_id))
+            
+            # Montar a lista desejada de matrículas
+            matriculas_validas = []
+            horarios_ids = [horario_id for _, _, _, horario_id in itens if horario_id]
+            horarios_por_id = {}
+            if horarios_ids:
+                from app.models.horario_professor import HorarioProfessor
+                horarios_por_id = {h.id: h for h in HorarioProfessor.query.filter(HorarioProfessor.id.in_(horarios_ids)).all()}
+            
+            for matricula_data, professor_id, modalidade, horario_id in itens:
+                valor_mensalidade = matricula_data.get('valor_mensalidade')
+                data_inicio_str = (matricula_data.get('data_inicio') or '').strip()
                 
                 # Buscar horário se fornecido
                 dia_semana = None
                 horario_aula = None
-                if horario_id:
-                    from app.models.horario_professor import HorarioProfessor
-                    horario = HorarioProfessor.query.get(horario_id)
-                    if horario:
-                        dia_semana = horario.dia_semana
-                        horario_aula = horario.horario_aula
+                horario = horarios_por_id.get(horario_id) if horario_id else None
+                if horario:
+                    dia_semana = horario.dia_semana
+                    horario_aula = horario.horario_aula
                 
                 data_inicio = None
                 if data_inicio_str:
@@ -2139,16 +2714,17 @@ def api_editar_aluno(aluno_id):
                     except ValueError:
                         pass
                 
-                matricula = Matricula(
-                    aluno_id=aluno_id,
-                    professor_id=professor_id,
-                    tipo_curso=modalidade,
-                    valor_mensalidade=float(valor_mensalidade) if valor_mensalidade else None,
-                    dia_semana=dia_semana,
-                    horario_aula=horario_aula,
-                    data_inicio=data_inicio
-                )
-                db.session.add(matricula)
+                matriculas_validas.append({
+                    'professor_id': professor_id,
+                    'tipo_curso': modalidade,
+                    'valor_mensalidade': float(valor_mensalidade) if valor_mensalidade else None,
+                    'dia_semana': dia_semana,
+                    'horario_aula': horario_aula,
+                    'data_inicio': data_inicio
+                })
+            
+            # Atualiza as alteradas, cria as novas e encerra as removidas (inalteradas não são escritas)
+            sincronizar_matriculas_aluno(aluno_id, matriculas_validas)
         
         db.session.commit()
         
@@ -2160,6 +2736,9 @@ def api_editar_aluno(aluno_id):
                 'nome': aluno.nome
             }
         })
+    except TurmaLotada as e:
+        db.session.rollback()
+        return jsonify({'error': 'Turma lotada', 'message': str(e)}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -2332,7 +2911,8 @@ def api_criar_professor():
                 modalidade=modalidade,
                 horario_aula=horario_aula,
                 idade_minima=horario_data.get('idade_minima') if horario_data.get('idade_minima') else None,
-                idade_maxima=horario_data.get('idade_maxima') if horario_data.get('idade_maxima') else None
+                idade_maxima=horario_data.get('idade_maxima') if horario_data.get('idade_maxima') else None,
+                capacidade=int(horario_data['capacidade']) if horario_data.get('capacidade') else None
             )
             db.session.add(horario)
         
@@ -2356,8 +2936,7 @@ def api_criar_professor():
 def api_editar_professor(professor_id):
     """Editar professor existente com horários vinculados"""
     try:
-        from app.models.horario_professor import HorarioProfessor
-        from app.routes import normalizar_texto
+        from app.routes import normalizar_texto, sincronizar_horarios_professor
         
         professor = Professor.query.get_or_404(professor_id)
         data = request.get_json()
@@ -2375,10 +2954,8 @@ def api_editar_professor(professor_id):
             if not horarios or len(horarios) == 0:
                 return jsonify({'error': 'Adicione pelo menos um horário de aula com modalidade'}), 400
             
-            # Deletar horários antigos
-            HorarioProfessor.query.filter_by(professor_id=professor.id).delete()
-            
-            # Criar novos horários
+            # Sincronizar horários por diferença (mantém ids e não reescreve horários inalterados)
+            horarios_validos = []
             for horario_data in horarios:
                 dia_semana = (horario_data.get('dia_semana') or '').strip()
                 modalidade = (horario_data.get('modalidade') or '').strip()
@@ -2388,18 +2965,18 @@ def api_editar_professor(professor_id):
                 if not dia_semana or not modalidade or not horario_inicio or not horario_termino:
                     continue
                 
-                # Formatar horário como "HH:MM às HH:MM"
-                horario_aula = f"{horario_inicio} às {horario_termino}"
-                
-                horario = HorarioProfessor(
-                    professor_id=professor.id,
-                    dia_semana=dia_semana,
-                    modalidade=modalidade,
-                    horario_aula=horario_aula,
-                    idade_minima=horario_data.get('idade_minima') if horario_data.get('idade_minima') else None,
-                    idade_maxima=horario_data.get('idade_maxima') if horario_data.get('idade_maxima') else None
-                )
-                db.session.add(horario)
+                horarios_validos.append({
+                    'dia_semana': dia_semana,
+                    'modalidade': modalidade,
+                    # Formatar horário como "HH:MM às HH:MM"
+                    'horario_aula': f"{horario_inicio} às {horario_termino}",
+                    'idade_minima': horario_data.get('idade_minima') if horario_data.get('idade_minima') else None,
+                    'idade_maxima': horario_data.get('idade_maxima') if horario_data.get('idade_maxima') else None
+                })
+                if 'capacidade' in horario_data:
+                    horarios_validos[-1]['capacidade'] = int(horario_data['capacidade']) if horario_data['capacidade'] else None
+            
+            sincronizar_horarios_professor(professor.id, horarios_validos)
             
             # Determinar modalidades do professor baseado nos horários cadastrados
             modalidades_professor = set([h.get('modalidade') for h in horarios if h.get('modalidade')])
@@ -2476,6 +3053,10 @@ def api_aprovar_pagamento(pagamento_id):
                 'status': pagamento.status
             }
         })
+    except IntegrityError:
+        # uq_pagamentos_comprovante_ativo: pagamento rejeitado cujo arquivo já foi reenviado
+        db.session.rollback()
+        return jsonify({'error': 'Já existe outro pagamento deste aluno no mesmo mês com este comprovante'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -2509,163 +3090,334 @@ def api_rejeitar_pagamento(pagamento_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/pagamentos/<int:pagamento_id>/reenviar', methods=['POST'])
+@api_login_required
+@api_admin_required
+def api_reenviar_pagamento(pagamento_id):
+    """Reenviar ao armazenamento o comprovante de um pagamento com falha no envio"""
+    try:
+        from app.services.upload_service import reenviar_comprovante, agendar_envio, UploadInvalido
+        
+        pagamento = Pagamento.query.get_or_404(pagamento_id)
+        try:
+            reenviar_comprovante(pagamento)
+        except UploadInvalido as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), e.status
+        db.session.commit()
+        agendar_envio(pagamento.id)
+        
+        return jsonify({
+            'success': True,
+            'message': 'Envio do comprovante reiniciado',
+            'data': {
+                'id': pagamento.id,
+                'status': pagamento.status
+            }
+        }), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+def _validar_dados_pagamento(campos):
+    """
+    Valida os dados de um pagamento com comprovante (upload e conclusão do envio direto)
+    
+    Retorna (dados, erros): dados tem os argumentos do Pagamento já convertidos; erros é a lista
+    de mensagens (inclui pagamento já aprovado no mesmo mês/ano).
+    """
+    aluno_id = str(campos.get('aluno_id') or '').strip()
+    mes_referencia = str(campos.get('mes_referencia') or '').strip()
+    ano_referencia = str(campos.get('ano_referencia') or '').strip()
+    valor_pago = str(campos.get('valor_pago') or '').strip()
+    data_pagamento_str = str(campos.get('data_pagamento') or '').strip()
+    observacoes = str(campos.get('observacoes') or '').strip()
+    
+    erros = []
+    
+    if not aluno_id:
+        erros.append('ID do aluno é obrigatório')
+    else:
+        try:
+            aluno_id_int = int(aluno_id)
+            aluno = Aluno.query.get(aluno_id_int)
+            if not aluno:
+                erros.append('Aluno não encontrado')
+        except ValueError:
+            erros.append('ID do aluno inválido')
+    
+    if not mes_referencia:
+        erros.append('Mês de referência é obrigatório')
+    else:
+        try:
+            mes = int(mes_referencia)
+            if mes < 1 or mes > 12:
+                erros.append('Mês deve estar entre 1 e 12')
+        except ValueError:
+            erros.append('Mês de referência inválido')
+    
+    if not ano_referencia:
+        erros.append('Ano de referência é obrigatório')
+    else:
+        try:
+            ano = int(ano_referencia)
+            if ano < 2020 or ano > 2100:
+                erros.append('Ano inválido')
+        except ValueError:
+            erros.append('Ano de referência inválido')
+    
+    if not valor_pago:
+        erros.append('Valor pago é obrigatório')
+    else:
+        try:
+            valor = float(valor_pago.replace(',', '.'))
+            if valor <= 0:
+                erros.append('Valor pago deve ser maior que zero')
+        except ValueError:
+            erros.append('Valor pago inválido')
+    
+    data_pagamento = None
+    if not data_pagamento_str:
+        erros.append('Data do pagamento é obrigatória')
+    else:
+        try:
+            data_pagamento = datetime.strptime(data_pagamento_str, '%Y-%m-%d').date()
+        except ValueError:
+            erros.append('Data do pagamento inválida')
+    
+    if erros:
+        return None, erros
+    
+    # Verificar se já existe pagamento aprovado para o mesmo mês/ano
+    pagamento_existente = Pagamento.query.filter_by(
+        aluno_id=aluno_id_int,
+        mes_referencia=mes,
+        ano_referencia=ano,
+        status='aprovado'
+    ).first()
+    
+    if pagamento_existente:
+        return None, [f'Já existe um pagamento aprovado para {mes_referencia}/{ano_referencia}']
+    
+    return {
+        'aluno_id': aluno_id_int,
+        'mes_referencia': mes,
+        'ano_referencia': ano,
+        'valor_pago': valor,
+        'data_pagamento': data_pagamento,
+        'observacoes': observacoes if observacoes else None
+    }, []
+
 @api_bp.route('/pagamentos/upload', methods=['POST', 'OPTIONS'])
 @api_login_required
 def api_upload_comprovante():
-    """Upload de comprovante de pagamento"""
+    """
+    Upload de comprovante de pagamento
+    
+    O corpo é lido em blocos: o tipo do arquivo é conferido pelos primeiros bytes e o tamanho
+    durante a leitura (recusa com 400/413 sem receber o resto). O arquivo é gravado no spool
+    local e enviado ao armazenamento em segundo plano: responde 202 com o pagamento em status
+    'enviando' (vira 'pendente' quando o envio termina).
+    """
+    caminho_spool = None
     try:
-        import cloudinary
-        import cloudinary.uploader
-        
-        # Validar credenciais do Cloudinary
-        cloud_name = current_app.config.get('CLOUDINARY_CLOUD_NAME')
-        api_key = current_app.config.get('CLOUDINARY_API_KEY')
-        api_secret = current_app.config.get('CLOUDINARY_API_SECRET')
+        from app.services.armazenamento_service import verificar_configuracao
+        from app.services.upload_service import (
+            ler_upload_multipart, receber_comprovante, agendar_envio, descartar_spool, UploadInvalido
+        )
         
-        if not api_key or not api_secret:
-            response = jsonify({'error': 'Credenciais do Cloudinary não configuradas'})
+        # Validar configuração do armazenamento
+        erro_configuracao = verificar_configuracao()
+        if erro_configuracao:
+            response = jsonify({'error': erro_configuracao})
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 500
         
-        # Obter dados do formulário
-        aluno_id = request.form.get('aluno_id')
-        mes_referencia = request.form.get('mes_referencia', '').strip()
-        ano_referencia = request.form.get('ano_referencia', '').strip()
-        valor_pago = request.form.get('valor_pago', '').strip()
-        data_pagamento_str = request.form.get('data_pagamento', '').strip()
-        observacoes = request.form.get('observacoes', '').strip()
+        # Ler o formulário em blocos (o arquivo vai direto para o spool)
+        try:
+            campos, recebido = ler_upload_multipart(request)
+        except UploadInvalido as e:
+            response = jsonify({'error': str(e)})
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response, e.status
+        caminho_spool = recebido.caminho if recebido else None
         
         # Validações
-        erros = []
+        dados, erros = _validar_dados_pagamento(campos)
         
-        if not aluno_id:
-            erros.append('ID do aluno é obrigatório')
-        else:
-            try:
-                aluno_id_int = int(aluno_id)
-                aluno = Aluno.query.get(aluno_id_int)
-                if not aluno:
-                    erros.append('Aluno não encontrado')
-            except ValueError:
-                erros.append('ID do aluno inválido')
+        # Arquivo (formato e tamanho já conferidos durante a leitura)
+        if recebido is None:
+            erros.append('Comprovante é obrigatório')
         
-        if not mes_referencia:
-            erros.append('Mês de referência é obrigatório')
-        else:
-            try:
-                mes = int(mes_referencia)
-                if mes < 1 or mes > 12:
-                    erros.append('Mês deve estar entre 1 e 12')
-            except ValueError:
-                erros.append('Mês de referência inválido')
+        if erros:
+            response = jsonify({'error': '; '.join(erros)})
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response, 400
         
-        if not ano_referencia:
-            erros.append('Ano de referência é obrigatório')
-        else:
-            try:
-                ano = int(ano_referencia)
-                if ano < 2020 or ano > 2100:
-                    erros.append('Ano inválido')
-            except ValueError:
-                erros.append('Ano de referência inválido')
+        # Criar registro de pagamento e gravar o arquivo no spool (envio em segundo plano)
+        novo_pagamento = Pagamento(**dados)
+        pagamento, caminho_spool = receber_comprovante(novo_pagamento, recebido)
+        if pagamento is not novo_pagamento:
+            # Mesmo arquivo já enviado para o aluno neste mês: devolve o pagamento existente
+            response = jsonify({
+                'success': True,
+                'message': 'Este comprovante já foi enviado para este mês.',
+                'duplicado': True,
+                'data': {
+                    'id': pagamento.id,
+                    'aluno_id': pagamento.aluno_id,
+                    'status': pagamento.status
+                }
+            })
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response, 200
         
-        if not valor_pago:
-            erros.append('Valor pago é obrigatório')
+        db.session.commit()
+        if caminho_spool:
+            caminho_spool = None  # pagamento gravado: o arquivo fica no spool até o envio
+            agendar_envio(pagamento.id)
+            mensagem = 'Comprovante recebido! O envio está em andamento; depois ficará aguardando aprovação.'
+            status_http = 202
         else:
-            try:
-                valor = float(valor_pago.replace(',', '.'))
-                if valor <= 0:
-                    erros.append('Valor pago deve ser maior que zero')
-            except ValueError:
-                erros.append('Valor pago inválido')
+            # Arquivo de um pagamento rejeitado reaproveitado: nada a enviar
+            mensagem = 'Comprovante enviado com sucesso! Aguardando aprovação.'
+            status_http = 201
         
-        data_pagamento = None
-        if not data_pagamento_str:
-            erros.append('Data do pagamento é obrigatória')
-        else:
-            try:
-                data_pagamento = datetime.strptime(data_pagamento_str, '%Y-%m-%d').date()
-            except ValueError:
-                erros.append('Data do pagamento inválida')
+        response = jsonify({
+            'success': True,
+            'message': mensagem,
+            'duplicado': False,
+            'data': {
+                'id': pagamento.id,
+                'aluno_id': pagamento.aluno_id,
+                'status': pagamento.status
+            }
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, status_http
         
-        # Validar arquivo
-        if 'comprovante' not in request.files:
-            erros.append('Comprovante é obrigatório')
-        else:
-            arquivo = request.files['comprovante']
-            if arquivo.filename == '':
-                erros.append('Comprovante é obrigatório')
-            else:
-                # Validar extensão
-                extensoes_permitidas = {'.png', '.jpg', '.jpeg', '.gif', '.pdf', '.webp'}
-                nome_arquivo = secure_filename(arquivo.filename)
-                _, ext = os.path.splitext(nome_arquivo.lower())
-                
-                if ext not in extensoes_permitidas:
-                    erros.append(f'Formato não permitido. Use: {", ".join(extensoes_permitidas)}')
-                
-                # Validar tamanho (10MB)
-                arquivo.seek(0, os.SEEK_END)
-                tamanho = arquivo.tell()
-                arquivo.seek(0)
-                if tamanho > 10 * 1024 * 1024:  # 10MB
-                    erros.append('Arquivo muito grande. Máximo: 10MB')
+    except Exception as e:
+        db.session.rollback()
+        import traceback
+        print(f"❌ Erro ao processar upload: {traceback.format_exc()}")
+        response = jsonify({'error': f'Erro ao processar upload: {str(e)}'})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 500
+    finally:
+        # Arquivo recebido que não virou envio (validação, duplicado, erro)
+        if caminho_spool:
+            descartar_spool(caminho_spool)
+
+@api_bp.route('/pagamentos/upload/config', methods=['GET'])
+@api_login_required
+def api_config_upload_comprovante():
+    """Como o cliente deve enviar comprovantes: envio_direto indica se /pagamentos/upload/assinatura está disponível"""
+    try:
+        from app.services.upload_service import envio_direto_habilitado
         
-        if erros:
-            response = jsonify({'error': '; '.join(erros)})
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 400
+        response = jsonify({
+            'success': True,
+            'data': {
+                'envio_direto': envio_direto_habilitado(),
+                'tamanho_maximo': current_app.config.get('UPLOAD_TAMANHO_MAXIMO')
+            }
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except Exception as e:
+        response = jsonify({'error': str(e)})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 500
+
+@api_bp.route('/pagamentos/upload/assinatura', methods=['POST', 'OPTIONS'])
+@api_login_required
+def api_assinar_upload_comprovante():
+    """
+    Destino assinado para enviar o comprovante direto ao armazenamento (sem passar pelo servidor)
+    
+    Corpo JSON: aluno_id e extensao (ou nome_arquivo). Resposta: url e campos do formulário
+    (POST multipart com o arquivo no campo 'file', válido por UPLOAD_DIRETO_EXPIRACAO segundos)
+    e o token para /pagamentos/upload/concluir. Só com UPLOAD_DIRETO ligado e armazenamento
+    's3' ou 'cloudinary' (501 nos demais casos: usar /pagamentos/upload).
+    """
+    try:
+        from app.services.armazenamento_service import verificar_configuracao
+        from app.services.upload_service import preparar_envio_direto, UploadInvalido
         
-        # Verificar se já existe pagamento aprovado para o mesmo mês/ano
-        pagamento_existente = Pagamento.query.filter_by(
-            aluno_id=aluno_id_int,
-            mes_referencia=int(mes_referencia),
-            ano_referencia=int(ano_referencia),
-            status='aprovado'
-        ).first()
+        erro_configuracao = verificar_configuracao()
+        if erro_configuracao:
+            response = jsonify({'error': erro_configuracao})
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response, 500
         
-        if pagamento_existente:
-            response = jsonify({'error': f'Já existe um pagamento aprovado para {mes_referencia}/{ano_referencia}'})
+        dados = request.get_json(silent=True) or {}
+        try:
+            aluno_id = int(dados.get('aluno_id'))
+        except (TypeError, ValueError):
+            response = jsonify({'error': 'ID do aluno inválido'})
             response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
+        if not Aluno.query.get(aluno_id):
+            response = jsonify({'error': 'Aluno não encontrado'})
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response, 404
         
-        # Fazer upload para Cloudinary
+        extensao = dados.get('extensao') or os.path.splitext(dados.get('nome_arquivo') or '')[1]
         try:
-            arquivo.seek(0)  # Garantir que está no início
-            resultado = cloudinary.uploader.upload(
-                arquivo,
-                folder=f'comprovantes/{aluno_id_int}',
-                resource_type='auto',
-                allowed_formats=['png', 'jpg', 'jpeg', 'gif', 'pdf', 'webp']
-            )
-            
-            url_comprovante = resultado.get('secure_url')
-            public_id = resultado.get('public_id')
-            
-        except Exception as e:
-            response = jsonify({'error': f'Erro ao fazer upload: {str(e)}'})
+            envio = preparar_envio_direto(aluno_id, extensao)
+        except UploadInvalido as e:
+            response = jsonify({'error': str(e)})
             response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 500
+            return response, e.status
         
-        # Criar registro de pagamento
-        pagamento = Pagamento(
-            aluno_id=aluno_id_int,
-            mes_referencia=int(mes_referencia),
-            ano_referencia=int(ano_referencia),
-            valor_pago=float(valor_pago.replace(',', '.')),
-            data_pagamento=data_pagamento,
-            url_comprovante=url_comprovante,
-            public_id=public_id,
-            observacoes=observacoes if observacoes else None,
-            status='pendente'
-        )
+        response = jsonify({'success': True, 'data': envio})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except Exception as e:
+        response = jsonify({'error': str(e)})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 500
+
+@api_bp.route('/pagamentos/upload/concluir', methods=['POST', 'OPTIONS'])
+@api_login_required
+def api_concluir_upload_comprovante():
+    """
+    Conclui um envio direto: confere o objeto no armazenamento e cria o pagamento
+    
+    Corpo JSON: token (de /pagamentos/upload/assinatura) e os campos do pagamento (aluno_id,
+    mes_referencia, ano_referencia, valor_pago, data_pagamento, observacoes). Responde 201 com
+    o pagamento 'pendente', ou 200 se o mesmo envio já foi concluído.
+    """
+    try:
+        from app.services.upload_service import concluir_envio_direto, UploadInvalido
+        
+        campos = request.get_json(silent=True) or {}
+        dados, erros = _validar_dados_pagamento(campos)
+        if not campos.get('token'):
+            erros.append('Token de envio é obrigatório')
+        
+        if erros:
+            response = jsonify({'error': '; '.join(erros)})
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response, 400
         
-        db.session.add(pagamento)
+        try:
+            pagamento, criado = concluir_envio_direto(Pagamento(**dados), campos['token'])
+        except UploadInvalido as e:
+            db.session.rollback()
+            response = jsonify({'error': str(e)})
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response, e.status
         db.session.commit()
+        if criado:
+            from app.services.upload_service import agendar_miniatura
+            agendar_miniatura(pagamento.id)
         
         response = jsonify({
             'success': True,
-            'message': 'Comprovante enviado com sucesso! Aguardando aprovação.',
+            'message': 'Comprovante enviado com sucesso! Aguardando aprovação.' if criado
+                       else 'Este envio já foi concluído.',
+            'duplicado': not criado,
             'data': {
                 'id': pagamento.id,
                 'aluno_id': pagamento.aluno_id,
@@ -2673,28 +3425,63 @@ def api_upload_comprovante():
             }
         })
         response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 201
-        
+        return response, 201 if criado else 200
     except Exception as e:
         db.session.rollback()
-        import traceback
-        print(f"❌ Erro ao processar upload: {traceback.format_exc()}")
-        response = jsonify({'error': f'Erro ao processar upload: {str(e)}'})
+        response = jsonify({'error': str(e)})
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
+@api_bp.route('/pagamentos/<int:pagamento_id>/preview', methods=['GET'])
+def api_preview_comprovante(pagamento_id):
+    """
+    Miniatura do comprovante (imagem pequena para as listagens)
+    
+    Como as URLs do armazenamento, não exige login: a URL vem de url_preview (campo url_preview
+    das listagens) e leva uma assinatura do pagamento e da miniatura. Servida do cache em disco,
+    com cache longo no navegador (a URL muda quando a miniatura muda).
+    """
+    try:
+        from flask import send_file
+        from app.services.armazenamento_service import ObjetoNaoEncontrado
+        from app.services.preview_service import assinatura_valida, arquivo_preview, CACHE_PREVIEW_SEGUNDOS
+        
+        pagamento = db.session.get(Pagamento, pagamento_id)
+        if pagamento is None or not assinatura_valida(pagamento, request.args.get('v', '')):
+            return jsonify({'error': 'Pré-visualização não encontrada'}), 404
+        try:
+            caminho, mimetype = arquivo_preview(current_app.config, pagamento)
+        except ObjetoNaoEncontrado:
+            return jsonify({'error': 'Pré-visualização não encontrada'}), 404
+        
+        response = send_file(caminho, mimetype=mimetype, conditional=True, max_age=CACHE_PREVIEW_SEGUNDOS)
+        response.headers['Cache-Control'] = f'private, max-age={CACHE_PREVIEW_SEGUNDOS}, immutable'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ==================== MATRÍCULAS ====================
 
 @api_bp.route('/matriculas', methods=['GET'])
 @api_login_required
+@api_etag('matriculas', 'alunos', 'professores')
 def api_listar_matriculas():
-    """Lista matrículas (filtros opcionais)"""
+    """
+    Lista matrículas (filtros opcionais), da mais recente para a mais antiga
+    
+    Paginada por cursor: ?limite= (padrão 100, máx. 500) e ?cursor= (next_cursor da página anterior).
+    """
     try:
         aluno_id = request.args.get('aluno_id', type=int)
         professor_id = request.args.get('professor_id', type=int)
         tipo_curso = request.args.get('tipo_curso', '').strip()
         
-        query = Matricula.query
+        # Aluno e professor carregados no mesmo SELECT (evita 2 consultas por matrícula)
+        query = Matricula.query.options(
+            joinedload(Matricula.aluno).load_only(Aluno.id, Aluno.nome),
+            joinedload(Matricula.professor).load_only(Professor.id, Professor.nome)
+        )
         
         if aluno_id:
             query = query.filter_by(aluno_id=aluno_id)
@@ -2705,7 +3492,12 @@ def api_listar_matriculas():
         if tipo_curso:
             query = query.filter_by(tipo_curso=tipo_curso)
         
-        matriculas = query.order_by(Matricula.data_matricula.desc()).all()
+        # data_matricula é sempre o momento da inserção, então a ordem por id é a mesma
+        # (e evita comparar o timestamp gravado pelo banco com o valor do cursor)
+        try:
+            matriculas, proximo_cursor = paginar_por_cursor(query, Matricula.id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         resultado = []
         for mat in matriculas:
@@ -2727,7 +3519,8 @@ def api_listar_matriculas():
         return jsonify({
             'success': True,
             'count': len(resultado),
-            'data': resultado
+            'data': resultado,
+            'next_cursor': proximo_cursor
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -2748,14 +3541,33 @@ def api_criar_matricula():
         if not all([aluno_id, professor_id, tipo_curso]):
             return jsonify({'error': 'Aluno, professor e tipo de curso são obrigatórios'}), 400
         
+        from app.models.horario_professor import HorarioProfessor
+        from app.services.ocupacao_service import reservar_vaga_matricula, TurmaLotada
+        
+        dia_semana = (data.get('dia_semana') or '').strip() or None
+        horario_aula = (data.get('horario_aula') or '').strip() or None
+        # Também aceita o id do horário do professor
+        if data.get('horario_id'):
+            horario = HorarioProfessor.query.get(int(data['horario_id']))
+            if not horario or horario.professor_id != int(professor_id):
+                return jsonify({'error': 'Horário não encontrado para este professor'}), 400
+            dia_semana, horario_aula = horario.dia_semana, horario.horario_aula
+        
+        # Verificar capacidade da turma (trava o horário até o commit)
+        try:
+            reservar_vaga_matricula(professor_id, tipo_curso, dia_semana, horario_aula)
+        except TurmaLotada as e:
+            db.session.rollback()
+            return jsonify({'error': 'Turma lotada', 'message': str(e)}), 409
+        
         matricula = Matricula(
             aluno_id=aluno_id,
             professor_id=professor_id,
             tipo_curso=tipo_curso,
             valor_mensalidade=valor_mensalidade,
             data_inicio=datetime.strptime(data['data_inicio'], '%Y-%m-%d').date() if data.get('data_inicio') else None,
-            dia_semana=(data.get('dia_semana') or '').strip() or None,
-            horario_aula=(data.get('horario_aula') or '').strip() or None
+            dia_semana=dia_semana,
+            horario_aula=horario_aula
         )
         
         db.session.add(matricula)
@@ -2825,3 +3637,205 @@ def api_excluir_matricula(matricula_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+
+# ==================== EXPORTAÇÃO ====================
+
+def _query_exportacao_alunos():
+    """Query de exportação de alunos (mesmos filtros e escopo de /alunos)"""
+    ativo = request.args.get('ativo', 'true').lower() == 'true'
+    aprovado = request.args.get('aprovado')
+    search = request.args.get('search', '').strip()
+    professor_id = request.args.get('professor_id', type=int)
+    
+    total_mensalidades = db.session.query(
+        db.func.coalesce(db.func.sum(Matricula.valor_mensalidade), 0)
+    ).filter(Matricula.aluno_id == Aluno.id).correlate(Aluno).scalar_subquery()
+    
+    query = db.session.query(
+        Aluno.id, Aluno.nome, Aluno.telefone, Aluno.nome_responsavel, Aluno.telefone_responsavel,
+        Aluno.cidade, Aluno.estado, Aluno.data_nascimento, Aluno.data_vencimento,
+        Aluno.forma_pagamento, total_mensalidades, Aluno.ativo, Aluno.aprovado,
+        Aluno.experimental, Aluno.data_cadastro
+    )
+    
+    # FILTRAGEM AUTOMÁTICA POR ROLE (subquery em vez de join+distinct para manter o streaming)
+    if current_user.is_professor() and current_user.professor_id:
+        query = query.filter(Aluno.id.in_(
+            db.session.query(Matricula.aluno_id).filter(Matricula.professor_id == current_user.professor_id)
+        ))
+    elif current_user.is_aluno() and current_user.aluno_id:
+        query = query.filter(Aluno.id == current_user.aluno_id)
+    
+    if ativo:
+        query = query.filter(Aluno.ativo == True)
+    if aprovado is not None:
+        query = query.filter(Aluno.aprovado == (aprovado.lower() == 'true'))
+    if professor_id and not current_user.is_professor():
+        query = query.filter(Aluno.id.in_(
+            db.session.query(Matricula.aluno_id).filter(Matricula.professor_id == professor_id)
+        ))
+    if search:
+        query = query.filter(
+            db.or_(
+                Aluno.nome.ilike(f'%{search}%'),
+                Aluno.telefone.ilike(f'%{search}%')
+            )
+        )
+    
+    colunas = ['ID', 'Nome', 'Telefone', 'Responsável', 'Telefone Responsável', 'Cidade', 'Estado',
+               'Data Nascimento', 'Data Vencimento', 'Forma Pagamento', 'Total Mensalidades',
+               'Ativo', 'Aprovado', 'Experimental', 'Data Cadastro']
+    return colunas, query.order_by(Aluno.nome)
+
+def _query_exportacao_pagamentos():
+    """Query de exportação de pagamentos (mesmo escopo de /pagamentos)"""
+    status = request.args.get('status', '').strip()
+    aluno_id = request.args.get('aluno_id', type=int)
+    professor_id = request.args.get('professor_id', type=int)
+    mes = request.args.get('mes', type=int)
+    ano = request.args.get('ano', type=int)
+    
+    query = db.session.query(
+        Pagamento.id, Pagamento.aluno_id, Aluno.nome, Pagamento.mes_referencia, Pagamento.ano_referencia,
+        Pagamento.valor_pago, Pagamento.data_pagamento, Pagamento.status, Pagamento.observacoes,
+        Pagamento.observacoes_admin, Pagamento.data_cadastro, Pagamento.data_aprovacao
+    ).outerjoin(Aluno, Pagamento.aluno_id == Aluno.id)
+    
+    # FILTRAGEM AUTOMÁTICA POR ROLE
+    if current_user.is_professor() and current_user.professor_id:
+        query = query.filter(Pagamento.aluno_id.in_(
+            db.session.query(Matricula.aluno_id).filter(Matricula.professor_id == current_user.professor_id)
+        ))
+    elif current_user.is_aluno() and current_user.aluno_id:
+        query = query.filter(Pagamento.aluno_id == current_user.aluno_id)
+    
+    if aluno_id:
+        query = query.filter(Pagamento.aluno_id == aluno_id)
+    if professor_id and not current_user.is_professor():
+        query = query.filter(Pagamento.aluno_id.in_(
+            db.session.query(Matricula.aluno_id).filter(Matricula.professor_id == professor_id)
+        ))
+    if status:
+        # Aceita tanto o status do banco quanto o do frontend ('pago' = aprovado)
+        query = query.filter(Pagamento.status == ('aprovado' if status == 'pago' else status))
+    if mes:
+        query = query.filter(Pagamento.mes_referencia == mes)
+    if ano:
+        query = query.filter(Pagamento.ano_referencia == ano)
+    
+    colunas = ['ID', 'Aluno ID', 'Aluno', 'Mês', 'Ano', 'Valor Pago', 'Data Pagamento', 'Status',
+               'Observações', 'Observações Admin', 'Data Cadastro', 'Data Aprovação']
+    return colunas, query.order_by(Pagamento.ano_referencia.desc(), Pagamento.mes_referencia.desc(), Pagamento.id.desc())
+
+def _query_exportacao_notas():
+    """Query de exportação de notas (mesmo escopo de /notas)"""
+    aluno_id = request.args.get('aluno_id', type=int)
+    professor_id = request.args.get('professor_id', type=int)
+    tipo_curso = request.args.get('tipo_curso', '').strip()
+    
+    query = db.session.query(
+        Nota.id, Nota.aluno_id, Aluno.nome, Nota.professor_id, Professor.nome, Nota.tipo_curso,
+        Nota.numero_prova, Nota.tipo_avaliacao, Nota.criterio1, Nota.criterio2, Nota.criterio3,
+        Nota.criterio4, Nota.valor, Nota.observacao, Nota.data_avaliacao
+    ).outerjoin(Aluno, Nota.aluno_id == Aluno.id).outerjoin(Professor, Nota.professor_id == Professor.id)
+    
+    if aluno_id:
+        query = query.filter(Nota.aluno_id == aluno_id)
+    if professor_id:
+        query = query.filter(Nota.professor_id == professor_id)
+    if tipo_curso:
+        query = query.filter(Nota.tipo_curso == tipo_curso)
+    
+    # FILTRAGEM AUTOMÁTICA POR ROLE
+    if current_user.is_professor():
+        query = query.filter(Nota.professor_id == (current_user.professor_id or 0))
+    elif current_user.is_aluno() and current_user.aluno_id:
+        query = query.filter(Nota.aluno_id == current_user.aluno_id)
+    
+    colunas = ['ID', 'Aluno ID', 'Aluno', 'Professor ID', 'Professor', 'Modalidade', 'Prova',
+               'Tipo Avaliação', 'Critério 1', 'Critério 2', 'Critério 3', 'Critério 4', 'Nota',
+               'Observação', 'Data Avaliação']
+    return colunas, query.order_by(Nota.data_avaliacao.desc(), Nota.id.desc())
+
+def _query_exportacao_matriculas():
+    """Query de exportação de matrículas"""
+    aluno_id = request.args.get('aluno_id', type=int)
+    professor_id = request.args.get('professor_id', type=int)
+    tipo_curso = request.args.get('tipo_curso', '').strip()
+    
+    query = db.session.query(
+        Matricula.id, Matricula.aluno_id, Aluno.nome, Matricula.professor_id, Professor.nome,
+        Matricula.tipo_curso, Matricula.valor_mensalidade, Matricula.dia_semana, Matricula.horario_aula,
+        Matricula.data_inicio, Matricula.data_encerramento, Matricula.data_matricula
+    ).outerjoin(Aluno, Matricula.aluno_id == Aluno.id).outerjoin(Professor, Matricula.professor_id == Professor.id)
+    
+    if aluno_id:
+        query = query.filter(Matricula.aluno_id == aluno_id)
+    if professor_id:
+        query = query.filter(Matricula.professor_id == professor_id)
+    if tipo_curso:
+        query = query.filter(Matricula.tipo_curso == tipo_curso)
+    
+    # FILTRAGEM AUTOMÁTICA POR ROLE (professor e aluno só exportam as próprias matrículas)
+    if current_user.is_professor():
+        query = query.filter(Matricula.professor_id == (current_user.professor_id or 0))
+    elif current_user.is_aluno() and current_user.aluno_id:
+        query = query.filter(Matricula.aluno_id == current_user.aluno_id)
+    
+    colunas = ['ID', 'Aluno ID', 'Aluno', 'Professor ID', 'Professor', 'Modalidade', 'Mensalidade',
+               'Dia da Semana', 'Horário', 'Data Início', 'Data Encerramento', 'Data Matrícula']
+    return colunas, query.order_by(Matricula.data_matricula.desc(), Matricula.id.desc())
+
+EXPORTACOES = {
+    'alunos': _query_exportacao_alunos,
+    'pagamentos': _query_exportacao_pagamentos,
+    'notas': _query_exportacao_notas,
+    'matriculas': _query_exportacao_matriculas
+}
+
+@api_bp.route('/export/<string:recurso>', methods=['GET'])
+@api_login_required
+def api_exportar(recurso):
+    """
+    Exporta alunos, pagamentos, notas ou matrículas em CSV ou XLSX (?formato=csv|xlsx)
+    
+    As linhas são lidas com yield_per (cursor do lado do servidor no PostgreSQL) e
+    escritas por um gerador, então a memória não cresce com o tamanho da tabela.
+    A consulta é executada antes da resposta (erro de SQL -> 500); um erro depois que o
+    streaming começou é registrado no log e interrompe o download, que fica incompleto.
+    """
+    from flask import Response, stream_with_context
+    from app.services.exportacao_service import (
+        FORMATOS_EXPORTACAO, gerar_csv, gerar_xlsx, iniciar_consulta, registrar_erros
+    )
+    
+    try:
+        if recurso not in EXPORTACOES:
+            return jsonify({'error': f'Recurso inválido. Use: {", ".join(EXPORTACOES)}'}), 400
+        
+        formato = request.args.get('formato', 'csv').lower()
+        if formato not in FORMATOS_EXPORTACAO:
+            return jsonify({'error': 'Formato inválido. Use csv ou xlsx'}), 400
+        
+        colunas, query = EXPORTACOES[recurso]()
+        linhas = iniciar_consulta(query)
+        
+        if formato == 'xlsx':
+            gerador = gerar_xlsx(colunas, linhas, nome_planilha=recurso.capitalize())
+        else:
+            gerador = gerar_csv(colunas, linhas)
+        
+        nome_arquivo = f'{recurso}_{date.today().isoformat()}.{formato}'
+        response = Response(
+            stream_with_context(registrar_erros(gerador, nome_arquivo)),
+            mimetype=FORMATOS_EXPORTACAO[formato]
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except Exception as e:
+        db.session.rollback()
+        import traceback
+        print(f"❌ Erro ao exportar {recurso}: {e}")
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
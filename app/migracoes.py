@@ -0,0 +1,230 @@
+"""
+Migrações automáticas executadas na inicialização (create_app)
+
+db.create_all() cria tabelas novas, mas não altera tabelas existentes. Aqui ficam apenas
+as alterações idempotentes e baratas que o ORM precisa para funcionar (colunas novas e
+índices declarados nos modelos, a verificação de duplicatas que impediriam um índice único e o
+preenchimento de colunas calculadas que o código lê sem fallback). Backfills caros ficam nos
+scripts migrate_*.py da raiz.
+"""
+from sqlalchemy import inspect, text
+from app.models.professor import db
+
+# Colunas adicionadas depois da criação das tabelas: {tabela: [(coluna, tipo SQL), ...]}
+COLUNAS_ADICIONAIS = {
+    'horarios_professor': [
+        ('dia_semana_num', 'INTEGER'),
+        ('inicio_min', 'INTEGER'),
+        ('fim_min', 'INTEGER'),
+        ('capacidade', 'INTEGER'),
+    ],
+    'notas': [
+        ('media', 'FLOAT'),
+    ],
+    'pagamentos': [
+        ('hash_comprovante', 'VARCHAR(64)'),
+        ('miniatura_id', 'VARCHAR(200)'),
+    ],
+    'matriculas': [
+        ('dia_semana_num', 'INTEGER'),
+        ('inicio_min', 'INTEGER'),
+        ('fim_min', 'INTEGER'),
+    ],
+}
+
+
+class MigracaoBloqueada(RuntimeError):
+    """Migração que não pode ser aplicada e impede a aplicação de subir"""
+
+
+def adicionar_colunas_faltantes():
+    """Adiciona em tabelas existentes as colunas de COLUNAS_ADICIONAIS que ainda não existem"""
+    inspector = inspect(db.engine)
+    tabelas = inspector.get_table_names()
+
+    for tabela, colunas in COLUNAS_ADICIONAIS.items():
+        if tabela not in tabelas:
+            continue  # db.create_all() cria a tabela já com as colunas
+
+        existentes = {col['name'] for col in inspector.get_columns(tabela)}
+        for coluna, tipo in colunas:
+            if coluna in existentes:
+                continue
+            try:
+                db.session.execute(text(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}'))
+                db.session.commit()
+                print(f"✅ Migração: coluna '{coluna}' adicionada em '{tabela}'")
+            except Exception as e:
+                db.session.rollback()
+                error_str = str(e).lower()
+                if 'already exists' not in error_str and 'duplicate column' not in error_str:
+                    raise
+
+
+def buscar_notas_duplicadas():
+    """
+    Procura notas duplicadas (mesmo aluno, professor, curso e número da prova), que impedem a
+    criação do índice único uq_notas_aluno_professor_curso_prova. Só consulta a tabela enquanto
+    o índice ainda não existe.
+
+    Returns:
+        Lista de grupos {'aluno_id', 'professor_id', 'tipo_curso', 'numero_prova', 'ids'},
+        com os ids em ordem crescente
+    """
+    inspector = inspect(db.engine)
+    if 'notas' not in inspector.get_table_names():
+        return []
+    if any(indice['name'] == 'uq_notas_aluno_professor_curso_prova' for indice in inspector.get_indexes('notas')):
+        return []
+
+    linhas = db.session.execute(text("""
+        SELECT n.id, n.aluno_id, n.professor_id, n.tipo_curso, n.numero_prova
+        FROM notas n
+        JOIN (
+            SELECT aluno_id, professor_id, tipo_curso, numero_prova
+            FROM notas
+            WHERE numero_prova IS NOT NULL
+            GROUP BY aluno_id, professor_id, tipo_curso, numero_prova
+            HAVING COUNT(*) > 1
+        ) d ON n.aluno_id = d.aluno_id
+           AND n.professor_id = d.professor_id
+           AND n.tipo_curso = d.tipo_curso
+           AND n.numero_prova = d.numero_prova
+        ORDER BY n.aluno_id, n.professor_id, n.tipo_curso, n.numero_prova, n.id
+    """)).all()
+    db.session.rollback()
+
+    grupos = {}
+    for id_nota, aluno_id, professor_id, tipo_curso, numero_prova in linhas:
+        chave = (aluno_id, professor_id, tipo_curso, numero_prova)
+        grupo = grupos.setdefault(chave, {
+            'aluno_id': aluno_id, 'professor_id': professor_id,
+            'tipo_curso': tipo_curso, 'numero_prova': numero_prova, 'ids': []
+        })
+        grupo['ids'].append(id_nota)
+    return list(grupos.values())
+
+
+def verificar_notas_duplicadas():
+    """
+    Impede a inicialização enquanto houver notas duplicadas. Nada é apagado aqui: as notas
+    repetidas podem ser lançamentos reais e precisam ser revisadas e removidas pelo script
+    migrate_notas_unicas.py, que exporta as linhas antes de apagar.
+
+    Raises:
+        MigracaoBloqueada: com os ids de cada grupo duplicado
+    """
+    grupos = buscar_notas_duplicadas()
+    if not grupos:
+        return
+    detalhes = '; '.join(
+        f"aluno {g['aluno_id']}, professor {g['professor_id']}, {g['tipo_curso']}, "
+        f"prova {g['numero_prova']}: ids {g['ids']}"
+        for g in grupos
+    )
+    raise MigracaoBloqueada(
+        f"{len(grupos)} grupo(s) de notas duplicadas impedem o índice único "
+        f"uq_notas_aluno_professor_curso_prova ({detalhes}). "
+        f"Revise e rode migrate_notas_unicas.py antes de subir a aplicação."
+    )
+
+
+def liberar_comprovantes_duplicados():
+    """
+    Tira o hash_comprovante dos pagamentos ativos repetidos (mesmo aluno, mês e arquivo), mantendo
+    o mais antigo de cada grupo, para que o índice único uq_pagamentos_comprovante_ativo possa ser
+    criado. Os pagamentos continuam; só deixam de participar da deduplicação. Só consulta a
+    tabela enquanto o índice ainda não existe.
+
+    Returns:
+        Lista dos ids alterados
+    """
+    inspector = inspect(db.engine)
+    if 'pagamentos' not in inspector.get_table_names():
+        return []
+    if any(indice['name'] == 'uq_pagamentos_comprovante_ativo' for indice in inspector.get_indexes('pagamentos')):
+        return []
+
+    repetidos = db.session.execute(text("""
+        SELECT id FROM pagamentos
+        WHERE hash_comprovante IS NOT NULL
+          AND status NOT IN ('rejeitado', 'falha_envio')
+          AND id NOT IN (
+              SELECT MIN(id) FROM pagamentos
+              WHERE hash_comprovante IS NOT NULL
+                AND status NOT IN ('rejeitado', 'falha_envio')
+              GROUP BY aluno_id, ano_referencia, mes_referencia, hash_comprovante
+          )
+    """)).scalars().all()
+    if repetidos:
+        db.session.execute(text("UPDATE pagamentos SET hash_comprovante = NULL WHERE id IN :ids").bindparams(
+            db.bindparam('ids', expanding=True)
+        ), {'ids': repetidos})
+        db.session.commit()
+        print(f"⚠️  Migração: {len(repetidos)} pagamento(s) com comprovante repetido fora da deduplicação (ids: {repetidos})")
+    return repetidos
+
+
+def preencher_medias_notas():
+    """
+    Grava a média dos critérios nas notas sem média (anteriores à coluna notas.media)
+
+    Um único UPDATE no banco; depois do primeiro preenchimento não encontra mais linhas, porque
+    toda escrita pelo ORM ou pelo upsert já grava a média. Invalida as versões (ETags) das
+    notas e dos boletins das turmas alteradas.
+
+    Returns:
+        Quantidade de notas atualizadas
+    """
+    from app.models.nota import Nota, expressao_media_criterios
+    from app.models.versao_tabela import chave_turma, incrementar_versoes
+
+    if 'notas' not in inspect(db.engine).get_table_names():
+        return 0
+
+    sem_media = db.and_(
+        Nota.media.is_(None),
+        db.or_(
+            Nota.criterio1.isnot(None), Nota.criterio2.isnot(None),
+            Nota.criterio3.isnot(None), Nota.criterio4.isnot(None)
+        )
+    )
+    turmas = {
+        chave_turma(professor_id, tipo_curso)
+        for professor_id, tipo_curso in db.session.query(Nota.professor_id, Nota.tipo_curso).filter(sem_media).distinct()
+    }
+    if not turmas:
+        db.session.rollback()
+        return 0
+
+    resultado = db.session.execute(
+        db.update(Nota.__table__).where(sem_media).values(media=expressao_media_criterios())
+    )
+    incrementar_versoes(db.session.connection(), {'notas'} | turmas)
+    db.session.commit()
+    print(f"✅ Migração: média calculada em {resultado.rowcount} nota(s)")
+    return resultado.rowcount
+
+
+def criar_indices_faltantes(bloquear=True):
+    """
+    Cria os índices declarados nos modelos que ainda não existem no banco
+
+    Índices comuns são só otimização: a falha é avisada e a aplicação sobe. Um índice único
+    que não pode ser criado (dados duplicados) interrompe a inicialização, porque o código
+    depende dele (ex.: ON CONFLICT do upsert de notas).
+
+    Args:
+        bloquear: False só nos scripts de manutenção que corrigem os dados e criam o índice
+    """
+    for tabela in db.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            try:
+                indice.create(bind=db.engine, checkfirst=True)
+            except Exception as e:
+                if indice.unique and bloquear:
+                    raise MigracaoBloqueada(
+                        f"Não foi possível criar o índice único '{indice.name}' em '{tabela.name}' "
+                        f"(há registros duplicados?): {e}"
+                    ) from e
+                print(f"⚠️  Não foi possível criar o índice '{indice.name}': {e}")
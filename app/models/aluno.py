@@ -5,6 +5,10 @@ from sqlalchemy import text
 
 class Aluno(db.Model):
     __tablename__ = 'alunos'
+    __table_args__ = (
+        # Listagens por situação (ativos, pendentes de aprovação) ordenadas por nome
+        db.Index('ix_alunos_ativo_aprovado_nome', 'ativo', 'aprovado', 'nome'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(200), nullable=False)
@@ -21,7 +25,7 @@ class Aluno(db.Model):
     
     # Forma de pagamento e vencimento
     forma_pagamento = db.Column(db.String(50), nullable=False)
-    data_vencimento = db.Column(db.Date, nullable=False)  # Data de vencimento (dia/mês) - obrigatório
+    data_vencimento = db.Column(db.Date, nullable=False, index=True)  # Data de vencimento (dia/mês) - obrigatório
     dia_vencimento = db.Column(db.Integer, nullable=True)  # Campo legado - preenchido automaticamente a partir de data_vencimento
     
     # Cursos
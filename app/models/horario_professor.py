@@ -1,33 +1,140 @@
 from app.models.professor import db
+from sqlalchemy import event, inspect
+import re
+import unicodedata
+
+# Dias da semana na mesma convenção de date.weekday() (0 = segunda)
+DIAS_SEMANA = ['Segunda-feira', 'Terça-feira', 'Quarta-feira', 'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo']
+_PREFIXOS_DIAS = ['seg', 'ter', 'qua', 'qui', 'sex', 'sab', 'dom']
+
+
+def converter_dia_semana(dia_semana):
+    """Converte 'Segunda-feira', 'terca', 'SÁB'... para o número do dia (0-6) ou None"""
+    if dia_semana is None:
+        return None
+    if isinstance(dia_semana, int) or str(dia_semana).strip().isdigit():
+        numero = int(dia_semana)
+        return numero if 0 <= numero <= 6 else None
+    texto = unicodedata.normalize('NFKD', str(dia_semana)).encode('ascii', 'ignore').decode('ascii')
+    texto = texto.strip().lower()[:3]
+    return _PREFIXOS_DIAS.index(texto) if texto in _PREFIXOS_DIAS else None
+
+
+def converter_hora(hora):
+    """Converte '18:00', '18h', '18h30' ou '18' para minutos desde 00:00 (ou None)"""
+    if hora is None:
+        return None
+    match = re.match(r'^\s*(\d{1,2})\s*(?:[:hH]\s*(\d{2})?)?\s*$', str(hora))
+    if not match:
+        return None
+    horas, minutos = int(match.group(1)), int(match.group(2) or 0)
+    if horas > 24 or minutos > 59:
+        return None
+    return horas * 60 + minutos
+
+
+def converter_horario_aula(horario_aula):
+    """Converte '17:00 às 19:00' (ou '17h - 19h') para (inicio_min, fim_min); (None, None) se inválido"""
+    if not horario_aula:
+        return None, None
+    partes = re.findall(r'(\d{1,2})(?:\s*[:hH]\s*(\d{2})?)?', str(horario_aula))
+    if len(partes) < 2:
+        return None, None
+    inicio = converter_hora(f'{partes[0][0]}:{partes[0][1] or "00"}')
+    fim = converter_hora(f'{partes[1][0]}:{partes[1][1] or "00"}')
+    if inicio is None or fim is None:
+        return None, None
+    return inicio, fim
+
+
+def formatar_hora(minutos):
+    return f'{minutos // 60:02d}:{minutos % 60:02d}'
+
+
+def formatar_horario_aula(inicio_min, fim_min):
+    """Monta o texto de exibição 'HH:MM às HH:MM' a partir dos minutos"""
+    return f'{formatar_hora(inicio_min)} às {formatar_hora(fim_min)}'
+
+
+def sincronizar_campos_horario(target):
+    """
+    Mantém dia_semana/horario_aula (texto) e dia_semana_num/inicio_min/fim_min coerentes
+
+    Se o texto foi alterado, os campos numéricos são recalculados a partir dele; se só os
+    numéricos foram informados, o texto de exibição é derivado deles.
+    """
+    estado = inspect(target)
+
+    if target.dia_semana and (estado.attrs.dia_semana.history.has_changes() or target.dia_semana_num is None):
+        numero = converter_dia_semana(target.dia_semana)
+        if numero is not None:
+            target.dia_semana_num = numero
+            target.dia_semana = DIAS_SEMANA[numero]
+    elif target.dia_semana_num is not None:
+        target.dia_semana = DIAS_SEMANA[target.dia_semana_num]
+
+    if target.horario_aula and (estado.attrs.horario_aula.history.has_changes() or target.inicio_min is None):
+        inicio, fim = converter_horario_aula(target.horario_aula)
+        if inicio is not None:
+            target.inicio_min = inicio
+            target.fim_min = fim
+            target.horario_aula = formatar_horario_aula(inicio, fim)
+    elif target.inicio_min is not None and target.fim_min is not None:
+        target.horario_aula = formatar_horario_aula(target.inicio_min, target.fim_min)
+
 
 class HorarioProfessor(db.Model):
     """Tabela para armazenar os horários de aula de cada professor"""
     __tablename__ = 'horarios_professor'
-    
+    __table_args__ = (
+        # Buscas por dia/faixa de horário (ex: horários livres de terça após 18h)
+        db.Index('ix_horarios_professor_dia_inicio', 'dia_semana_num', 'inicio_min'),
+        # Busca de turmas elegíveis por modalidade e idade do aluno
+        db.Index('ix_horarios_professor_modalidade_idade', 'modalidade', 'idade_minima', 'idade_maxima'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    professor_id = db.Column(db.Integer, db.ForeignKey('professores.id'), nullable=False)
+    professor_id = db.Column(db.Integer, db.ForeignKey('professores.id'), nullable=False, index=True)
     dia_semana = db.Column(db.String(20), nullable=False)  # Ex: "Segunda-feira", "Terça-feira", etc.
     horario_aula = db.Column(db.String(50), nullable=False)  # Ex: "17:00 às 19:00", "20:00 às 22:00"
     modalidade = db.Column(db.String(50), nullable=False)  # dublagem_online, dublagem_presencial, teatro_presencial, teatro_online, locucao, teatro_tv_cinema, musical, curso_apresentador
-    
+
+    # Versão estruturada de dia_semana/horario_aula (preenchida automaticamente)
+    dia_semana_num = db.Column(db.Integer, nullable=True)  # 0 = Segunda-feira ... 6 = Domingo
+    inicio_min = db.Column(db.Integer, nullable=True)  # Minutos desde 00:00 (ex: 17:00 = 1020)
+    fim_min = db.Column(db.Integer, nullable=True)
+
     # Faixa etária permitida para este horário
     idade_minima = db.Column(db.Integer, nullable=True)  # Idade mínima permitida (ex: 8 anos)
     idade_maxima = db.Column(db.Integer, nullable=True)  # Idade máxima permitida (ex: 15 anos)
-    
+
+    # Número máximo de alunos na turma (vazio = sem limite)
+    capacidade = db.Column(db.Integer, nullable=True)
+
     # Relacionamento
     professor = db.relationship('Professor', backref='horarios')
-    
+
     def __repr__(self):
         return f'<HorarioProfessor {self.professor_id} - {self.dia_semana} {self.horario_aula}>'
-    
+
     def to_dict(self):
         return {
             'id': self.id,
             'professor_id': self.professor_id,
             'dia_semana': self.dia_semana,
             'horario_aula': self.horario_aula,
+            'dia_semana_num': self.dia_semana_num,
+            'inicio_min': self.inicio_min,
+            'fim_min': self.fim_min,
             'modalidade': self.modalidade,
             'idade_minima': self.idade_minima,
-            'idade_maxima': self.idade_maxima
+            'idade_maxima': self.idade_maxima,
+            'capacidade': self.capacidade
         }
 
+
+@event.listens_for(HorarioProfessor, 'before_insert')
+@event.listens_for(HorarioProfessor, 'before_update')
+def preencher_campos_horario(mapper, connection, target):
+    """Preenche os campos numéricos de dia/horário antes de salvar"""
+    sincronizar_campos_horario(target)
@@ -1,11 +1,27 @@
 from app.models.professor import db
+from app.models.horario_professor import sincronizar_campos_horario
+from datetime import date
+from sqlalchemy import event
+from sqlalchemy.ext.hybrid import hybrid_property
 
 class Matricula(db.Model):
     """Tabela intermediária para relacionar Aluno, Professor e Curso"""
     __tablename__ = 'matriculas'
+    __table_args__ = (
+        # Agenda do professor por dia/horário (sobreposição, horários livres)
+        db.Index('ix_matriculas_professor_dia_inicio', 'professor_id', 'dia_semana_num', 'inicio_min'),
+        # Alunos de uma turma (professor + curso)
+        db.Index('ix_matriculas_professor_curso', 'professor_id', 'tipo_curso'),
+        # Matrículas em aberto (índice parcial, só com as linhas sem data de encerramento)
+        db.Index('ix_matriculas_ativas', 'aluno_id', 'professor_id', 'tipo_curso',
+                 postgresql_where=db.text('data_encerramento IS NULL'),
+                 sqlite_where=db.text('data_encerramento IS NULL')),
+        # Encerramentos agendados (data_encerramento no futuro), o outro ramo de Matricula.ativa
+        db.Index('ix_matriculas_data_encerramento', 'data_encerramento'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id'), nullable=False)
+    aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id'), nullable=False, index=True)
     professor_id = db.Column(db.Integer, db.ForeignKey('professores.id'), nullable=False)
     
     # Tipo de curso
@@ -22,12 +38,43 @@ class Matricula(db.Model):
     dia_semana = db.Column(db.String(20), nullable=True)  # Ex: "Segunda-feira"
     horario_aula = db.Column(db.String(50), nullable=True)  # Ex: "17:00 às 19:00"
     
+    # Versão estruturada de dia_semana/horario_aula (preenchida automaticamente)
+    dia_semana_num = db.Column(db.Integer, nullable=True)  # 0 = Segunda-feira ... 6 = Domingo
+    inicio_min = db.Column(db.Integer, nullable=True)  # Minutos desde 00:00
+    fim_min = db.Column(db.Integer, nullable=True)
+    
     data_matricula = db.Column(db.DateTime, default=db.func.current_timestamp())
     
     # Relacionamentos
     aluno = db.relationship('Aluno', backref='matriculas')
     professor = db.relationship('Professor', backref='matriculas')
     
+    @hybrid_property
+    def ativa(self):
+        """Matrícula em andamento: sem data de encerramento ou com encerramento no futuro"""
+        return self.data_encerramento is None or self.data_encerramento > date.today()
+    
+    @ativa.expression
+    def ativa(cls):
+        # Ex: Matricula.query.filter(Matricula.ativa)
+        return db.or_(cls.data_encerramento.is_(None), cls.data_encerramento > date.today())
+    
+    @hybrid_property
+    def vigente(self):
+        """Matrícula que conta como aluno matriculado: aluno ativo e matrícula ativa"""
+        return self.ativa and self.aluno is not None and self.aluno.ativo
+    
+    @vigente.expression
+    def vigente(cls):
+        # Ex: Matricula.query.filter(Matricula.vigente) - o aluno é conferido por um EXISTS
+        # correlacionado só com matriculas, então também funciona em consultas que já fazem join com alunos
+        from app.models.aluno import Aluno
+        aluno = db.aliased(Aluno)
+        aluno_ativo = db.select(aluno.id).where(
+            aluno.id == cls.aluno_id, aluno.ativo == True
+        ).correlate(cls).exists()
+        return db.and_(cls.ativa, aluno_ativo)
+    
     def __repr__(self):
         return f'<Matricula {self.aluno_id} - {self.professor_id} - {self.tipo_curso}>'
     
@@ -43,6 +90,16 @@ class Matricula(db.Model):
             'data_inicio': self.data_inicio.isoformat() if self.data_inicio else None,
             'data_encerramento': self.data_encerramento.isoformat() if self.data_encerramento else None,
             'dia_semana': self.dia_semana,
-            'horario_aula': self.horario_aula
+            'horario_aula': self.horario_aula,
+            'dia_semana_num': self.dia_semana_num,
+            'inicio_min': self.inicio_min,
+            'fim_min': self.fim_min
         }
 
+
+@event.listens_for(Matricula, 'before_insert')
+@event.listens_for(Matricula, 'before_update')
+def preencher_campos_horario(mapper, connection, target):
+    """Preenche os campos numéricos de dia/horário antes de salvar"""
+    sincronizar_campos_horario(target)
+
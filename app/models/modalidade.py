@@ -0,0 +1,246 @@
+from app.models.professor import db, Professor
+from app.models.aluno import Aluno
+from app.models.horario_professor import HorarioProfessor
+from app.models.matricula import Matricula
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Modalidades oferecidas (código, nome de exibição), na ordem de exibição
+MODALIDADES = [
+    ('dublagem_online', 'Dublagem Online'),
+    ('dublagem_presencial', 'Dublagem Presencial'),
+    ('teatro_presencial', 'Teatro Presencial'),
+    ('teatro_online', 'Teatro Online'),
+    ('locucao', 'Locução'),
+    ('teatro_tv_cinema', 'Teatro TV e Cinema'),
+    ('musical', 'Musical'),
+    ('curso_apresentador', 'Curso de Apresentador'),
+]
+
+
+class Modalidade(db.Model):
+    """Tabela de referência das modalidades (cursos) oferecidas"""
+    __tablename__ = 'modalidades'
+
+    id = db.Column(db.Integer, primary_key=True)
+    codigo = db.Column(db.String(50), unique=True, nullable=False, index=True)  # Ex: "dublagem_online"
+    nome = db.Column(db.String(100), nullable=False)  # Ex: "Dublagem Online"
+    ordem = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<Modalidade {self.codigo}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'codigo': self.codigo,
+            'nome': self.nome
+        }
+
+
+# Associações derivadas dos horários (professor) e das matrículas ativas (aluno).
+# Não devem ser editadas diretamente: são recalculadas a cada flush (ver abaixo).
+professor_modalidades = db.Table(
+    'professor_modalidades',
+    db.Column('professor_id', db.Integer, db.ForeignKey('professores.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('modalidade_id', db.Integer, db.ForeignKey('modalidades.id', ondelete='CASCADE'), primary_key=True),
+    # A PK (professor_id, modalidade_id) atende "modalidades do professor"; este índice atende
+    # "professores da modalidade" e contagens por modalidade
+    db.Index('ix_professor_modalidades_modalidade', 'modalidade_id', 'professor_id')
+)
+
+aluno_modalidades = db.Table(
+    'aluno_modalidades',
+    db.Column('aluno_id', db.Integer, db.ForeignKey('alunos.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('modalidade_id', db.Integer, db.ForeignKey('modalidades.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_aluno_modalidades_modalidade', 'modalidade_id', 'aluno_id')
+)
+
+Modalidade.professores = db.relationship(
+    Professor, secondary=professor_modalidades, viewonly=True, backref=db.backref('modalidades', viewonly=True)
+)
+Modalidade.alunos = db.relationship(
+    Aluno, secondary=aluno_modalidades, viewonly=True, backref=db.backref('modalidades', viewonly=True)
+)
+
+_CODIGOS_MODALIDADES = [codigo for codigo, _ in MODALIDADES]
+
+
+def filtro_modalidades(modelo, codigos, todas=False):
+    """
+    Condição SQL para Professor/Aluno com qualquer uma (ou todas) das modalidades informadas
+
+    Ex: Professor.query.filter(filtro_modalidades(Professor, ['locucao', 'musical']))
+    """
+    tabela = professor_modalidades if modelo is Professor else aluno_modalidades
+    coluna_id = tabela.c.professor_id if modelo is Professor else tabela.c.aluno_id
+    codigos = list(codigos)
+
+    subquery = db.select(coluna_id).join(
+        Modalidade, Modalidade.id == tabela.c.modalidade_id
+    ).where(Modalidade.codigo.in_(codigos))
+    if todas:
+        subquery = subquery.group_by(coluna_id).having(
+            db.func.count(db.distinct(tabela.c.modalidade_id)) == len(set(codigos))
+        )
+    return modelo.id.in_(subquery)
+
+
+def contar_por_modalidade():
+    """Retorna [(modalidade, total_professores_ativos, total_alunos_ativos)] com duas consultas agrupadas"""
+    professores = dict(db.session.query(
+        professor_modalidades.c.modalidade_id, db.func.count(professor_modalidades.c.professor_id)
+    ).join(Professor, Professor.id == professor_modalidades.c.professor_id).filter(
+        Professor.ativo == True
+    ).group_by(professor_modalidades.c.modalidade_id).all())
+
+    alunos = dict(db.session.query(
+        aluno_modalidades.c.modalidade_id, db.func.count(aluno_modalidades.c.aluno_id)
+    ).join(Aluno, Aluno.id == aluno_modalidades.c.aluno_id).filter(
+        Aluno.ativo == True
+    ).group_by(aluno_modalidades.c.modalidade_id).all())
+
+    modalidades = Modalidade.query.order_by(Modalidade.ordem).all()
+    return [(m, professores.get(m.id, 0), alunos.get(m.id, 0)) for m in modalidades]
+
+
+def garantir_modalidades():
+    """Cadastra as modalidades que ainda não existem na tabela de referência"""
+    existentes = {codigo for (codigo,) in db.session.query(Modalidade.codigo).all()}
+    novas = [
+        Modalidade(codigo=codigo, nome=nome, ordem=ordem)
+        for ordem, (codigo, nome) in enumerate(MODALIDADES)
+        if codigo not in existentes
+    ]
+    if novas:
+        db.session.add_all(novas)
+        db.session.commit()
+    return len(novas)
+
+
+def _ids_modalidades(connection):
+    tabela = Modalidade.__table__
+    return {codigo: id_ for id_, codigo in connection.execute(db.select(tabela.c.id, tabela.c.codigo))}
+
+
+def recalcular_modalidades_professores(connection, professor_ids=None):
+    """
+    Recalcula professor_modalidades a partir dos horários (HorarioProfessor.modalidade)
+
+    Professores sem horários cadastrados usam as colunas booleanas antigas como fallback.
+    Teatro TV e Cinema acompanha teatro presencial/online, como no cadastro.
+    """
+    ids_modalidades = _ids_modalidades(connection)
+    horarios = HorarioProfessor.__table__
+    professores = Professor.__table__
+
+    query_horarios = db.select(horarios.c.professor_id, horarios.c.modalidade).distinct()
+    query_professores = db.select(professores.c.id, *[professores.c[c] for c in _CODIGOS_MODALIDADES])
+    if professor_ids is not None:
+        query_horarios = query_horarios.where(horarios.c.professor_id.in_(professor_ids))
+        query_professores = query_professores.where(professores.c.id.in_(professor_ids))
+
+    por_professor = {}
+    for professor_id, modalidade in connection.execute(query_horarios):
+        por_professor.setdefault(professor_id, set()).add(modalidade)
+
+    linhas = []
+    for linha in connection.execute(query_professores):
+        codigos = por_professor.get(linha.id)
+        if not codigos:
+            codigos = {c for c in _CODIGOS_MODALIDADES if getattr(linha, c)}
+        if 'teatro_presencial' in codigos or 'teatro_online' in codigos:
+            codigos.add('teatro_tv_cinema')
+        linhas.extend(
+            {'professor_id': linha.id, 'modalidade_id': ids_modalidades[c]}
+            for c in codigos if c in ids_modalidades
+        )
+
+    delete = professor_modalidades.delete()
+    if professor_ids is not None:
+        delete = delete.where(professor_modalidades.c.professor_id.in_(professor_ids))
+    connection.execute(delete)
+    if linhas:
+        connection.execute(professor_modalidades.insert(), linhas)
+
+
+def recalcular_modalidades_alunos(connection, aluno_ids=None):
+    """
+    Recalcula aluno_modalidades a partir das matrículas em aberto (Matricula.tipo_curso)
+
+    Conta só matrículas sem data_encerramento: um encerramento agendado já tira a modalidade do
+    aluno quando é gravado. Com Matricula.ativa (que compara com a data de hoje) a associação
+    ficaria desatualizada quando a data chegasse, porque nada é escrito nesse dia.
+    Alunos sem matrícula em aberto usam as colunas booleanas antigas como fallback.
+    """
+    ids_modalidades = _ids_modalidades(connection)
+    matriculas = Matricula.__table__
+    alunos = Aluno.__table__
+    codigos_aluno = [c for c in _CODIGOS_MODALIDADES if c in alunos.c]
+
+    query_matriculas = db.select(matriculas.c.aluno_id, matriculas.c.tipo_curso).distinct().where(
+        matriculas.c.data_encerramento.is_(None)
+    )
+    query_alunos = db.select(alunos.c.id, *[alunos.c[c] for c in codigos_aluno])
+    if aluno_ids is not None:
+        query_matriculas = query_matriculas.where(matriculas.c.aluno_id.in_(aluno_ids))
+        query_alunos = query_alunos.where(alunos.c.id.in_(aluno_ids))
+
+    por_aluno = {}
+    for aluno_id, tipo_curso in connection.execute(query_matriculas):
+        por_aluno.setdefault(aluno_id, set()).add(tipo_curso)
+
+    linhas = []
+    for linha in connection.execute(query_alunos):
+        codigos = por_aluno.get(linha.id) or {c for c in codigos_aluno if getattr(linha, c)}
+        linhas.extend(
+            {'aluno_id': linha.id, 'modalidade_id': ids_modalidades[c]}
+            for c in codigos if c in ids_modalidades
+        )
+
+    delete = aluno_modalidades.delete()
+    if aluno_ids is not None:
+        delete = delete.where(aluno_modalidades.c.aluno_id.in_(aluno_ids))
+    connection.execute(delete)
+    if linhas:
+        connection.execute(aluno_modalidades.insert(), linhas)
+
+
+@event.listens_for(Session, 'after_flush')
+def sincronizar_modalidades_flush(session, flush_context):
+    """Recalcula as associações de modalidade dos professores/alunos afetados pelo flush"""
+    professor_ids = set()
+    aluno_ids = set()
+    alterados = list(session.new) + list(session.deleted) + [
+        obj for obj in session.dirty if session.is_modified(obj, include_collections=False)
+    ]
+    for obj in alterados:
+        if isinstance(obj, HorarioProfessor):
+            professor_ids.add(obj.professor_id)
+        elif isinstance(obj, Professor):
+            professor_ids.add(obj.id)
+        elif isinstance(obj, Matricula):
+            aluno_ids.add(obj.aluno_id)
+        elif isinstance(obj, Aluno):
+            aluno_ids.add(obj.id)
+    professor_ids.discard(None)
+    aluno_ids.discard(None)
+
+    if professor_ids:
+        recalcular_modalidades_professores(session.connection(), professor_ids)
+    if aluno_ids:
+        recalcular_modalidades_alunos(session.connection(), aluno_ids)
+
+
+def inicializar_modalidades():
+    """Cadastra as modalidades e preenche as associações na primeira execução"""
+    garantir_modalidades()
+    vazias = (
+        db.session.query(professor_modalidades).first() is None
+        and db.session.query(aluno_modalidades).first() is None
+    )
+    if vazias and (Professor.query.first() is not None or Aluno.query.first() is not None):
+        recalcular_modalidades_professores(db.session.connection())
+        recalcular_modalidades_alunos(db.session.connection())
+        db.session.commit()
+        print("✅ Associações de modalidades preenchidas")
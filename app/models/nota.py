@@ -1,14 +1,42 @@
 from app.models.professor import db
+from app.models.versao_tabela import chave_turma, incrementar_versoes
 from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# Colunas da chave natural da nota e colunas atualizadas quando a nota já existe
+# (só as que vierem nas linhas do upsert: quem não envia observacao não a apaga)
+CHAVE_NOTA = ['aluno_id', 'professor_id', 'tipo_curso', 'numero_prova']
+COLUNAS_ATUALIZADAS_UPSERT = [
+    'matricula_id', 'criterio1', 'criterio2', 'criterio3', 'criterio4', 'media', 'valor', 'data_avaliacao',
+    'tipo_avaliacao', 'observacao'
+]
+CRITERIOS = ['criterio1', 'criterio2', 'criterio3', 'criterio4']
+
+
+def media_criterios(criterios):
+    """Média dos critérios preenchidos (None se nenhum foi preenchido)"""
+    criterios_validos = [c for c in criterios if c is not None]
+    if criterios_validos:
+        return sum(criterios_validos) / len(criterios_validos)
+    return None
+
 
 class Nota(db.Model):
     """Modelo para armazenar notas dos alunos"""
     __tablename__ = 'notas'
+    __table_args__ = (
+        # Notas de uma turma (professor + curso) e de um aluno dentro dela
+        db.Index('ix_notas_professor_curso_aluno', 'professor_id', 'tipo_curso', 'aluno_id'),
+        # Chave natural: uma nota por aluno/professor/curso/prova (alvo do upsert em lote)
+        db.Index('uq_notas_aluno_professor_curso_prova',
+                 'aluno_id', 'professor_id', 'tipo_curso', 'numero_prova', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id'), nullable=False)
     professor_id = db.Column(db.Integer, db.ForeignKey('professores.id'), nullable=False)
-    matricula_id = db.Column(db.Integer, db.ForeignKey('matriculas.id'), nullable=True)  # Opcional: vincular à matrícula específica
+    matricula_id = db.Column(db.Integer, db.ForeignKey('matriculas.id'), nullable=True, index=True)  # Opcional: vincular à matrícula específica
     
     # Tipo de curso (para referência rápida)
     tipo_curso = db.Column(db.String(50), nullable=False)
@@ -25,16 +53,15 @@ class Nota(db.Model):
     criterio3 = db.Column(db.Float, nullable=True)  # Critério 3 (0.0 a 10.0)
     criterio4 = db.Column(db.Float, nullable=True)  # Critério 4 (0.0 a 10.0)
     
+    # Média dos critérios, gravada a cada escrita (ver preencher_media_nota)
+    media = db.Column(db.Float, nullable=True)
+    
     # Número da prova (1 a 8 - 4 provas por ano, 8 provas no total do curso)
     numero_prova = db.Column(db.Integer, nullable=True)  # 1, 2, 3, 4, 5, 6, 7, 8
     
     def calcular_media(self):
         """Calcula a média dos 4 critérios"""
-        criterios = [self.criterio1, self.criterio2, self.criterio3, self.criterio4]
-        criterios_validos = [c for c in criterios if c is not None]
-        if criterios_validos:
-            return sum(criterios_validos) / len(criterios_validos)
-        return None
+        return media_criterios([self.criterio1, self.criterio2, self.criterio3, self.criterio4])
     
     # Metadados
     data_cadastro = db.Column(db.DateTime, default=db.func.current_timestamp())
@@ -69,6 +96,97 @@ class Nota(db.Model):
             'criterio3': float(self.criterio3) if self.criterio3 is not None else None,
             'criterio4': float(self.criterio4) if self.criterio4 is not None else None,
             'numero_prova': self.numero_prova,
-            'media': self.calcular_media()
+            'media': self.media if self.media is not None else self.calcular_media()
         }
 
+
+def expressao_media_criterios():
+    """Expressão SQL equivalente a media_criterios() (usada no backfill da coluna media)"""
+    criterios = [Nota.criterio1, Nota.criterio2, Nota.criterio3, Nota.criterio4]
+    soma = sum(db.func.coalesce(criterio, 0) for criterio in criterios)
+    preenchidos = sum(db.case((criterio.isnot(None), 1), else_=0) for criterio in criterios)
+    return soma * 1.0 / db.func.nullif(preenchidos, 0)
+
+
+def expressao_nota_final():
+    """Nota usada em médias e estatísticas: média dos critérios ou, sem critérios, o valor"""
+    return db.func.coalesce(Nota.media, Nota.valor)
+
+
+@event.listens_for(Nota, 'before_insert')
+@event.listens_for(Nota, 'before_update')
+def preencher_media_nota(mapper, connection, target):
+    """Grava a média dos critérios junto com a nota"""
+    target.media = target.calcular_media()
+
+
+def upsert_notas(linhas):
+    """
+    Grava várias notas em um único INSERT ... ON CONFLICT DO UPDATE
+
+    Cada linha é um dict com as colunas de Nota (incluindo a chave natural CHAVE_NOTA). Se a
+    nota já existe, só COLUNAS_ATUALIZADAS_UPSERT são alteradas. Funciona em PostgreSQL e
+    SQLite; em outros bancos cai para busca + UPDATE/INSERT pelo ORM.
+    Não faz commit.
+    """
+    if not linhas:
+        return
+
+    dialeto = db.engine.dialect.name
+    if dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        _upsert_notas_orm(linhas)
+        return
+
+    # Todas as linhas precisam das mesmas colunas para o INSERT em lote
+    # (a média é calculada aqui porque o INSERT via Core não passa pelo before_insert)
+    linhas = [dict(linha, media=media_criterios([linha.get(c) for c in CRITERIOS])) for linha in linhas]
+    colunas = set().union(*(linha.keys() for linha in linhas))
+    linhas = [{coluna: linha.get(coluna) for coluna in colunas} for linha in linhas]
+
+    stmt = insert(Nota.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=CHAVE_NOTA,
+        set_={coluna: stmt.excluded[coluna] for coluna in COLUNAS_ATUALIZADAS_UPSERT if coluna in colunas}
+    )
+    connection = db.session.connection()
+    connection.execute(stmt, linhas)
+    # INSERT via Core não passa pelo flush da Session: registrar a alteração para ETag/cache
+    turmas = {chave_turma(linha['professor_id'], linha['tipo_curso']) for linha in linhas}
+    incrementar_versoes(connection, {'notas'} | turmas)
+
+
+def _upsert_notas_orm(linhas):
+    for linha in linhas:
+        nota = Nota.query.filter_by(**{coluna: linha[coluna] for coluna in CHAVE_NOTA}).first()
+        if nota:
+            for coluna in COLUNAS_ATUALIZADAS_UPSERT:
+                if coluna in linha:
+                    setattr(nota, coluna, linha[coluna])
+        else:
+            db.session.add(Nota(**linha))
+    db.session.flush()
+
+
+@event.listens_for(Session, 'after_flush')
+def registrar_alteracoes_turmas(session, flush_context):
+    """Incrementa a versão das notas de cada turma afetada pelo flush (cache do boletim)"""
+    turmas = set()
+    alterados = list(session.new) + list(session.deleted) + [
+        obj for obj in session.dirty if session.is_modified(obj, include_collections=False)
+    ]
+    for obj in alterados:
+        if not isinstance(obj, Nota):
+            continue
+        turmas.add(chave_turma(obj.professor_id, obj.tipo_curso))
+        # Nota movida de turma: a turma antiga também muda
+        estado = inspect(obj)
+        professores = estado.attrs.professor_id.history.deleted or [obj.professor_id]
+        cursos = estado.attrs.tipo_curso.history.deleted or [obj.tipo_curso]
+        turmas.update(chave_turma(p, c) for p in professores for c in cursos)
+
+    if turmas:
+        incrementar_versoes(session.connection(), turmas)
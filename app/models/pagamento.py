@@ -4,6 +4,16 @@ from datetime import datetime, date
 class Pagamento(db.Model):
     """Modelo para armazenar pagamentos e comprovantes dos alunos"""
     __tablename__ = 'pagamentos'
+    __table_args__ = (
+        # Pagamentos do aluno por mês de referência (histórico, pagamento do mês)
+        db.Index('ix_pagamentos_aluno_referencia', 'aluno_id', 'ano_referencia', 'mes_referencia'),
+        # Um pagamento ativo por arquivo (SHA-256) do aluno no mês: garante a deduplicação do
+        # upload mesmo com envios simultâneos (rejeitados e falhas de envio não contam)
+        db.Index('uq_pagamentos_comprovante_ativo',
+                 'aluno_id', 'ano_referencia', 'mes_referencia', 'hash_comprovante', unique=True,
+                 postgresql_where=db.text("status NOT IN ('rejeitado', 'falha_envio')"),
+                 sqlite_where=db.text("status NOT IN ('rejeitado', 'falha_envio')")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id'), nullable=False)
@@ -17,11 +27,13 @@ class Pagamento(db.Model):
     data_pagamento = db.Column(db.Date, nullable=False)  # Data em que o aluno fez o pagamento
     
     # Comprovante
-    url_comprovante = db.Column(db.String(500), nullable=True)  # URL do comprovante no Cloudinary
-    public_id = db.Column(db.String(200), nullable=True)  # ID público do Cloudinary para gerenciamento
+    url_comprovante = db.Column(db.String(500), nullable=True)  # URL pública do comprovante no armazenamento
+    public_id = db.Column(db.String(200), nullable=True, index=True)  # Chave do objeto no armazenamento (Cloudinary, S3, disco)
+    hash_comprovante = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 do arquivo enviado (deduplicação)
+    miniatura_id = db.Column(db.String(200), nullable=True, index=True)  # Chave da miniatura no armazenamento (imagens)
     
     # Status do pagamento
-    status = db.Column(db.String(20), default='pendente', nullable=False)  # pendente, aprovado, rejeitado
+    status = db.Column(db.String(20), default='pendente', nullable=False, index=True)  # enviando, falha_envio, pendente, aprovado, rejeitado
     
     # Observações
     observacoes = db.Column(db.Text, nullable=True)
@@ -51,6 +63,8 @@ class Pagamento(db.Model):
     def get_status_label(self):
         """Retorna o label do status em português"""
         labels = {
+            'enviando': 'Enviando comprovante',
+            'falha_envio': 'Falha no envio',
             'pendente': 'Pendente',
             'aprovado': 'Aprovado',
             'rejeitado': 'Rejeitado'
@@ -60,6 +74,8 @@ class Pagamento(db.Model):
     def get_status_class(self):
         """Retorna a classe CSS para o status"""
         classes = {
+            'enviando': 'info',
+            'falha_envio': 'danger',
             'pendente': 'warning',
             'aprovado': 'success',
             'rejeitado': 'danger'
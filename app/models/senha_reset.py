@@ -7,7 +7,7 @@ class SenhaReset(db.Model):
     __tablename__ = 'senha_resets'
     
     id = db.Column(db.Integer, primary_key=True)
-    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False, index=True)
     codigo = db.Column(db.String(12), unique=True, nullable=False, index=True)  # Código de 12 caracteres
     usado = db.Column(db.Boolean, default=False, nullable=False)
     data_criacao = db.Column(db.DateTime, default=db.func.current_timestamp(), nullable=False)
@@ -11,8 +11,8 @@ class Usuario(db.Model, UserMixin):
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False, default='aluno')  # 'admin', 'aluno', 'professor' ou 'gerente'
-    professor_id = db.Column(db.Integer, db.ForeignKey('professores.id'), nullable=True)  # Vincula usuário professor ao registro Professor
-    aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id'), nullable=True)  # Vincula usuário aluno ao registro Aluno
+    professor_id = db.Column(db.Integer, db.ForeignKey('professores.id'), nullable=True, index=True)  # Vincula usuário professor ao registro Professor
+    aluno_id = db.Column(db.Integer, db.ForeignKey('alunos.id'), nullable=True, index=True)  # Vincula usuário aluno ao registro Aluno
     ativo = db.Column(db.Boolean, default=True, nullable=False)
     data_cadastro = db.Column(db.DateTime, default=db.func.current_timestamp())
     ultimo_acesso = db.Column(db.DateTime, nullable=True)
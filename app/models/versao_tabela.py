@@ -0,0 +1,110 @@
+from app.models.professor import db
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class VersaoTabela(db.Model):
+    """Contador de versão por tabela, incrementado a cada escrita (usado para ETag/cache)"""
+    __tablename__ = 'versoes_tabelas'
+
+    tabela = db.Column(db.String(50), primary_key=True)
+    versao = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<VersaoTabela {self.tabela}={self.versao}>'
+
+
+def chave_turma(professor_id, tipo_curso):
+    """Chave de versão das notas de uma turma (professor + curso), guardada em versoes_tabelas"""
+    return f'notas:{professor_id}:{tipo_curso}'
+
+
+def obter_versoes(tabelas):
+    """
+    Retorna {tabela: versao} para as tabelas informadas (0 se nunca foi alterada)
+
+    Lê apenas a tabela de versões, sem tocar nas tabelas de dados.
+    """
+    tabelas = list(tabelas)
+    linhas = db.session.query(VersaoTabela.tabela, VersaoTabela.versao).filter(
+        VersaoTabela.tabela.in_(tabelas)
+    ).all()
+    versoes = {tabela: 0 for tabela in tabelas}
+    versoes.update({tabela: versao for tabela, versao in linhas})
+    return versoes
+
+
+def incrementar_versoes(connection, tabelas):
+    """
+    Incrementa a versão das tabelas na mesma transação da escrita
+
+    Em PostgreSQL e SQLite é um único INSERT ... ON CONFLICT DO UPDATE, então a primeira escrita
+    de uma tabela (linha ainda inexistente) não corre o risco de duas transações inserirem a
+    mesma chave. As tabelas vão sempre na mesma ordem (evita deadlock entre transações).
+    Em outros bancos cai para UPDATE e, se nenhuma linha mudou, INSERT.
+    """
+    tabela_versoes = VersaoTabela.__table__
+    tabelas = sorted(tabelas)
+    if not tabelas:
+        return
+
+    dialeto = connection.dialect.name
+    if dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        for tabela in tabelas:
+            resultado = connection.execute(
+                tabela_versoes.update()
+                .where(tabela_versoes.c.tabela == tabela)
+                .values(versao=tabela_versoes.c.versao + 1)
+            )
+            if resultado.rowcount == 0:
+                connection.execute(tabela_versoes.insert().values(tabela=tabela, versao=1))
+        return
+
+    stmt = insert(tabela_versoes).values([{'tabela': tabela, 'versao': 1} for tabela in tabelas])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[tabela_versoes.c.tabela],
+        set_={'versao': tabela_versoes.c.versao + 1}
+    )
+    connection.execute(stmt)
+
+
+def _tabelas_do_objeto(obj):
+    mapper = getattr(obj, '__mapper__', None)
+    if mapper is None:
+        return []
+    return [tabela.name for tabela in mapper.tables]
+
+
+@event.listens_for(Session, 'after_flush')
+def registrar_alteracoes_flush(session, flush_context):
+    """Incrementa a versão de cada tabela que recebeu INSERT/UPDATE/DELETE neste flush"""
+    tabelas = set()
+    for obj in list(session.new) + list(session.deleted):
+        tabelas.update(_tabelas_do_objeto(obj))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tabelas.update(_tabelas_do_objeto(obj))
+    tabelas.discard(VersaoTabela.__tablename__)
+
+    if tabelas:
+        incrementar_versoes(session.connection(), tabelas)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+def registrar_alteracoes_bulk_update(update_context):
+    """Cobre Query.update() em massa, que não passa pelo flush"""
+    tabela = update_context.mapper.local_table.name
+    if tabela != VersaoTabela.__tablename__:
+        incrementar_versoes(update_context.session.connection(), [tabela])
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+def registrar_alteracoes_bulk_delete(delete_context):
+    """Cobre Query.delete() em massa, que não passa pelo flush"""
+    tabela = delete_context.mapper.local_table.name
+    if tabela != VersaoTabela.__tablename__:
+        incrementar_versoes(delete_context.session.connection(), [tabela])
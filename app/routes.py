@@ -1,19 +1,18 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, g, Response
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models.professor import db, Professor
 from app.models.aluno import Aluno
 from app.models.matricula import Matricula
 from app.models.usuario import Usuario
-from app.models.horario_professor import HorarioProfessor
+from app.models.horario_professor import HorarioProfessor, converter_dia_semana, converter_horario_aula
 from app.models.nota import Nota
 from app.models.nota import Nota
 from app.models.pagamento import Pagamento
+from app.services.ocupacao_service import reservar_vaga_matricula, TurmaLotada
 from datetime import datetime, date, timedelta
 from sqlalchemy import text
 from functools import wraps
 import re
-import os
-from werkzeug.utils import secure_filename
 
 bp = Blueprint('main', __name__)
 
@@ -464,54 +463,32 @@ def cadastro_professores():
 @admin_required
 def listar_professores():
     from sqlalchemy.orm import joinedload
-    from sqlalchemy import nullslast
     
     try:
         # Por padrão, mostrar apenas professores ativos
         filtro = request.args.get('filtro', 'ativos')
         
-        # Tentar carregar com joinedload, mas se falhar, tentar sem
-        try:
-            if filtro == 'inativos':
-                # Usar nullslast() para compatibilidade com PostgreSQL quando data_exclusao é NULL
-                # Tentar ordenar por data_exclusao, mas se falhar, ordenar apenas por nome
-                try:
-                    professores = Professor.query.options(joinedload(Professor.horarios)).filter_by(ativo=False).order_by(nullslast(Professor.data_exclusao.desc()), Professor.nome).all()
-                except Exception:
-                    # Se a ordenação por data_exclusao falhar, ordenar apenas por nome
-                    professores = Professor.query.options(joinedload(Professor.horarios)).filter_by(ativo=False).order_by(Professor.nome).all()
-            else:
-                professores = Professor.query.options(joinedload(Professor.horarios)).filter_by(ativo=True).order_by(Professor.nome).all()
-        except Exception as load_error:
-            # Se joinedload falhar (pode ser que a tabela horarios_professor não exista), tentar sem eager loading
-            print(f"Erro ao carregar horários com joinedload: {load_error}. Tentando sem eager loading...")
-            if filtro == 'inativos':
-                try:
-                    professores = Professor.query.filter_by(ativo=False).order_by(nullslast(Professor.data_exclusao.desc()), Professor.nome).all()
-                except Exception:
-                    professores = Professor.query.filter_by(ativo=False).order_by(Professor.nome).all()
-            else:
-                professores = Professor.query.filter_by(ativo=True).order_by(Professor.nome).all()
-            
-            # Carregar horários manualmente para cada professor
-            for professor in professores:
-                try:
-                    professor.horarios = HorarioProfessor.query.filter_by(professor_id=professor.id).all()
-                except Exception as horario_error:
-                    # Se não conseguir carregar horários, usar lista vazia
-                    professor.horarios = []
-                    print(f"Erro ao carregar horários do professor {professor.id}: {horario_error}")
+        # Uma única consulta: professores + horários (joinedload) + flag EXISTS(usuario)
+        tem_usuario = db.session.query(Usuario.id).filter(
+            Usuario.professor_id == Professor.id
+        ).exists().label('tem_usuario')
+        
+        query = db.session.query(Professor, tem_usuario).options(joinedload(Professor.horarios))
         
-        # Verificar quais professores já têm usuário cadastrado
+        if filtro == 'inativos':
+            # Excluídos mais recentes primeiro, sem data por último
+            # (equivalente a NULLS LAST, mas portável entre SQLite e PostgreSQL)
+            query = query.filter(Professor.ativo == False).order_by(
+                Professor.data_exclusao.is_(None), Professor.data_exclusao.desc(), Professor.nome
+            )
+        else:
+            query = query.filter(Professor.ativo == True).order_by(Professor.nome)
+        
+        professores = []
         professores_com_usuario = {}
-        for professor in professores:
-            try:
-                usuario = Usuario.query.filter_by(professor_id=professor.id).first()
-                professores_com_usuario[professor.id] = usuario is not None
-            except Exception as e:
-                # Se houver erro ao buscar usuário, considerar como não tendo usuário
-                professores_com_usuario[professor.id] = False
-                print(f"Erro ao verificar usuário do professor {professor.id}: {e}")
+        for professor, possui_usuario in query.all():
+            professores.append(professor)
+            professores_com_usuario[professor.id] = bool(possui_usuario)
         
         return render_template('listar_professores.html', 
                              professores=professores, 
@@ -555,6 +532,145 @@ def excluir_professor(professor_id):
     
     return redirect(url_for('main.listar_professores'))
 
+def _chave_dia_horario(dia_semana, horario_aula):
+    """
+    Dia e faixa de horário normalizados para comparar registros ('Segunda' / '17h às 19h' e
+    'Segunda-feira' / '17:00 às 19:00' são iguais); texto não reconhecido é comparado como está
+    """
+    dia = converter_dia_semana(dia_semana)
+    inicio, fim = converter_horario_aula(horario_aula)
+    return (
+        dia if dia is not None else dia_semana,
+        (inicio, fim) if inicio is not None else horario_aula
+    )
+
+def sincronizar_matriculas_aluno(aluno_id, matriculas_novas):
+    """
+    Aplica a lista de matrículas ao aluno por diferença, em vez de apagar e recriar tudo.
+    
+    A chave de cada matrícula é (professor_id, tipo_curso, dia da semana, faixa de horário),
+    com dia e horário normalizados (o texto gravado é padronizado e pode diferir do enviado):
+    matrículas ativas que continuam na lista mantêm o id (e as notas vinculadas), só sendo
+    atualizadas se valor ou data de início mudarem; novas são inseridas e as que saíram da
+    lista são encerradas via data_encerramento.
+    
+    Args:
+        aluno_id: ID do aluno
+        matriculas_novas: Lista de dicts com professor_id, tipo_curso, dia_semana, horario_aula,
+                          valor_mensalidade e data_inicio
+    
+    Raises:
+        TurmaLotada: se a turma de uma matrícula nova não tem vaga
+    """
+    hoje = date.today()
+    ativas = Matricula.query.filter(Matricula.aluno_id == aluno_id, Matricula.ativa).all()
+    
+    existentes = {}
+    for matricula in ativas:
+        chave = (matricula.professor_id, matricula.tipo_curso,
+                 *_chave_dia_horario(matricula.dia_semana, matricula.horario_aula))
+        if chave in existentes:
+            # Duplicata antiga: manter apenas uma matrícula ativa por chave
+            matricula.data_encerramento = hoje
+        else:
+            existentes[chave] = matricula
+    
+    chaves_mantidas = set()
+    for dados in matriculas_novas:
+        chave = (dados['professor_id'], dados['tipo_curso'],
+                 *_chave_dia_horario(dados.get('dia_semana'), dados.get('horario_aula')))
+        if chave in chaves_mantidas:
+            continue
+        chaves_mantidas.add(chave)
+        
+        matricula = existentes.get(chave)
+        if matricula is None:
+            # Capacidade da turma (trava o horário até o commit; lotada -> TurmaLotada)
+            reservar_vaga_matricula(dados['professor_id'], dados['tipo_curso'],
+                                    dados.get('dia_semana'), dados.get('horario_aula'))
+            db.session.add(Matricula(
+                aluno_id=aluno_id,
+                professor_id=dados['professor_id'],
+                tipo_curso=dados['tipo_curso'],
+                valor_mensalidade=dados.get('valor_mensalidade'),
+                dia_semana=dados.get('dia_semana'),
+                horario_aula=dados.get('horario_aula'),
+                data_inicio=dados.get('data_inicio')
+            ))
+        else:
+            # Só escrever se algo realmente mudou
+            if matricula.valor_mensalidade != dados.get('valor_mensalidade'):
+                matricula.valor_mensalidade = dados.get('valor_mensalidade')
+            if dados.get('data_inicio') and matricula.data_inicio != dados['data_inicio']:
+                matricula.data_inicio = dados['data_inicio']
+    
+    for chave, matricula in existentes.items():
+        if chave not in chaves_mantidas:
+            matricula.data_encerramento = hoje
+    
+    return chaves_mantidas
+
+def sincronizar_horarios_professor(professor_id, horarios_novos):
+    """
+    Aplica a lista de horários ao professor por diferença, em vez de apagar e recriar tudo.
+    
+    A chave de cada horário é (dia da semana, modalidade, faixa de horário), com dia e horário
+    normalizados como em sincronizar_matriculas_aluno: horários que continuam
+    na lista mantêm o id (só as faixas de idade são atualizadas se mudarem), horários novos
+    são inseridos e os que saíram da lista são removidos.
+    
+    Args:
+        professor_id: ID do professor
+        horarios_novos: Lista de dicts com dia_semana, modalidade, horario_aula, idade_minima, idade_maxima
+                        e, opcionalmente, capacidade (se ausente, a capacidade atual é mantida)
+    
+    Returns:
+        Conjunto com as chaves dos horários que ficaram cadastrados
+    """
+    existentes = {}
+    for horario in HorarioProfessor.query.filter_by(professor_id=professor_id).all():
+        dia, faixa = _chave_dia_horario(horario.dia_semana, horario.horario_aula)
+        chave = (dia, horario.modalidade, faixa)
+        if chave in existentes:
+            # Duplicata antiga: manter apenas um registro por chave
+            db.session.delete(horario)
+        else:
+            existentes[chave] = horario
+    
+    chaves_mantidas = set()
+    for dados in horarios_novos:
+        dia, faixa = _chave_dia_horario(dados['dia_semana'], dados['horario_aula'])
+        chave = (dia, dados['modalidade'], faixa)
+        if chave in chaves_mantidas:
+            continue
+        chaves_mantidas.add(chave)
+        
+        horario = existentes.get(chave)
+        if horario is None:
+            db.session.add(HorarioProfessor(
+                professor_id=professor_id,
+                dia_semana=dados['dia_semana'],
+                modalidade=dados['modalidade'],
+                horario_aula=dados['horario_aula'],
+                idade_minima=dados.get('idade_minima'),
+                idade_maxima=dados.get('idade_maxima'),
+                capacidade=dados.get('capacidade')
+            ))
+        else:
+            # Só escrever se algo realmente mudou
+            if horario.idade_minima != dados.get('idade_minima'):
+                horario.idade_minima = dados.get('idade_minima')
+            if horario.idade_maxima != dados.get('idade_maxima'):
+                horario.idade_maxima = dados.get('idade_maxima')
+            if 'capacidade' in dados and horario.capacidade != dados['capacidade']:
+                horario.capacidade = dados['capacidade']
+    
+    for chave, horario in existentes.items():
+        if chave not in chaves_mantidas:
+            db.session.delete(horario)
+    
+    return chaves_mantidas
+
 @bp.route('/professores/<int:professor_id>/editar', methods=['GET', 'POST'])
 @admin_required
 def editar_professor(professor_id):
@@ -584,13 +700,9 @@ def editar_professor(professor_id):
                 flash('Nome é obrigatório.', 'error')
                 return render_template('editar_professor.html', professor=professor)
             
-            # Processar horários
-            # Primeiro, remover todos os horários existentes
-            HorarioProfessor.query.filter_by(professor_id=professor.id).delete()
-            
-            # Adicionar novos horários
+            # Processar horários (sincronização por diferença: horários inalterados não são reescritos)
             horario_keys = [key for key in request.form.keys() if key.startswith('horario_dia_')]
-            horarios_adicionados = set()
+            horarios_form = []
             
             for key in horario_keys:
                 horario_index = key.split('_')[-1]
@@ -602,22 +714,16 @@ def editar_professor(professor_id):
                 idade_maxima = request.form.get(f'horario_idade_maxima_{horario_index}', '').strip()
                 
                 if dia_semana and modalidade and horario_inicio and horario_termino:
-                    # Formatar horário como "HH:MM às HH:MM"
-                    horario_aula = f"{horario_inicio} às {horario_termino}"
-                    
-                    # Criar chave única para evitar duplicatas
-                    chave_horario = f"{dia_semana}_{modalidade}_{horario_aula}"
-                    if chave_horario not in horarios_adicionados:
-                        horario = HorarioProfessor(
-                            professor_id=professor.id,
-                            dia_semana=dia_semana,
-                            modalidade=modalidade,
-                            horario_aula=horario_aula,
-                            idade_minima=int(idade_minima) if idade_minima and idade_minima.isdigit() else None,
-                            idade_maxima=int(idade_maxima) if idade_maxima and idade_maxima.isdigit() else None
-                        )
-                        db.session.add(horario)
-                        horarios_adicionados.add(chave_horario)
+                    horarios_form.append({
+                        'dia_semana': dia_semana,
+                        'modalidade': modalidade,
+                        # Formatar horário como "HH:MM às HH:MM"
+                        'horario_aula': f"{horario_inicio} às {horario_termino}",
+                        'idade_minima': int(idade_minima) if idade_minima and idade_minima.isdigit() else None,
+                        'idade_maxima': int(idade_maxima) if idade_maxima and idade_maxima.isdigit() else None
+                    })
+            
+            horarios_adicionados = sincronizar_horarios_professor(professor.id, horarios_form)
             
             # Determinar modalidades do professor baseado nos horários que serão cadastrados
             modalidades_professor = set()
@@ -948,44 +1054,23 @@ def api_professores():
         if not tipo_curso:
             return jsonify([])
         
-        # Filtrar apenas professores ativos
-        query = Professor.query.filter_by(ativo=True)
-        
-        # Filtrar professores baseado no tipo de curso
-        # Usar == True para compatibilidade com SQLite e PostgreSQL
-        from sqlalchemy import or_
-        
-        if tipo_curso == 'dublagem_online':
-            query = query.filter(Professor.dublagem_online == True)
-        elif tipo_curso == 'dublagem_presencial':
-            query = query.filter(Professor.dublagem_presencial == True)
-        elif tipo_curso == 'teatro_online':
-            query = query.filter(Professor.teatro_online == True)
-        elif tipo_curso == 'teatro_presencial':
-            query = query.filter(Professor.teatro_presencial == True)
-        elif tipo_curso == 'locucao':
-            query = query.filter(Professor.locucao == True)
-        elif tipo_curso == 'musical':
-            query = query.filter(Professor.musical == True)
-        elif tipo_curso == 'teatro_tv_cinema':
-            # Teatro TV/Cinema pode ser com professor de teatro presencial ou online
-            query = query.filter(or_(Professor.teatro_presencial == True, Professor.teatro_online == True))
-        else:
-            # Se nenhum tipo foi especificado, retornar vazio
+        # Professores ativos com a modalidade (associação derivada dos horários), servidos do
+        # cache de referência. Teatro TV/Cinema já inclui professores de teatro presencial ou online
+        from app.services.referencia_service import professores_por_modalidade
+        professores = professores_por_modalidade(tipo_curso)
+        if professores is None:
             return jsonify([])
         
-        professores = query.order_by(Professor.nome).all()
-        
         resultado = [{
-            'id': p.id,
-            'nome': p.nome,
-            'dublagem_presencial': bool(p.dublagem_presencial),
-            'dublagem_online': bool(p.dublagem_online),
-            'teatro_presencial': bool(p.teatro_presencial),
-            'teatro_online': bool(p.teatro_online),
-            'musical': bool(p.musical),
-            'locucao': bool(p.locucao),
-            'curso_apresentador': bool(p.curso_apresentador)
+            'id': p['id'],
+            'nome': p['nome'],
+            'dublagem_presencial': bool(p['dublagem_presencial']),
+            'dublagem_online': bool(p['dublagem_online']),
+            'teatro_presencial': bool(p['teatro_presencial']),
+            'teatro_online': bool(p['teatro_online']),
+            'musical': bool(p['musical']),
+            'locucao': bool(p['locucao']),
+            'curso_apresentador': bool(p['curso_apresentador'])
         } for p in professores]
         
         return jsonify(resultado)
@@ -999,14 +1084,19 @@ def api_professores():
 def api_horarios_professor(professor_id):
     """API para buscar horários de um professor específico"""
     try:
-        professor = Professor.query.get_or_404(professor_id)
+        from app.services.referencia_service import horarios_do_professor
+        
+        # Horários já ordenados por dia/horário no cache de referência
+        horarios_professor = horarios_do_professor(professor_id)
+        if horarios_professor is None:
+            return jsonify({'error': 'Professor não encontrado'}), 404
         
         horarios = []
-        for horario in professor.horarios:
+        for horario in horarios_professor:
             horarios.append({
-                'id': horario.id,
-                'dia_semana': horario.dia_semana,
-                'horario_aula': horario.horario_aula
+                'id': horario['id'],
+                'dia_semana': horario['dia_semana'],
+                'horario_aula': horario['horario_aula']
             })
         
         return jsonify(horarios)
@@ -1302,6 +1392,14 @@ def cadastro_alunos():
                     print(f"DEBUG CADASTRO: Criando matrícula para curso {tipo_curso}")
                     print(f"DEBUG CADASTRO: professor_id={dados.get('professor_id')}, dia_semana={dados.get('dia_semana')}, horario_aula={dados.get('horario_aula')}, data_inicio={data_inicio}")
                     
+                    # Capacidade da turma (trava o horário até o commit)
+                    try:
+                        reservar_vaga_matricula(dados['professor_id'], tipo_curso,
+                                                dados.get('dia_semana'), dados.get('horario_aula'))
+                    except TurmaLotada as e:
+                        erros.append(f'Aluno {i+1} ({nome}): Turma lotada. {e}')
+                        continue
+                    
                     matricula = Matricula(
                         aluno_id=aluno.id,
                         professor_id=dados['professor_id'],
@@ -1395,23 +1493,23 @@ def listar_alunos():
             return redirect(url_for('main.listar_alunos', filtro='ativos'))
         
         # Buscar alunos através de matrículas - carregar todas as matrículas do aluno, não apenas as do professor
+        # (IDs dos alunos vêm do contexto do professor, carregado uma vez por requisição)
         if filtro == 'pagamentos':
             # Para a aba de pagamentos, mostrar alunos ativos do professor
-            alunos = Aluno.query.options(subqueryload(Aluno.matriculas), subqueryload(Aluno.pagamentos)).join(Matricula).filter(
-                Matricula.professor_id == professor.id,
+            alunos = Aluno.query.options(subqueryload(Aluno.matriculas), subqueryload(Aluno.pagamentos)).filter(
+                Aluno.id.in_(obter_alunos_ids_professor(professor)),
                 Aluno.ativo == True
-            ).order_by(Aluno.nome).distinct().all()
+            ).order_by(Aluno.nome).all()
         elif filtro == 'notas':
             # Para a aba de notas, filtrar por tipo_curso se fornecido
             tipo_curso = request.args.get('tipo_curso', '').strip()
             if tipo_curso:
                 try:
                     # Filtrar alunos apenas do curso selecionado
-                    alunos = Aluno.query.options(subqueryload(Aluno.matriculas)).join(Matricula).filter(
-                        Matricula.professor_id == professor.id,
-                        Matricula.tipo_curso == tipo_curso,
+                    alunos = Aluno.query.options(subqueryload(Aluno.matriculas)).filter(
+                        Aluno.id.in_(obter_alunos_ids_professor(professor, tipo_curso)),
                         Aluno.ativo == True
-                    ).order_by(Aluno.nome).distinct().all()
+                    ).order_by(Aluno.nome).all()
                 except Exception as e:
                     import traceback
                     print(f"Erro ao buscar alunos para notas: {e}")
@@ -1423,10 +1521,10 @@ def listar_alunos():
                 alunos = []
                 tipo_curso = None
         else:
-            alunos = Aluno.query.options(subqueryload(Aluno.matriculas)).join(Matricula).filter(
-                Matricula.professor_id == professor.id,
+            alunos = Aluno.query.options(subqueryload(Aluno.matriculas)).filter(
+                Aluno.id.in_(obter_alunos_ids_professor(professor)),
                 Aluno.ativo == True
-            ).order_by(Aluno.nome).distinct().all()
+            ).order_by(Aluno.nome).all()
     else:
         # Aluno não pode ver lista
         flash('Acesso negado. Apenas administradores e professores podem ver a lista de alunos.', 'error')
@@ -1749,6 +1847,9 @@ def editar_aluno(aluno_id):
                             except ValueError:
                                 pass
                         
+                        # Capacidade da turma (trava o horário até o commit)
+                        reservar_vaga_matricula(professor_id, tipo_curso, dia_semana, horario_aula)
+                        
                         matricula = Matricula(
                             aluno_id=aluno.id,
                             professor_id=professor_id,
@@ -1759,6 +1860,11 @@ def editar_aluno(aluno_id):
                             horario_aula=horario_aula if horario_aula else None
                         )
                         db.session.add(matricula)
+                    except TurmaLotada as e:
+                        db.session.rollback()
+                        flash(f'Turma lotada: {e}', 'error')
+                        professores = Professor.query.filter_by(ativo=True).order_by(Professor.nome).all()
+                        return render_template('editar_aluno_pendente.html', aluno=aluno, professores=professores)
                     except (ValueError, TypeError) as e:
                         nome_curso = tipo_curso.replace('_', ' ').title()
                         flash(f'Erro ao processar dados do curso "{nome_curso}": {str(e)}', 'error')
@@ -1869,16 +1975,68 @@ def aprovar_aluno(aluno_id):
 
 # ==================== ROTAS DE NOTAS ====================
 
+def _memo_professor(professor_id, chave, carregar):
+    """
+    Memoiza dados do professor durante a requisição atual (flask.g)
+    
+    Evita que a mesma view (ou views/helpers chamados na mesma requisição) repitam as
+    consultas de horários, modalidades e alunos do professor.
+    """
+    memo = g.setdefault('memo_professor', {})
+    chave = (professor_id, chave)
+    if chave not in memo:
+        memo[chave] = carregar()
+    return memo[chave]
+
+def obter_horarios_professor(professor):
+    """Horários do professor ordenados por dia/horário (uma consulta por requisição)"""
+    return _memo_professor(professor.id, 'horarios', lambda: HorarioProfessor.query.filter_by(
+        professor_id=professor.id
+    ).order_by(HorarioProfessor.dia_semana_num, HorarioProfessor.inicio_min).all())
+
+def obter_alunos_ids_professor(professor, tipo_curso=None):
+    """
+    IDs dos alunos matriculados com o professor (opcionalmente só de uma modalidade)
+    
+    Uma única consulta (tipo_curso, aluno_id) por requisição atende todas as modalidades.
+    """
+    def carregar():
+        por_modalidade = {}
+        linhas = db.session.query(Matricula.tipo_curso, Matricula.aluno_id).filter_by(
+            professor_id=professor.id
+        ).distinct().all()
+        for curso, aluno_id in linhas:
+            por_modalidade.setdefault(curso, set()).add(aluno_id)
+        return por_modalidade
+    
+    por_modalidade = _memo_professor(professor.id, 'alunos_por_modalidade', carregar)
+    if tipo_curso:
+        return list(por_modalidade.get(tipo_curso, set()))
+    return list(set().union(*por_modalidade.values())) if por_modalidade else []
+
+def obter_matriculas_professor(professor, tipo_curso):
+    """Matrículas do professor em uma modalidade, indexadas por aluno_id (uma consulta por requisição)"""
+    def carregar():
+        matriculas = {}
+        for matricula in Matricula.query.filter_by(
+            professor_id=professor.id, tipo_curso=tipo_curso
+        ).order_by(Matricula.id).all():
+            matriculas.setdefault(matricula.aluno_id, matricula)
+        return matriculas
+    
+    return _memo_professor(professor.id, ('matriculas', tipo_curso), carregar)
+
 def obter_modalidades_professor(professor):
     """Função auxiliar para obter modalidades de um professor"""
-    from sqlalchemy.orm import joinedload
-    
+    return _memo_professor(professor.id, 'modalidades', lambda: _calcular_modalidades_professor(professor))
+
+def _calcular_modalidades_professor(professor):
     modalidades_professor = []
-    professor_com_horarios = Professor.query.options(joinedload(Professor.horarios)).filter_by(id=professor.id).first()
+    horarios = obter_horarios_professor(professor)
     
-    if professor_com_horarios and professor_com_horarios.horarios:
+    if horarios:
         modalidades_unicas = set()
-        for horario in professor_com_horarios.horarios:
+        for horario in horarios:
             try:
                 if horario.modalidade:
                     modalidades_unicas.add(horario.modalidade)
@@ -1887,33 +2045,25 @@ def obter_modalidades_professor(professor):
         
         # Se não encontrou modalidades nos horários, usar as modalidades do professor
         if not modalidades_unicas:
-            if professor_com_horarios.dublagem_presencial:
+            if professor.dublagem_presencial:
                 modalidades_unicas.add('dublagem_presencial')
-            if professor_com_horarios.dublagem_online:
+            if professor.dublagem_online:
                 modalidades_unicas.add('dublagem_online')
-            if professor_com_horarios.teatro_presencial:
+            if professor.teatro_presencial:
                 modalidades_unicas.add('teatro_presencial')
-            if professor_com_horarios.teatro_online:
+            if professor.teatro_online:
                 modalidades_unicas.add('teatro_online')
-            if professor_com_horarios.locucao:
+            if professor.locucao:
                 modalidades_unicas.add('locucao')
-            if professor_com_horarios.musical:
+            if professor.musical:
                 modalidades_unicas.add('musical')
-            if professor_com_horarios.teatro_tv_cinema:
+            if professor.teatro_tv_cinema:
                 modalidades_unicas.add('teatro_tv_cinema')
-            if professor_com_horarios.curso_apresentador:
+            if professor.curso_apresentador:
                 modalidades_unicas.add('curso_apresentador')
         
-        tipos_cursos_map = {
-            'dublagem_online': 'Dublagem Online',
-            'dublagem_presencial': 'Dublagem Presencial',
-            'teatro_presencial': 'Teatro Presencial',
-            'teatro_online': 'Teatro Online',
-            'locucao': 'Locução',
-            'teatro_tv_cinema': 'Teatro TV e Cinema',
-            'musical': 'Musical',
-            'curso_apresentador': 'Curso de Apresentador'
-        }
+        from app.services.referencia_service import rotulos_modalidades
+        tipos_cursos_map = rotulos_modalidades()
         
         modalidades_professor = [
             {'value': mod, 'label': tipos_cursos_map.get(mod, mod.replace('_', ' ').title())}
@@ -1953,10 +2103,7 @@ def listar_notas():
         if not tipo_curso:
             modalidades_professor = obter_modalidades_professor(professor)
             
-            alunos_ids = db.session.query(Matricula.aluno_id).filter_by(
-                professor_id=professor.id
-            ).distinct().all()
-            alunos_ids = [row[0] for row in alunos_ids]
+            alunos_ids = obter_alunos_ids_professor(professor)
             if alunos_ids:
                 alunos = Aluno.query.filter(
                     Aluno.id.in_(alunos_ids),
@@ -1971,11 +2118,7 @@ def listar_notas():
                                  modalidades_professor=modalidades_professor)
         
         # Buscar IDs dos alunos deste professor através das matrículas
-        alunos_ids_query = db.session.query(Matricula.aluno_id).filter_by(
-            professor_id=professor.id,
-            tipo_curso=tipo_curso
-        ).distinct()
-        alunos_ids = [row[0] for row in alunos_ids_query.all()]
+        alunos_ids = obter_alunos_ids_professor(professor, tipo_curso)
         
         if not alunos_ids:
             # Professor sem alunos nesta modalidade
@@ -2021,12 +2164,7 @@ def listar_notas():
             # Se não, buscar todos os alunos do professor (sem filtro de curso)
             if not tipo_curso:
                 # Buscar todos os alunos do professor (sem filtro de curso)
-                query_matriculas = db.session.query(Matricula.aluno_id).filter_by(
-                    professor_id=professor.id
-                )
-                
-                alunos_ids = query_matriculas.distinct().all()
-                alunos_ids = [row[0] for row in alunos_ids]
+                alunos_ids = obter_alunos_ids_professor(professor)
                 if alunos_ids:
                     alunos = Aluno.query.filter(
                         Aluno.id.in_(alunos_ids),
@@ -2099,11 +2237,7 @@ def cadastrar_nota():
                 return redirect(url_for('main.cadastrar_nota'))
             
             # Verificar se o aluno está matriculado com este professor
-            matricula_existe = Matricula.query.filter_by(
-                aluno_id=aluno_id,
-                professor_id=professor_id,
-                tipo_curso=tipo_curso
-            ).first()
+            matricula_existe = obter_matriculas_professor(professor, tipo_curso).get(aluno_id)
             
             if not matricula_existe:
                 flash('Aluno não está matriculado com você neste curso.', 'error')
@@ -2165,17 +2299,8 @@ def cadastrar_nota():
     elif current_user.is_professor():
         professor = current_user.get_professor()
         if professor:
-            # Buscar alunos deste professor
-            query_matriculas = db.session.query(Matricula.aluno_id).filter_by(
-                professor_id=professor.id
-            )
-            
-            # Aplicar filtro de modalidade se fornecido
-            if filtro_modalidade:
-                query_matriculas = query_matriculas.filter_by(tipo_curso=filtro_modalidade)
-            
-            alunos_ids = query_matriculas.distinct().all()
-            alunos_ids = [row[0] for row in alunos_ids]
+            # Buscar alunos deste professor (aplicando filtro de modalidade se fornecido)
+            alunos_ids = obter_alunos_ids_professor(professor, filtro_modalidade or None)
             
             if alunos_ids:
                 alunos = Aluno.query.filter(
@@ -2359,20 +2484,35 @@ def salvar_criterios_notas():
                 except (ValueError, IndexError):
                     continue
         
+        from app.models.nota import upsert_notas
+        
+        # Carregar alunos e matrículas de uma vez (em vez de duas consultas por aluno)
+        alunos_por_id = {}
+        if alunos_processados:
+            alunos_por_id = {a.id: a for a in Aluno.query.filter(Aluno.id.in_(alunos_processados)).all()}
+        matriculas_por_aluno = obter_matriculas_professor(professor, tipo_curso)
+        
+        # Alunos que já têm nota nesta prova (só para a mensagem de cadastradas/atualizadas)
+        notas_existentes = set()
+        if alunos_processados:
+            notas_existentes = {aluno_id for (aluno_id,) in db.session.query(Nota.aluno_id).filter(
+                Nota.professor_id == professor.id,
+                Nota.tipo_curso == tipo_curso,
+                Nota.numero_prova == numero_prova,
+                Nota.aluno_id.in_(alunos_processados)
+            ).all()}
+        
+        linhas_notas = []
         for aluno_id in alunos_processados:
             try:
                 # Buscar aluno
-                aluno = Aluno.query.get(aluno_id)
+                aluno = alunos_por_id.get(aluno_id)
                 if not aluno:
                     erros.append(f'Aluno ID {aluno_id} não encontrado.')
                     continue
                 
                 # Verificar se o aluno está matriculado com este professor neste curso
-                matricula = Matricula.query.filter_by(
-                    aluno_id=aluno_id,
-                    professor_id=professor.id,
-                    tipo_curso=tipo_curso
-                ).first()
+                matricula = matriculas_por_aluno.get(aluno_id)
                 
                 if not matricula:
                     erros.append(f'Aluno {aluno.nome} não está matriculado neste curso com este professor.')
@@ -2406,48 +2546,33 @@ def salvar_criterios_notas():
                 if criterios_preenchidos:
                     valor = sum(criterios_preenchidos) / len(criterios_preenchidos)
                 
-                # Verificar se já existe nota para este aluno, professor, curso e prova
-                nota_existente = Nota.query.filter_by(
-                    aluno_id=aluno_id,
-                    professor_id=professor.id,
-                    tipo_curso=tipo_curso,
-                    numero_prova=numero_prova
-                ).first()
-                
-                if nota_existente:
-                    # Atualizar nota existente
-                    nota_existente.criterio1 = criterio1
-                    nota_existente.criterio2 = criterio2
-                    nota_existente.criterio3 = criterio3
-                    nota_existente.criterio4 = criterio4
-                    nota_existente.valor = valor  # Atualizar valor calculado
-                    nota_existente.data_avaliacao = data_avaliacao
-                    nota_existente.matricula_id = matricula.id
+                linhas_notas.append({
+                    'aluno_id': aluno_id,
+                    'professor_id': professor.id,
+                    'matricula_id': matricula.id,
+                    'tipo_curso': tipo_curso,
+                    'numero_prova': numero_prova,
+                    'criterio1': criterio1,
+                    'criterio2': criterio2,
+                    'criterio3': criterio3,
+                    'criterio4': criterio4,
+                    'valor': valor,  # Preencher valor calculado
+                    'data_avaliacao': data_avaliacao,
+                    'tipo_avaliacao': f'Prova {numero_prova}',
+                    'cadastrado_por': current_user.id
+                })
+                if aluno_id in notas_existentes:
                     notas_atualizadas += 1
                 else:
-                    # Criar nova nota
-                    nota = Nota(
-                        aluno_id=aluno_id,
-                        professor_id=professor.id,
-                        matricula_id=matricula.id,
-                        tipo_curso=tipo_curso,
-                        numero_prova=numero_prova,
-                        criterio1=criterio1,
-                        criterio2=criterio2,
-                        criterio3=criterio3,
-                        criterio4=criterio4,
-                        valor=valor,  # Preencher valor calculado
-                        data_avaliacao=data_avaliacao,
-                        tipo_avaliacao=f'Prova {numero_prova}',
-                        cadastrado_por=current_user.id
-                    )
-                    db.session.add(nota)
                     notas_salvas += 1
                     
             except Exception as e:
                 erros.append(f'Erro ao processar aluno ID {aluno_id}: {str(e)}')
                 continue
         
+        # Gravar todas as notas de uma vez (insere as novas e atualiza as existentes)
+        upsert_notas(linhas_notas)
+        
         # Commit de todas as alterações
         db.session.commit()
         
@@ -2485,25 +2610,33 @@ def upload_comprovante(aluno_id):
         return redirect(url_for('main.index'))
     
     if request.method == 'POST':
+        caminho_spool = None
         try:
-            # Validar credenciais do Cloudinary
-            import cloudinary
-            import cloudinary.uploader
-            
-            cloud_name = current_app.config.get('CLOUDINARY_CLOUD_NAME')
-            api_key = current_app.config.get('CLOUDINARY_API_KEY')
-            api_secret = current_app.config.get('CLOUDINARY_API_SECRET')
+            # Validar configuração do armazenamento (o envio é feito em segundo plano)
+            from app.services.armazenamento_service import verificar_configuracao
+            from app.services.upload_service import (
+                ler_upload_multipart, receber_comprovante, agendar_envio, descartar_spool, UploadInvalido
+            )
             
-            if not api_key or not api_secret:
-                flash('Erro de configuração: Credenciais do Cloudinary não encontradas. Entre em contato com o administrador.', 'error')
+            erro_configuracao = verificar_configuracao()
+            if erro_configuracao:
+                flash(f'Erro de configuração: {erro_configuracao}. Entre em contato com o administrador.', 'error')
                 return render_template('upload_comprovante.html', aluno=aluno)
             
+            # Ler o formulário em blocos (formato e tamanho do arquivo conferidos durante a leitura)
+            try:
+                campos, recebido = ler_upload_multipart(request)
+            except UploadInvalido as e:
+                flash(str(e), 'error')
+                return render_template('upload_comprovante.html', aluno=aluno), e.status
+            caminho_spool = recebido.caminho if recebido else None
+            
             # Obter dados do formulário
-            mes_referencia = request.form.get('mes_referencia', '').strip()
-            ano_referencia = request.form.get('ano_referencia', '').strip()
-            valor_pago = request.form.get('valor_pago', '').strip()
-            data_pagamento_str = request.form.get('data_pagamento', '').strip()
-            observacoes = request.form.get('observacoes', '').strip()
+            mes_referencia = campos.get('mes_referencia', '').strip()
+            ano_referencia = campos.get('ano_referencia', '').strip()
+            valor_pago = campos.get('valor_pago', '').strip()
+            data_pagamento_str = campos.get('data_pagamento', '').strip()
+            observacoes = campos.get('observacoes', '').strip()
     
             # Validações
             erros = []
@@ -2546,28 +2679,9 @@ def upload_comprovante(aluno_id):
                 except ValueError:
                     erros.append('Data do pagamento inválida.')
             
-            # Validar arquivo
-            if 'comprovante' not in request.files:
+            # Arquivo (formato e tamanho já conferidos durante a leitura)
+            if recebido is None:
                 erros.append('Comprovante é obrigatório.')
-            else:
-                arquivo = request.files['comprovante']
-                if arquivo.filename == '':
-                    erros.append('Comprovante é obrigatório.')
-                else:
-                    # Validar extensão
-                    extensoes_permitidas = {'.png', '.jpg', '.jpeg', '.gif', '.pdf', '.webp'}
-                    nome_arquivo = secure_filename(arquivo.filename)
-                    _, ext = os.path.splitext(nome_arquivo.lower())
-                    
-                    if ext not in extensoes_permitidas:
-                        erros.append(f'Formato de arquivo não permitido. Use: {", ".join(extensoes_permitidas)}')
-                    
-                    # Validar tamanho (10MB)
-                    arquivo.seek(0, os.SEEK_END)
-                    tamanho = arquivo.tell()
-                    arquivo.seek(0)
-                    if tamanho > 10 * 1024 * 1024:  # 10MB
-                        erros.append('Arquivo muito grande. Tamanho máximo: 10MB')
             
             if erros:
                 for erro in erros:
@@ -2586,40 +2700,29 @@ def upload_comprovante(aluno_id):
                 flash(f'Já existe um pagamento aprovado para {mes_referencia}/{ano_referencia}.', 'error')
                 return render_template('upload_comprovante.html', aluno=aluno)
             
-            # Fazer upload para Cloudinary
-            try:
-                arquivo.seek(0)  # Garantir que está no início
-                resultado = cloudinary.uploader.upload(
-                    arquivo,
-                    folder=f'comprovantes/{aluno_id}',
-                    resource_type='auto',
-                    allowed_formats=['png', 'jpg', 'jpeg', 'gif', 'pdf', 'webp']
-                )
-                
-                url_comprovante = resultado.get('secure_url')
-                public_id = resultado.get('public_id')
-                
-            except Exception as e:
-                flash(f'Erro ao fazer upload do comprovante: {str(e)}', 'error')
-                return render_template('upload_comprovante.html', aluno=aluno)
-            
-            # Criar registro de pagamento
+            # Criar registro de pagamento e gravar o arquivo no spool (envio em segundo plano)
             pagamento = Pagamento(
-                    aluno_id=aluno_id,
+                aluno_id=aluno_id,
                 mes_referencia=mes_referencia,
                 ano_referencia=ano_referencia,
                 valor_pago=valor_pago,
                 data_pagamento=data_pagamento,
-                url_comprovante=url_comprovante,
-                public_id=public_id,
-                observacoes=observacoes if observacoes else None,
-                status='pendente'
+                observacoes=observacoes if observacoes else None
             )
+            novo_pagamento = pagamento
+            pagamento, caminho_spool = receber_comprovante(novo_pagamento, recebido)
+            if pagamento is not novo_pagamento:
+                flash(f'Este comprovante já foi enviado para {mes_referencia}/{ano_referencia} '
+                      f'(pagamento {pagamento.get_status_label().lower()}).', 'info')
+                return redirect(url_for('main.listar_pagamentos_aluno', aluno_id=aluno_id))
             
-            db.session.add(pagamento)
             db.session.commit()
-            
-            flash('Comprovante enviado com sucesso! Aguardando aprovação do administrador.', 'success')
+            if caminho_spool:
+                caminho_spool = None  # pagamento gravado: o arquivo fica no spool até o envio
+                agendar_envio(pagamento.id)
+                flash('Comprovante recebido! O envio termina em instantes e depois aguarda aprovação do administrador.', 'success')
+            else:
+                flash('Comprovante enviado com sucesso! Aguardando aprovação do administrador.', 'success')
             return redirect(url_for('main.listar_pagamentos_aluno', aluno_id=aluno_id))
             
         except Exception as e:
@@ -2628,6 +2731,10 @@ def upload_comprovante(aluno_id):
             print(f"Erro ao processar upload: {traceback.format_exc()}")
             flash(f'Erro ao processar upload: {str(e)}', 'error')
             return render_template('upload_comprovante.html', aluno=aluno)
+        finally:
+            # Arquivo recebido que não virou envio (validação, duplicado, erro)
+            if caminho_spool:
+                descartar_spool(caminho_spool)
     
     # GET - mostrar formulário
     return render_template('upload_comprovante.html', aluno=aluno)
@@ -2795,22 +2902,39 @@ def rejeitar_pagamento(pagamento_id):
     
     return redirect(url_for('main.listar_pagamentos'))
 
+@bp.route('/pagamentos/<int:pagamento_id>/reenviar', methods=['POST'])
+@admin_required
+def reenviar_pagamento(pagamento_id):
+    """Reenviar ao armazenamento o comprovante de um pagamento com falha no envio"""
+    from app.services.upload_service import reenviar_comprovante, agendar_envio, UploadInvalido
+    pagamento = Pagamento.query.get_or_404(pagamento_id)
+    
+    try:
+        reenviar_comprovante(pagamento)
+        db.session.commit()
+        agendar_envio(pagamento.id)
+        flash('Envio do comprovante reiniciado. Em instantes ele fica aguardando aprovação.', 'success')
+    except UploadInvalido as e:
+        db.session.rollback()
+        flash(str(e), 'error')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao reenviar comprovante: {str(e)}', 'error')
+    
+    return redirect(url_for('main.listar_pagamentos'))
+
 @bp.route('/pagamentos/<int:pagamento_id>/deletar', methods=['POST'])
 @admin_required
 def deletar_pagamento(pagamento_id):
     """Deletar um pagamento e seu comprovante"""
+    from app.services.upload_service import descartar_spool_pagamento
     pagamento = Pagamento.query.get_or_404(pagamento_id)
     
-    # Deletar arquivo do Cloudinary se existir
-    if pagamento.public_id:
-        try:
-            import cloudinary.uploader
-            cloudinary.uploader.destroy(pagamento.public_id)
-        except Exception as e:
-            print(f"Erro ao deletar arquivo do Cloudinary: {e}")
-            # Continuar mesmo se houver erro ao deletar o arquivo
-    
+    # O comprovante e a miniatura ficam no armazenamento até a limpeza de órfãos
+    # (limpar_comprovantes_orfaos.py): apagar aqui colocaria chamadas remotas na requisição.
+    # Um arquivo que não chegou a ser enviado (falha no envio) sai do spool local.
     try:
+        descartar_spool_pagamento(pagamento)
         db.session.delete(pagamento)
         db.session.commit()
         flash('Pagamento deletado com sucesso!', 'success')
@@ -2820,6 +2944,27 @@ def deletar_pagamento(pagamento_id):
     
     return redirect(url_for('main.listar_pagamentos'))
 
+@bp.route('/armazenamento/<path:chave>')
+def servir_objeto_armazenado(chave):
+    """
+    Serve um comprovante guardado no disco local (ARMAZENAMENTO_BACKEND 'local' ou 'fake')
+    
+    Como as URLs do Cloudinary/S3, é pública: a chave tem um trecho aleatório não adivinhável.
+    """
+    from app.services.armazenamento_service import obter_armazenamento, tipo_conteudo, ObjetoNaoEncontrado
+    
+    armazenamento = obter_armazenamento()
+    if armazenamento.nome not in ('local', 'fake'):
+        return jsonify({'error': 'Arquivo não encontrado'}), 404
+    try:
+        blocos = armazenamento.get(chave)
+    except (ObjetoNaoEncontrado, ValueError):
+        return jsonify({'error': 'Arquivo não encontrado'}), 404
+    
+    response = Response(blocos, mimetype=tipo_conteudo(chave))
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
 # ==================== ROTAS DE NOTIFICAÇÕES WHATSAPP ====================
 
 @bp.route('/notificacoes/enviar-vencimentos', methods=['POST'])
@@ -2880,7 +3025,6 @@ def testar_notificacao_whatsapp():
         from app.services.whatsapp_service import WhatsAppService
     except ImportError as e:
         flash(f'Erro ao importar serviço WhatsApp: {str(e)}. Verifique se o twilio está instalado (pip install twilio).', 'error')
-        import traceback
         traceback.print_exc()
         # Preparar informações básicas para o template mesmo com erro
         config_info = {
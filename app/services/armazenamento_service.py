@@ -0,0 +1,490 @@
+"""
+Armazenamento de objetos dos comprovantes (disco local, S3 compatível, Cloudinary)
+
+Todos os backends têm a mesma interface, com leitura e escrita em blocos (o arquivo nunca é
+carregado inteiro na memória):
+
+- put(chave, arquivo, tipo): grava o conteúdo de um arquivo aberto e retorna
+  ObjetoArmazenado(chave, url, tamanho); a chave retornada é a gravada em Pagamento.public_id
+- get(chave): iterador de blocos de bytes do objeto
+- delete(chave): remove o objeto (não falha se ele não existir)
+- url(chave): URL pública do objeto
+- listar(prefixo): iterador de ObjetoListado(chave, tamanho, modificado) das chaves com o
+  prefixo, lido em páginas (modificado é um datetime em UTC)
+- delete_lote(chaves): remove várias chaves com o mínimo de chamadas ao serviço
+- metadados(chave): ObjetoArmazenado de um objeto existente (ObjetoNaoEncontrado se não existir)
+- ler_inicio(chave, tamanho): primeiros bytes do objeto (conferência do formato)
+- assinar_envio(chave, tipo, tamanho_maximo, expiracao): destino assinado para o navegador enviar
+  o arquivo direto ao armazenamento (EnvioAssinado com url e campos do formulário), só nos
+  backends com suporta_envio_direto ('s3' e 'cloudinary')
+
+O backend é escolhido por ARMAZENAMENTO_BACKEND no config.py:
+- 'local': diretório ARMAZENAMENTO_LOCAL_DIR, servido pela rota /armazenamento/<chave>
+- 's3': bucket S3 ou compatível (MinIO, R2...), precisa do boto3 (listado no requirements.txt)
+- 'cloudinary': padrão
+- 'fake': em memória, com latência e falhas simuladas (testes de carga sem rede)
+"""
+import os
+import random
+import mimetypes
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from flask import current_app
+
+TAMANHO_BLOCO = 64 * 1024  # 64KB
+
+ObjetoArmazenado = namedtuple('ObjetoArmazenado', ['chave', 'url', 'tamanho'])
+EnvioAssinado = namedtuple('EnvioAssinado', ['chave', 'url', 'campos'])
+ObjetoListado = namedtuple('ObjetoListado', ['chave', 'tamanho', 'modificado'])
+
+
+class ObjetoNaoEncontrado(Exception):
+    """O objeto não existe no armazenamento"""
+
+
+def _ler_blocos(arquivo):
+    while True:
+        bloco = arquivo.read(TAMANHO_BLOCO)
+        if not bloco:
+            return
+        yield bloco
+
+
+def tipo_conteudo(chave, tipo=None):
+    """Content-Type do objeto (informado ou deduzido da extensão da chave)"""
+    return tipo or mimetypes.guess_type(chave)[0] or 'application/octet-stream'
+
+
+class Armazenamento:
+    """Interface comum dos backends"""
+    nome = None
+    suporta_envio_direto = False
+
+    def __init__(self, config):
+        self.config = config
+
+    def verificar(self):
+        """Mensagem de erro de configuração, ou None se o backend puder ser usado"""
+        return None
+
+    def put(self, chave, arquivo, tipo=None):
+        raise NotImplementedError
+
+    def get(self, chave):
+        raise NotImplementedError
+
+    def delete(self, chave):
+        raise NotImplementedError
+
+    def url(self, chave):
+        raise NotImplementedError
+
+    def metadados(self, chave):
+        raise NotImplementedError
+
+    def ler_inicio(self, chave, tamanho):
+        blocos = self.get(chave)
+        try:
+            inicio = b''
+            for bloco in blocos:
+                inicio += bloco
+                if len(inicio) >= tamanho:
+                    break
+            return inicio[:tamanho]
+        finally:
+            if hasattr(blocos, 'close'):
+                blocos.close()
+
+    def assinar_envio(self, chave, tipo, tamanho_maximo, expiracao):
+        raise NotImplementedError(f'O armazenamento {self.nome} não permite envio direto')
+
+    def listar(self, prefixo):
+        raise NotImplementedError
+
+    def delete_lote(self, chaves):
+        for chave in chaves:
+            self.delete(chave)
+
+
+# ==================== DISCO LOCAL ====================
+
+class ArmazenamentoLocal(Armazenamento):
+    nome = 'local'
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.diretorio = os.path.abspath(config['ARMAZENAMENTO_LOCAL_DIR'])
+        self.url_base = config.get('ARMAZENAMENTO_LOCAL_URL', '/armazenamento/')
+
+    def _caminho(self, chave):
+        caminho = os.path.abspath(os.path.join(self.diretorio, chave))
+        # Impedir chaves com '..' que saiam do diretório
+        if not caminho.startswith(self.diretorio + os.sep):
+            raise ValueError(f'Chave inválida: {chave}')
+        return caminho
+
+    def put(self, chave, arquivo, tipo=None):
+        caminho = self._caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f'{caminho}.parcial'
+        tamanho = 0
+        try:
+            with open(temporario, 'wb') as destino:
+                for bloco in _ler_blocos(arquivo):
+                    destino.write(bloco)
+                    tamanho += len(bloco)
+            os.replace(temporario, caminho)  # o objeto só aparece completo
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        return ObjetoArmazenado(chave, self.url(chave), tamanho)
+
+    def get(self, chave):
+        caminho = self._caminho(chave)
+        if not os.path.isfile(caminho):
+            raise ObjetoNaoEncontrado(chave)
+
+        def blocos():
+            with open(caminho, 'rb') as origem:
+                yield from _ler_blocos(origem)
+        return blocos()
+
+    def delete(self, chave):
+        try:
+            os.remove(self._caminho(chave))
+        except FileNotFoundError:
+            pass
+
+    def url(self, chave):
+        return f'{self.url_base}{chave}'
+
+    def metadados(self, chave):
+        caminho = self._caminho(chave)
+        if not os.path.isfile(caminho):
+            raise ObjetoNaoEncontrado(chave)
+        return ObjetoArmazenado(chave, self.url(chave), os.path.getsize(caminho))
+
+    def listar(self, prefixo):
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in sorted(arquivos):
+                caminho = os.path.join(raiz, nome)
+                chave = os.path.relpath(caminho, self.diretorio).replace(os.sep, '/')
+                if not chave.startswith(prefixo) or chave.endswith('.parcial'):
+                    continue
+                try:
+                    info = os.stat(caminho)
+                except FileNotFoundError:
+                    continue  # removido durante a listagem
+                yield ObjetoListado(chave, info.st_size, datetime.fromtimestamp(info.st_mtime, timezone.utc))
+
+
+# ==================== S3 COMPATÍVEL ====================
+
+class ArmazenamentoS3(Armazenamento):
+    nome = 's3'
+    suporta_envio_direto = True
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.bucket = config.get('ARMAZENAMENTO_S3_BUCKET')
+        self._cliente = None
+
+    def verificar(self):
+        try:
+            import boto3  # noqa: F401
+        except ImportError:
+            return 'boto3 não está instalado (necessário para ARMAZENAMENTO_BACKEND=s3)'
+        if not self.bucket:
+            return 'ARMAZENAMENTO_S3_BUCKET não configurado'
+        return None
+
+    @property
+    def cliente(self):
+        if self._cliente is None:
+            import boto3
+            self._cliente = boto3.client(
+                's3',
+                endpoint_url=self.config.get('ARMAZENAMENTO_S3_ENDPOINT') or None,
+                region_name=self.config.get('ARMAZENAMENTO_S3_REGIAO') or None,
+                aws_access_key_id=self.config.get('ARMAZENAMENTO_S3_ACCESS_KEY') or None,
+                aws_secret_access_key=self.config.get('ARMAZENAMENTO_S3_SECRET_KEY') or None,
+            )
+        return self._cliente
+
+    def put(self, chave, arquivo, tipo=None):
+        # upload_fileobj envia em partes (multipart) lendo o arquivo aos poucos
+        self.cliente.upload_fileobj(
+            arquivo, self.bucket, chave,
+            ExtraArgs={'ContentType': tipo_conteudo(chave, tipo)}
+        )
+        tamanho = self.cliente.head_object(Bucket=self.bucket, Key=chave)['ContentLength']
+        return ObjetoArmazenado(chave, self.url(chave), tamanho)
+
+    def _obter(self, chave, **parametros):
+        from botocore.exceptions import ClientError
+        try:
+            return self.cliente.get_object(Bucket=self.bucket, Key=chave, **parametros)['Body']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                raise ObjetoNaoEncontrado(chave)
+            raise
+
+    def get(self, chave):
+        return self._obter(chave).iter_chunks(TAMANHO_BLOCO)
+
+    def ler_inicio(self, chave, tamanho):
+        corpo = self._obter(chave, Range=f'bytes=0-{tamanho - 1}')
+        try:
+            return corpo.read()
+        finally:
+            corpo.close()
+
+    def metadados(self, chave):
+        from botocore.exceptions import ClientError
+        try:
+            resposta = self.cliente.head_object(Bucket=self.bucket, Key=chave)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                raise ObjetoNaoEncontrado(chave)
+            raise
+        return ObjetoArmazenado(chave, self.url(chave), resposta['ContentLength'])
+
+    def assinar_envio(self, chave, tipo, tamanho_maximo, expiracao):
+        # POST assinado: o S3 recusa outra chave, outro Content-Type ou arquivo acima do máximo
+        assinado = self.cliente.generate_presigned_post(
+            self.bucket, chave,
+            Fields={'Content-Type': tipo},
+            Conditions=[{'Content-Type': tipo}, ['content-length-range', 1, tamanho_maximo]],
+            ExpiresIn=expiracao
+        )
+        return EnvioAssinado(chave, assinado['url'], assinado['fields'])
+
+    def listar(self, prefixo):
+        paginas = self.cliente.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefixo)
+        for pagina in paginas:
+            for item in pagina.get('Contents', []):
+                yield ObjetoListado(item['Key'], item['Size'], item['LastModified'])
+
+    def delete_lote(self, chaves):
+        # DeleteObjects remove até 1000 chaves por chamada
+        for inicio in range(0, len(chaves), 1000):
+            resposta = self.cliente.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': chave} for chave in chaves[inicio:inicio + 1000]], 'Quiet': True}
+            )
+            if resposta.get('Errors'):
+                erro = resposta['Errors'][0]
+                raise RuntimeError(f"{len(resposta['Errors'])} objeto(s) não removido(s): {erro.get('Key')} ({erro.get('Message')})")
+
+    def delete(self, chave):
+        self.cliente.delete_object(Bucket=self.bucket, Key=chave)
+
+    def url(self, chave):
+        url_publica = self.config.get('ARMAZENAMENTO_S3_URL_PUBLICA')
+        if url_publica:
+            return f"{url_publica.rstrip('/')}/{chave}"
+        endpoint = self.config.get('ARMAZENAMENTO_S3_ENDPOINT')
+        if endpoint:
+            return f"{endpoint.rstrip('/')}/{self.bucket}/{chave}"
+        return f'https://{self.bucket}.s3.amazonaws.com/{chave}'
+
+
+# ==================== CLOUDINARY ====================
+
+class ArmazenamentoCloudinary(Armazenamento):
+    nome = 'cloudinary'
+    suporta_envio_direto = True
+    FORMATOS_PERMITIDOS = ['png', 'jpg', 'jpeg', 'gif', 'pdf', 'webp']
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._configurado = False
+
+    def verificar(self):
+        if not self.config.get('CLOUDINARY_API_KEY') or not self.config.get('CLOUDINARY_API_SECRET'):
+            return 'Credenciais do Cloudinary não configuradas'
+        return None
+
+    def _configurar(self):
+        import cloudinary
+        if not self._configurado:
+            cloudinary.config(
+                cloud_name=self.config.get('CLOUDINARY_CLOUD_NAME', ''),
+                api_key=self.config.get('CLOUDINARY_API_KEY', ''),
+                api_secret=self.config.get('CLOUDINARY_API_SECRET', ''),
+                secure=True
+            )
+            self._configurado = True
+
+    def put(self, chave, arquivo, tipo=None):
+        import cloudinary.uploader
+        self._configurar()
+        # No Cloudinary o public_id não leva extensão; a chave gravada é a retornada
+        resultado = cloudinary.uploader.upload(
+            arquivo,
+            public_id=os.path.splitext(chave)[0],
+            resource_type='auto',
+            allowed_formats=self.FORMATOS_PERMITIDOS
+        )
+        return ObjetoArmazenado(resultado.get('public_id'), resultado.get('secure_url'), resultado.get('bytes'))
+
+    def _recurso(self, chave):
+        import cloudinary.api
+        self._configurar()
+        try:
+            return cloudinary.api.resource(chave)
+        except cloudinary.api.NotFound:
+            raise ObjetoNaoEncontrado(chave)
+
+    def get(self, chave):
+        import urllib.request
+        recurso = self._recurso(chave)
+
+        def blocos():
+            with urllib.request.urlopen(recurso['secure_url'], timeout=30) as resposta:
+                yield from _ler_blocos(resposta)
+        return blocos()
+
+    def delete(self, chave):
+        import cloudinary.uploader
+        self._configurar()
+        cloudinary.uploader.destroy(chave)
+
+    def url(self, chave):
+        import cloudinary.utils
+        self._configurar()
+        return cloudinary.utils.cloudinary_url(chave, secure=True)[0]
+
+    def metadados(self, chave):
+        recurso = self._recurso(chave)
+        return ObjetoArmazenado(chave, recurso['secure_url'], recurso.get('bytes'))
+
+    def assinar_envio(self, chave, tipo, tamanho_maximo, expiracao):
+        # O Cloudinary aceita a assinatura por até 1 hora a partir do timestamp e não limita o
+        # tamanho: o tamanho e o formato são conferidos na conclusão do envio
+        import cloudinary.utils
+        self._configurar()
+        parametros = {
+            'public_id': os.path.splitext(chave)[0],
+            'timestamp': int(time.time()),
+            'allowed_formats': ','.join(self.FORMATOS_PERMITIDOS),
+        }
+        parametros['signature'] = cloudinary.utils.api_sign_request(
+            parametros, self.config.get('CLOUDINARY_API_SECRET', '')
+        )
+        parametros['api_key'] = self.config.get('CLOUDINARY_API_KEY', '')
+        url = cloudinary.utils.cloudinary_api_url('upload', resource_type='auto')
+        return EnvioAssinado(parametros['public_id'], url, parametros)
+
+    def listar(self, prefixo):
+        # resource_type 'auto' grava imagens e PDFs como 'image'
+        import cloudinary.api
+        self._configurar()
+        cursor = None
+        while True:
+            resposta = cloudinary.api.resources(
+                type='upload', prefix=prefixo, max_results=500, next_cursor=cursor
+            )
+            for recurso in resposta.get('resources', []):
+                modificado = datetime.fromisoformat(recurso['created_at'].replace('Z', '+00:00'))
+                yield ObjetoListado(recurso['public_id'], recurso.get('bytes'), modificado)
+            cursor = resposta.get('next_cursor')
+            if not cursor:
+                return
+
+    def delete_lote(self, chaves):
+        # delete_resources remove até 100 public_ids por chamada
+        import cloudinary.api
+        self._configurar()
+        for inicio in range(0, len(chaves), 100):
+            cloudinary.api.delete_resources(chaves[inicio:inicio + 100])
+
+
+# ==================== FAKE (TESTES) ====================
+
+class ArmazenamentoFake(Armazenamento):
+    """Guarda os objetos em memória; ARMAZENAMENTO_FAKE_LATENCIA e ARMAZENAMENTO_FAKE_FALHAS simulam a rede"""
+    nome = 'fake'
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.objetos = {}
+        self.modificados = {}
+        self._lock = threading.Lock()
+
+    def _simular_rede(self):
+        time.sleep(self.config.get('ARMAZENAMENTO_FAKE_LATENCIA', 0))
+        if random.random() < self.config.get('ARMAZENAMENTO_FAKE_FALHAS', 0):
+            raise ConnectionError('Falha simulada do armazenamento fake')
+
+    def put(self, chave, arquivo, tipo=None):
+        self._simular_rede()
+        conteudo = b''.join(_ler_blocos(arquivo))
+        with self._lock:
+            self.objetos[chave] = conteudo
+            self.modificados[chave] = datetime.now(timezone.utc)
+        return ObjetoArmazenado(chave, self.url(chave), len(conteudo))
+
+    def get(self, chave):
+        with self._lock:
+            if chave not in self.objetos:
+                raise ObjetoNaoEncontrado(chave)
+            conteudo = self.objetos[chave]
+        return iter([conteudo[i:i + TAMANHO_BLOCO] for i in range(0, len(conteudo), TAMANHO_BLOCO)])
+
+    def delete(self, chave):
+        self._simular_rede()
+        with self._lock:
+            self.objetos.pop(chave, None)
+            self.modificados.pop(chave, None)
+
+    def url(self, chave):
+        return f"{self.config.get('ARMAZENAMENTO_LOCAL_URL', '/armazenamento/')}{chave}"
+
+    def metadados(self, chave):
+        with self._lock:
+            if chave not in self.objetos:
+                raise ObjetoNaoEncontrado(chave)
+            return ObjetoArmazenado(chave, self.url(chave), len(self.objetos[chave]))
+
+    def listar(self, prefixo):
+        with self._lock:
+            objetos = [
+                ObjetoListado(chave, len(conteudo), self.modificados.get(chave))
+                for chave, conteudo in sorted(self.objetos.items()) if chave.startswith(prefixo)
+            ]
+        return iter(objetos)
+
+
+BACKENDS = {
+    'local': ArmazenamentoLocal,
+    's3': ArmazenamentoS3,
+    'cloudinary': ArmazenamentoCloudinary,
+    'fake': ArmazenamentoFake,
+}
+
+_lock = threading.Lock()
+_instancias = {}
+
+
+def obter_armazenamento(config=None):
+    """Backend configurado (uma instância por processo e por backend)"""
+    config = config or current_app.config
+    nome = config.get('ARMAZENAMENTO_BACKEND', 'cloudinary')
+    if nome not in BACKENDS:
+        raise ValueError(f"ARMAZENAMENTO_BACKEND inválido: {nome}. Use: {', '.join(BACKENDS)}")
+    with _lock:
+        if nome not in _instancias:
+            _instancias[nome] = BACKENDS[nome](config)
+        return _instancias[nome]
+
+
+def verificar_configuracao(config=None):
+    """Mensagem de erro de configuração do armazenamento, ou None se estiver tudo certo"""
+    try:
+        return obter_armazenamento(config).verificar()
+    except ValueError as e:
+        return str(e)
@@ -0,0 +1,90 @@
+"""
+Serviço do boletim de uma turma (professor + curso)
+
+Monta a matriz alunos × provas com as médias calculadas no banco: a nota de cada prova
+(média gravada dos critérios, ou o valor quando não há critérios), a média geral de cada aluno,
+a média da turma em cada prova e a média geral da turma saem de uma única consulta
+agrupada (UNION ALL de quatro agrupamentos sobre as notas da turma).
+"""
+from app.models.professor import db
+from app.models.aluno import Aluno
+from app.models.matricula import Matricula
+from app.models.nota import Nota, expressao_nota_final
+
+# Provas do curso (4 por ano, 8 no total)
+NUMERO_PROVAS = 8
+
+
+def _consulta_medias(professor_id, tipo_curso):
+    notas = db.select(
+        Nota.aluno_id.label('aluno_id'),
+        Nota.numero_prova.label('numero_prova'),
+        expressao_nota_final().label('media')
+    ).where(
+        Nota.professor_id == professor_id,
+        Nota.tipo_curso == tipo_curso,
+        Nota.numero_prova.isnot(None)
+    ).cte('notas_turma')
+
+    nenhum = db.cast(db.null(), db.Integer)
+    media = db.func.avg(notas.c.media)
+    return db.union_all(
+        # Nota de cada aluno em cada prova
+        db.select(notas.c.aluno_id, notas.c.numero_prova, media)
+        .group_by(notas.c.aluno_id, notas.c.numero_prova),
+        # Média geral de cada aluno
+        db.select(notas.c.aluno_id, nenhum, media).group_by(notas.c.aluno_id),
+        # Média da turma em cada prova
+        db.select(nenhum, notas.c.numero_prova, media).group_by(notas.c.numero_prova),
+        # Média geral da turma
+        db.select(nenhum, nenhum, media),
+    )
+
+
+def _arredondar(valor):
+    return round(float(valor), 2) if valor is not None else None
+
+
+def gerar_boletim(professor_id, tipo_curso):
+    """
+    Retorna o boletim da turma como dict pronto para JSON
+
+    Alunos listados: matriculados na turma (matrícula vigente) ou que já têm nota nela.
+    """
+    medias_aluno_prova = {}
+    medias_aluno = {}
+    medias_prova = {}
+    media_turma = None
+    for aluno_id, numero_prova, media in db.session.execute(_consulta_medias(professor_id, tipo_curso)):
+        if aluno_id is not None and numero_prova is not None:
+            medias_aluno_prova.setdefault(aluno_id, {})[numero_prova] = _arredondar(media)
+        elif aluno_id is not None:
+            medias_aluno[aluno_id] = _arredondar(media)
+        elif numero_prova is not None:
+            medias_prova[numero_prova] = _arredondar(media)
+        else:
+            media_turma = _arredondar(media)
+
+    matriculados = db.select(Matricula.aluno_id).where(
+        Matricula.professor_id == professor_id,
+        Matricula.tipo_curso == tipo_curso,
+        Matricula.vigente
+    )
+    alunos = db.session.query(Aluno.id, Aluno.nome).filter(
+        db.or_(Aluno.id.in_(matriculados), Aluno.id.in_(list(medias_aluno_prova)))
+    ).order_by(Aluno.nome).all()
+
+    provas = sorted(set(range(1, NUMERO_PROVAS + 1)) | set(medias_prova))
+    return {
+        'professor_id': professor_id,
+        'tipo_curso': tipo_curso,
+        'provas': provas,
+        'alunos': [{
+            'aluno_id': aluno_id,
+            'nome': nome,
+            'notas': {str(prova): medias_aluno_prova.get(aluno_id, {}).get(prova) for prova in provas},
+            'media': medias_aluno.get(aluno_id)
+        } for aluno_id, nome in alunos],
+        'medias_provas': {str(prova): medias_prova.get(prova) for prova in provas},
+        'media_turma': media_turma
+    }
@@ -0,0 +1,136 @@
+"""
+Serviço de estatísticas das notas (média, mediana, percentis e distribuição)
+
+As estatísticas são calculadas no banco, agrupadas por modalidade, turma ou prova, sem
+carregar as notas: no PostgreSQL com percentile_cont; nos outros bancos (SQLite) com
+funções de janela (posição de cada nota no grupo) e a mesma interpolação linear.
+"""
+from app.models.professor import db
+from app.models.nota import Nota, expressao_nota_final
+
+# Colunas de agrupamento de cada nível de relatório
+AGRUPAMENTOS = {
+    'modalidade': ['tipo_curso'],
+    'turma': ['professor_id', 'tipo_curso'],
+    'prova': ['professor_id', 'tipo_curso', 'numero_prova'],
+}
+
+PERCENTIS = [('p25', 0.25), ('mediana', 0.5), ('p75', 0.75), ('p90', 0.9)]
+
+# Faixas da distribuição: [inicio, fim), a última inclui o 10
+FAIXAS = [(0, 2), (2, 4), (4, 6), (6, 8), (8, None)]
+
+
+def _rotulo_faixa(inicio, fim):
+    return f'{inicio}-{fim}' if fim is not None else f'{inicio}-10'
+
+
+def _agregados_comuns(nota):
+    """Contagem, média, mínimo, máximo e contagem por faixa (iguais em todos os bancos)"""
+    colunas = [
+        db.func.count(nota).label('total'),
+        db.func.avg(nota).label('media'),
+        db.func.min(nota).label('minimo'),
+        db.func.max(nota).label('maximo'),
+    ]
+    for inicio, fim in FAIXAS:
+        condicao = nota >= inicio if fim is None else db.and_(nota >= inicio, nota < fim)
+        colunas.append(db.func.sum(db.case((condicao, 1), else_=0)).label(_rotulo_faixa(inicio, fim)))
+    return colunas
+
+
+def _consulta_postgresql(colunas_grupo, filtros):
+    nota = expressao_nota_final()
+    percentis = [
+        db.func.percentile_cont(fracao).within_group(nota).label(nome)
+        for nome, fracao in PERCENTIS
+    ]
+    return db.select(*colunas_grupo, *_agregados_comuns(nota), *percentis).where(
+        *filtros
+    ).group_by(*colunas_grupo).order_by(*colunas_grupo)
+
+
+def _consulta_janela(colunas_grupo, filtros):
+    """
+    Percentis com funções de janela: numera as notas de cada grupo e interpola entre as
+    posições k e k+1, onde k = parte inteira de 1 + p * (total - 1) (mesma definição do
+    percentile_cont)
+    """
+    nota = expressao_nota_final()
+    base = db.select(
+        *colunas_grupo,
+        nota.label('nota'),
+        db.func.row_number().over(partition_by=colunas_grupo, order_by=nota).label('posicao'),
+        db.func.count().over(partition_by=colunas_grupo).label('quantidade')
+    ).where(*filtros).subquery()
+
+    grupo = [base.c[coluna.key] for coluna in colunas_grupo]
+    percentis = []
+    for nome, fracao in PERCENTIS:
+        posicao = 1 + fracao * (base.c.quantidade - 1)
+        k = db.cast(posicao, db.Integer)
+        inferior = db.func.max(db.case((base.c.posicao == k, base.c.nota)))
+        superior = db.func.max(db.case((base.c.posicao == k + 1, base.c.nota)))
+        fracao_k = db.func.max(posicao - k)
+        percentis.append(
+            (inferior + fracao_k * (db.func.coalesce(superior, inferior) - inferior)).label(nome)
+        )
+
+    return db.select(*grupo, *_agregados_comuns(base.c.nota), *percentis).group_by(
+        *grupo
+    ).order_by(*grupo)
+
+
+def _arredondar(valor):
+    return round(float(valor), 2) if valor is not None else None
+
+
+def calcular_estatisticas(agrupar='turma', professor_id=None, tipo_curso=None, numero_prova=None,
+                          data_inicio=None, data_fim=None):
+    """
+    Retorna uma lista de grupos com total, média, mínimo, máximo, percentis e distribuição
+
+    Args:
+        agrupar: 'modalidade', 'turma' ou 'prova' (ver AGRUPAMENTOS)
+        professor_id, tipo_curso, numero_prova: filtros opcionais
+        data_inicio, data_fim: período de data_avaliacao (inclusive)
+    """
+    if agrupar not in AGRUPAMENTOS:
+        raise ValueError(f"Agrupamento inválido. Use: {', '.join(AGRUPAMENTOS)}")
+
+    colunas_grupo = [getattr(Nota, coluna) for coluna in AGRUPAMENTOS[agrupar]]
+    filtros = [expressao_nota_final().isnot(None)]
+    if agrupar == 'prova':
+        filtros.append(Nota.numero_prova.isnot(None))
+    if professor_id:
+        filtros.append(Nota.professor_id == professor_id)
+    if tipo_curso:
+        filtros.append(Nota.tipo_curso == tipo_curso)
+    if numero_prova:
+        filtros.append(Nota.numero_prova == numero_prova)
+    if data_inicio:
+        filtros.append(Nota.data_avaliacao >= data_inicio)
+    if data_fim:
+        filtros.append(Nota.data_avaliacao <= data_fim)
+
+    if db.engine.dialect.name == 'postgresql':
+        consulta = _consulta_postgresql(colunas_grupo, filtros)
+    else:
+        consulta = _consulta_janela(colunas_grupo, filtros)
+
+    resultado = []
+    for linha in db.session.execute(consulta).mappings():
+        grupo = {coluna.key: linha[coluna.key] for coluna in colunas_grupo}
+        grupo.update({
+            'total': linha['total'],
+            'media': _arredondar(linha['media']),
+            'minimo': _arredondar(linha['minimo']),
+            'maximo': _arredondar(linha['maximo']),
+            'percentis': {nome: _arredondar(linha[nome]) for nome, _ in PERCENTIS},
+            'distribuicao': {
+                _rotulo_faixa(inicio, fim): int(linha[_rotulo_faixa(inicio, fim)] or 0)
+                for inicio, fim in FAIXAS
+            }
+        })
+        resultado.append(grupo)
+    return resultado
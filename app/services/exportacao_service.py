@@ -0,0 +1,206 @@
+"""
+Serviço de exportação de dados em CSV/XLSX via streaming
+
+Os geradores recebem um iterável de linhas (normalmente uma query com
+yield_per) e devolvem blocos de bytes à medida que as linhas chegam, sem
+montar o arquivo inteiro em memória.
+"""
+import csv
+import io
+import itertools
+import traceback
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+# Quantidade de linhas acumuladas antes de devolver um bloco ao cliente
+LINHAS_POR_BLOCO = 500
+
+FORMATOS_EXPORTACAO = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+
+def iniciar_consulta(query, tamanho_bloco=LINHAS_POR_BLOCO):
+    """
+    Executa a query e lê a primeira linha antes de a resposta começar
+
+    Erros de SQL aparecem aqui, quando ainda dá para responder com um status de erro; depois
+    que o streaming começa o status 200 já foi enviado. Retorna um iterador com todas as linhas.
+    """
+    linhas = iter(query.yield_per(tamanho_bloco))
+    primeira = next(linhas, None)
+    if primeira is None:
+        return iter(())
+    return itertools.chain([primeira], linhas)
+
+
+def registrar_erros(gerador, descricao):
+    """
+    Repassa os blocos do gerador e registra no log um erro no meio do streaming
+
+    O erro é relançado: o servidor interrompe a resposta sem o bloco final, e o cliente vê um
+    download incompleto em vez de um arquivo truncado que parece completo.
+    """
+    try:
+        yield from gerador
+    except Exception as e:
+        print(f"❌ Erro durante a exportação de {descricao}: {e}")
+        print(traceback.format_exc())
+        raise
+
+
+def _formatar_valor(valor):
+    """Converte um valor Python para o texto usado na exportação"""
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return 'Sim' if valor else 'Não'
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+
+def gerar_csv(colunas, linhas):
+    """
+    Gera um CSV em blocos de bytes
+
+    Usa ';' como separador e BOM UTF-8 para abrir corretamente no Excel em português.
+
+    Args:
+        colunas: Lista com os títulos das colunas
+        linhas: Iterável de tuplas/listas com os valores de cada linha
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+
+    writer.writerow(colunas)
+    yield ('﻿' + buffer.getvalue()).encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate(0)
+
+    contador = 0
+    for linha in linhas:
+        writer.writerow([_formatar_valor(v) for v in linha])
+        contador += 1
+        if contador >= LINHAS_POR_BLOCO:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+            contador = 0
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _SaidaStreaming:
+    """Destino não-pesquisável para o ZipFile; acumula bytes até serem consumidos"""
+
+    def __init__(self):
+        self._blocos = []
+
+    def write(self, dados):
+        self._blocos.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def consumir(self):
+        dados = b''.join(self._blocos)
+        self._blocos = []
+        return dados
+
+
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{nome}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+
+def _celula_xlsx(valor):
+    """Monta o XML de uma célula (número ou texto inline)"""
+    valor = _formatar_valor(valor)
+    if isinstance(valor, (int, float)):
+        return f'<c t="n"><v>{valor}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(valor))}</t></is></c>'
+
+
+def _linha_xlsx(valores):
+    return '<row>' + ''.join(_celula_xlsx(v) for v in valores) + '</row>'
+
+
+def gerar_xlsx(colunas, linhas, nome_planilha='Dados'):
+    """
+    Gera um XLSX em blocos de bytes
+
+    A planilha é escrita diretamente no ZIP em modo streaming (strings inline,
+    sem sharedStrings), então não depende de openpyxl nem guarda as linhas em memória.
+
+    Args:
+        colunas: Lista com os títulos das colunas
+        linhas: Iterável de tuplas/listas com os valores de cada linha
+        nome_planilha: Nome da aba no arquivo
+    """
+    saida = _SaidaStreaming()
+    with zipfile.ZipFile(saida, mode='w', compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+        arquivo_zip.writestr('[Content_Types].xml', _CONTENT_TYPES_XML)
+        arquivo_zip.writestr('_rels/.rels', _RELS_XML)
+        arquivo_zip.writestr('xl/workbook.xml', _WORKBOOK_XML.format(nome=escape(nome_planilha[:31])))
+        arquivo_zip.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS_XML)
+        yield saida.consumir()
+
+        with arquivo_zip.open('xl/worksheets/sheet1.xml', mode='w', force_zip64=True) as planilha:
+            planilha.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>' + _linha_xlsx(colunas)
+            ).encode('utf-8'))
+
+            partes = []
+            for linha in linhas:
+                partes.append(_linha_xlsx(linha))
+                if len(partes) >= LINHAS_POR_BLOCO:
+                    planilha.write(''.join(partes).encode('utf-8'))
+                    partes = []
+                    dados = saida.consumir()
+                    if dados:
+                        yield dados
+
+            planilha.write((''.join(partes) + '</sheetData></worksheet>').encode('utf-8'))
+
+    yield saida.consumir()
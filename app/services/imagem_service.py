@@ -0,0 +1,171 @@
+"""
+Otimização das imagens dos comprovantes (redução, reencode e miniatura)
+
+Fotos de celular chegam com 4–8MB. Antes do envio ao armazenamento, cada imagem é:
+- girada conforme a orientação do EXIF e gravada sem metadados (EXIF, GPS, perfil ICC)
+- reduzida para no máximo IMAGEM_DIMENSAO_MAXIMA px no maior lado
+- recodificada em IMAGEM_FORMATO ('webp' ou 'jpeg') com IMAGEM_QUALIDADE
+- acompanhada de uma miniatura de IMAGEM_DIMENSAO_MINIATURA px
+
+Comprovantes já armazenados sem miniatura (envio direto, anteriores à miniatura) ganham só a
+miniatura (miniatura_comprovante, ver preview_service.py).
+
+O processamento usa CPU, então roda num pool de processos (IMAGEM_PROCESSOS), chamado pelos
+workers de envio e nunca pela thread da requisição. PDFs passam sem alteração. O Pillow está no
+requirements.txt; se faltar (ambiente montado à mão) ou a imagem não puder ser lida, o arquivo
+original é enviado.
+"""
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+EXTENSOES_IMAGEM = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+FORMATOS = {'webp': ('WEBP', '.webp'), 'jpeg': ('JPEG', '.jpg')}
+
+_lock = threading.Lock()
+_pool = None
+
+
+def pil_disponivel():
+    try:
+        import PIL  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _preparar(imagem, formato):
+    """Imagem em modo gravável no formato (JPEG não tem transparência: fundo branco)"""
+    from PIL import Image
+    transparente = imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info)
+    if not transparente:
+        return imagem.convert('RGB')
+    imagem = imagem.convert('RGBA')
+    if formato == 'WEBP':
+        return imagem
+    fundo = Image.new('RGB', imagem.size, (255, 255, 255))
+    fundo.paste(imagem, mask=imagem.getchannel('A'))
+    return fundo
+
+
+def otimizar_imagem(origem, destino_base, dimensao_maxima, formato, qualidade, dimensao_miniatura):
+    """
+    Executada no processo do pool: grava <destino_base>-otimizada<ext> e
+    <destino_base>-miniatura<ext> e retorna os dois caminhos
+    """
+    from PIL import Image, ImageOps
+    formato_pil, ext = FORMATOS[formato]
+
+    with Image.open(origem) as original:
+        original.seek(0)  # GIF animado: só o primeiro quadro
+        imagem = ImageOps.exif_transpose(original)
+        imagem = _preparar(imagem, formato_pil)
+
+    # Os metadados não são copiados: o save só grava EXIF/ICC quando recebe exif=/icc_profile=
+    imagem.info = {}
+    imagem.thumbnail((dimensao_maxima, dimensao_maxima), Image.LANCZOS)
+    caminho = f'{destino_base}-otimizada{ext}'
+    imagem.save(caminho, formato_pil, quality=qualidade, optimize=True)
+
+    imagem.thumbnail((dimensao_miniatura, dimensao_miniatura), Image.LANCZOS)
+    caminho_miniatura = f'{destino_base}-miniatura{ext}'
+    imagem.save(caminho_miniatura, formato_pil, quality=qualidade, optimize=True)
+    return caminho, caminho_miniatura
+
+
+def criar_miniatura(origem, destino_base, dimensao_miniatura, formato, qualidade):
+    """Executada no processo do pool: grava só <destino_base>-miniatura<ext> e retorna o caminho"""
+    from PIL import Image, ImageOps
+    formato_pil, ext = FORMATOS[formato]
+
+    with Image.open(origem) as original:
+        original.seek(0)
+        original.draft('RGB', (dimensao_miniatura, dimensao_miniatura))  # JPEG: decodifica já reduzido
+        imagem = ImageOps.exif_transpose(original)
+        imagem = _preparar(imagem, formato_pil)
+
+    imagem.info = {}
+    imagem.thumbnail((dimensao_miniatura, dimensao_miniatura), Image.LANCZOS)
+    caminho = f'{destino_base}-miniatura{ext}'
+    imagem.save(caminho, formato_pil, quality=qualidade, optimize=True)
+    return caminho
+
+
+def _obter_pool(config):
+    global _pool
+    with _lock:
+        if _pool is None:
+            # 'spawn': o processo do servidor tem várias threads, e fork com threads pode travar
+            _pool = ProcessPoolExecutor(
+                max_workers=config.get('IMAGEM_PROCESSOS', 1),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _descartar_pool():
+    """Um processo do pool morreu (ex.: falta de memória): o próximo uso cria outro pool"""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _formato(config):
+    formato = config.get('IMAGEM_FORMATO', 'webp')
+    if formato not in FORMATOS:
+        print(f"⚠️  IMAGEM_FORMATO inválido: {formato}. Usando webp")
+        formato = 'webp'
+    return formato
+
+
+def _executar_no_pool(config, caminho, funcao, *argumentos):
+    """Executa funcao no pool de processos; None (com aviso) se falhar"""
+    try:
+        futuro = _obter_pool(config).submit(funcao, *argumentos)
+        return futuro.result(timeout=config.get('IMAGEM_TIMEOUT', 60))
+    except BrokenProcessPool as e:
+        _descartar_pool()
+        print(f"⚠️  Pool de processos de imagem reiniciado ({os.path.basename(caminho)}): {e}")
+        return None
+    except Exception as e:
+        print(f"⚠️  Não foi possível processar a imagem {os.path.basename(caminho)}: {e}")
+        return None
+
+
+def otimizar_comprovante(config, caminho):
+    """
+    Otimiza o comprovante no pool de processos
+
+    Retorna (caminho_otimizado, caminho_miniatura), ou None quando o arquivo deve ser
+    enviado como está (PDF, Pillow ausente, imagem ilegível, IMAGEM_OTIMIZAR desligado).
+    """
+    if not config.get('IMAGEM_OTIMIZAR', True):
+        return None
+    base, ext = os.path.splitext(caminho)
+    if ext.lower() not in EXTENSOES_IMAGEM or not pil_disponivel():
+        return None
+
+    return _executar_no_pool(
+        config, caminho, otimizar_imagem, caminho, base, config.get('IMAGEM_DIMENSAO_MAXIMA', 1600),
+        _formato(config), config.get('IMAGEM_QUALIDADE', 80), config.get('IMAGEM_DIMENSAO_MINIATURA', 320)
+    )
+
+
+def miniatura_comprovante(config, caminho):
+    """
+    Gera só a miniatura de uma imagem no pool de processos
+
+    Retorna o caminho da miniatura, ou None (PDF, Pillow ausente, imagem ilegível).
+    """
+    base, ext = os.path.splitext(caminho)
+    if ext.lower() not in EXTENSOES_IMAGEM or not pil_disponivel():
+        return None
+
+    return _executar_no_pool(
+        config, caminho, criar_miniatura, caminho, base, config.get('IMAGEM_DIMENSAO_MINIATURA', 320),
+        _formato(config), config.get('IMAGEM_QUALIDADE', 80)
+    )
@@ -0,0 +1,132 @@
+"""
+Limpeza dos comprovantes órfãos no armazenamento
+
+Objetos em comprovantes/ que nenhum Pagamento referencia (nem em public_id nem em
+miniatura_id) sobram quando um pagamento é apagado, quando o envio termina depois de o
+pagamento ser apagado ou quando um envio direto não é concluído. Apagar na requisição
+colocaria chamadas remotas no caminho dela; a reconciliação roda à parte
+(limpar_comprovantes_orfaos.py, via cron):
+
+- lista os objetos do armazenamento em páginas e confere cada página no banco com uma única
+  consulta (IN) às chaves referenciadas
+- ignora objetos mais novos que idade_minima_horas (envio em andamento, envio direto ainda
+  não concluído)
+- remove os órfãos em lotes (delete_lote), com pausa entre os lotes
+- grava um relatório JSON; com simular=True (dry-run) só informa o que seria removido
+"""
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from app.models.professor import db
+from app.models.pagamento import Pagamento
+from app.services.armazenamento_service import obter_armazenamento
+from app.services.preview_service import descartar_preview
+
+PREFIXO_COMPROVANTES = 'comprovantes/'
+TAMANHO_PAGINA = 500  # chaves conferidas por consulta ao banco
+
+
+def _chaves_referenciadas(chaves):
+    """Das chaves informadas, as que algum pagamento usa (comprovante ou miniatura)"""
+    referenciadas = set()
+    for coluna in (Pagamento.public_id, Pagamento.miniatura_id):
+        referenciadas.update(
+            chave for (chave,) in db.session.query(coluna).filter(coluna.in_(chaves)).distinct()
+        )
+    return referenciadas
+
+
+def _paginas(iteravel, tamanho):
+    pagina = []
+    for item in iteravel:
+        pagina.append(item)
+        if len(pagina) == tamanho:
+            yield pagina
+            pagina = []
+    if pagina:
+        yield pagina
+
+
+def buscar_orfaos(config, idade_minima_horas=24, prefixo=PREFIXO_COMPROVANTES):
+    """
+    Objetos do armazenamento sem pagamento, mais antigos que idade_minima_horas
+
+    Retorna (orfaos, totais): orfaos é a lista de ObjetoListado e totais conta os objetos
+    listados, referenciados e recentes (ignorados).
+    """
+    limite = datetime.now(timezone.utc) - timedelta(hours=idade_minima_horas)
+    orfaos = []
+    totais = {'listados': 0, 'referenciados': 0, 'recentes': 0}
+    for pagina in _paginas(obter_armazenamento(config).listar(prefixo), TAMANHO_PAGINA):
+        totais['listados'] += len(pagina)
+        referenciadas = _chaves_referenciadas([objeto.chave for objeto in pagina])
+        db.session.rollback()  # não segurar a transação durante a próxima página
+        for objeto in pagina:
+            if objeto.chave in referenciadas:
+                totais['referenciados'] += 1
+            elif objeto.modificado is not None and objeto.modificado > limite:
+                totais['recentes'] += 1
+            else:
+                orfaos.append(objeto)
+    return orfaos, totais
+
+
+def limpar_orfaos(config, simular=False, tamanho_lote=100, intervalo=1.0, idade_minima_horas=24,
+                  caminho_relatorio=None):
+    """
+    Remove os comprovantes órfãos em lotes e grava o relatório
+
+    Antes de cada lote as chaves são conferidas de novo no banco (um pagamento pode ter passado
+    a usar o objeto durante a limpeza). Entre os lotes espera intervalo segundos. Retorna o
+    relatório (dict); com caminho_relatorio ele também é gravado em JSON.
+    """
+    inicio = datetime.now(timezone.utc)
+    armazenamento = obter_armazenamento(config)
+    orfaos, totais = buscar_orfaos(config, idade_minima_horas)
+
+    itens = []
+    removidos = falhas = 0
+    for numero, lote in enumerate(_paginas(orfaos, tamanho_lote)):
+        reutilizadas = _chaves_referenciadas([objeto.chave for objeto in lote])
+        db.session.rollback()
+        lote = [objeto for objeto in lote if objeto.chave not in reutilizadas]
+        situacao, erro = 'simulado', None
+        if not simular and lote:
+            if numero > 0:
+                time.sleep(intervalo)
+            try:
+                armazenamento.delete_lote([objeto.chave for objeto in lote])
+                for objeto in lote:
+                    descartar_preview(config, objeto.chave)
+                situacao = 'removido'
+                removidos += len(lote)
+                print(f"🔄 Lote {numero + 1}: {len(lote)} objeto(s) removido(s)")
+            except Exception as e:
+                situacao, erro = 'erro', str(e)
+                falhas += len(lote)
+                print(f"⚠️  Lote {numero + 1}: falha ao remover {len(lote)} objeto(s): {e}")
+        itens.extend({
+            'chave': objeto.chave,
+            'tamanho': objeto.tamanho,
+            'modificado': objeto.modificado.isoformat() if objeto.modificado else None,
+            'situacao': situacao,
+            'erro': erro
+        } for objeto in lote)
+
+    relatorio = {
+        'backend': armazenamento.nome,
+        'simulacao': simular,
+        'inicio': inicio.isoformat(),
+        'fim': datetime.now(timezone.utc).isoformat(),
+        'idade_minima_horas': idade_minima_horas,
+        **totais,
+        'orfaos': len(itens),
+        'bytes_orfaos': sum(item['tamanho'] or 0 for item in itens),
+        'removidos': removidos,
+        'falhas': falhas,
+        'objetos': itens
+    }
+    if caminho_relatorio:
+        with open(caminho_relatorio, 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    return relatorio
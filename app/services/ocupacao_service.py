@@ -0,0 +1,124 @@
+"""
+Serviço de ocupação das turmas (horários dos professores)
+
+A ocupação de uma turma é o número de matrículas vigentes (Matricula.vigente: aluno ativo e
+matrícula não encerrada) do mesmo professor, na mesma modalidade e no mesmo dia/horário de
+início, calculada com uma única consulta agrupada.
+Toda inclusão de matrícula passa por reservar_vaga/reservar_vaga_matricula, que trava a
+turma e confere a capacidade na mesma transação do INSERT.
+"""
+from app.models.professor import db
+from app.models.matricula import Matricula
+from app.models.horario_professor import HorarioProfessor, converter_dia_semana, converter_horario_aula
+
+
+class TurmaLotada(Exception):
+    """Matrícula recusada: a turma já está com todas as vagas ocupadas"""
+
+    def __init__(self, horario, ocupadas):
+        super().__init__(
+            f'O horário {horario.dia_semana} {horario.horario_aula} ({horario.modalidade}) '
+            f'já tem {ocupadas} de {horario.capacidade} vagas ocupadas'
+        )
+        self.horario = horario
+        self.ocupadas = ocupadas
+
+
+def contar_ocupacao(professor_id=None):
+    """
+    Retorna {(professor_id, modalidade, dia_semana_num, inicio_min): quantidade de matrículas vigentes}
+
+    Args:
+        professor_id: Se informado, limita a contagem a um professor
+    """
+    query = db.session.query(
+        Matricula.professor_id,
+        Matricula.tipo_curso,
+        Matricula.dia_semana_num,
+        Matricula.inicio_min,
+        db.func.count(Matricula.id)
+    ).filter(
+        Matricula.dia_semana_num.isnot(None),
+        Matricula.vigente
+    )
+    if professor_id:
+        query = query.filter(Matricula.professor_id == professor_id)
+
+    linhas = query.group_by(
+        Matricula.professor_id, Matricula.tipo_curso, Matricula.dia_semana_num, Matricula.inicio_min
+    ).all()
+    return {(prof, curso, dia, inicio): total for prof, curso, dia, inicio, total in linhas}
+
+
+def resumo_ocupacao(horario, ocupacao):
+    """Monta capacidade/ocupadas/vagas de um horário a partir do mapa de contar_ocupacao()"""
+    ocupadas = ocupacao.get(
+        (horario.professor_id, horario.modalidade, horario.dia_semana_num, horario.inicio_min), 0
+    )
+    vagas = None if horario.capacidade is None else max(horario.capacidade - ocupadas, 0)
+    return {
+        'capacidade': horario.capacidade,
+        'ocupadas': ocupadas,
+        'vagas': vagas,
+        'lotado': vagas == 0
+    }
+
+
+def reservar_vaga(professor_id, tipo_curso, dia_semana_num, inicio_min):
+    """
+    Bloqueia a turma e verifica se ainda há vaga, antes de inserir uma matrícula
+
+    O bloqueio é um UPDATE sem efeito na linha do horário: no PostgreSQL trava a linha e no
+    SQLite pega o lock de escrita, então duas matrículas simultâneas na mesma turma são
+    serializadas até o commit. Deve ser chamado na mesma transação do INSERT.
+
+    Returns:
+        (ok, horario, ocupadas) - ok=False quando a turma está lotada; horario=None se o
+        professor não tem essa turma cadastrada (sem controle de capacidade)
+    """
+    tabela = HorarioProfessor.__table__
+    condicao = db.and_(
+        tabela.c.professor_id == professor_id,
+        tabela.c.modalidade == tipo_curso,
+        tabela.c.dia_semana_num == dia_semana_num,
+        tabela.c.inicio_min == inicio_min
+    )
+    db.session.connection().execute(
+        tabela.update().where(condicao).values(capacidade=tabela.c.capacidade)
+    )
+
+    horario = HorarioProfessor.query.filter(
+        HorarioProfessor.professor_id == professor_id,
+        HorarioProfessor.modalidade == tipo_curso,
+        HorarioProfessor.dia_semana_num == dia_semana_num,
+        HorarioProfessor.inicio_min == inicio_min
+    ).order_by(HorarioProfessor.id).first()
+    if horario is None or horario.capacidade is None:
+        return True, horario, None
+
+    ocupadas = db.session.query(db.func.count(Matricula.id)).filter(
+        Matricula.professor_id == professor_id,
+        Matricula.tipo_curso == tipo_curso,
+        Matricula.dia_semana_num == dia_semana_num,
+        Matricula.inicio_min == inicio_min,
+        Matricula.vigente
+    ).scalar()
+    return ocupadas < horario.capacidade, horario, ocupadas
+
+
+def reservar_vaga_matricula(professor_id, tipo_curso, dia_semana, horario_aula):
+    """
+    reservar_vaga a partir do texto da matrícula (dia_semana / horario_aula)
+
+    Matrícula sem dia ou horário reconhecível não tem turma e não é controlada.
+
+    Raises:
+        TurmaLotada: se a turma não tem mais vagas
+    """
+    dia_semana_num = converter_dia_semana(dia_semana)
+    inicio_min, _ = converter_horario_aula(horario_aula)
+    if not professor_id or dia_semana_num is None or inicio_min is None:
+        return
+    tem_vaga, horario, ocupadas = reservar_vaga(int(professor_id), tipo_curso, dia_semana_num, inicio_min)
+    if not tem_vaga:
+        raise TurmaLotada(horario, ocupadas)
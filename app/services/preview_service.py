@@ -0,0 +1,149 @@
+"""
+Miniaturas e pré-visualização dos comprovantes
+
+Cada Pagamento guarda em miniatura_id a chave da miniatura no armazenamento. Ela é enviada
+junto com o comprovante pelo worker de envio (upload_service.py); comprovantes enviados direto
+ao armazenamento ou anteriores à miniatura a recebem com preencher_miniatura, em segundo plano
+ou pelo backfill (migrate_miniaturas_comprovantes.py). PDFs não têm miniatura.
+
+As listagens mostram a miniatura pela rota /api/v1/pagamentos/<id>/preview: a primeira
+requisição copia a miniatura para o disco (PREVIEW_CACHE_DIR) e as seguintes são servidas de
+lá, com cache longo no navegador. A URL (url_preview) leva uma assinatura do pagamento e da
+chave da miniatura: não é adivinhável e muda quando a miniatura muda.
+"""
+import glob
+import hashlib
+import hmac
+import mimetypes
+import os
+import uuid
+from flask import current_app, url_for
+from app.models.professor import db
+from app.models.pagamento import Pagamento
+from app.services.armazenamento_service import obter_armazenamento
+from app.services.imagem_service import miniatura_comprovante
+from app.services.upload_service import identificar_formato, chave_miniatura, descartar_spool, BYTES_ASSINATURA
+
+CACHE_PREVIEW_SEGUNDOS = 365 * 24 * 60 * 60  # 1 ano (a URL muda com a miniatura)
+
+
+def _diretorio_cache(config):
+    diretorio = config['PREVIEW_CACHE_DIR']
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
+
+
+# ==================== URL ASSINADA ====================
+
+def assinatura_preview(pagamento_id, miniatura_id, config=None):
+    config = config or current_app.config
+    mensagem = f'{pagamento_id}:{miniatura_id}'.encode()
+    return hmac.new(config['SECRET_KEY'].encode(), mensagem, hashlib.sha256).hexdigest()[:32]
+
+
+def assinatura_valida(pagamento, assinatura):
+    if not pagamento.miniatura_id or not assinatura:
+        return False
+    return hmac.compare_digest(assinatura_preview(pagamento.id, pagamento.miniatura_id), assinatura)
+
+
+def url_preview(pagamento):
+    """URL da miniatura do comprovante, ou None se o pagamento não tem miniatura"""
+    if not pagamento.miniatura_id:
+        return None
+    return url_for(
+        'api.api_preview_comprovante',
+        pagamento_id=pagamento.id,
+        v=assinatura_preview(pagamento.id, pagamento.miniatura_id)
+    )
+
+
+# ==================== CACHE EM DISCO ====================
+
+def arquivo_preview(config, pagamento):
+    """
+    (caminho, mimetype) da miniatura do pagamento no cache em disco
+
+    Na primeira vez a miniatura é copiada do armazenamento. Levanta ObjetoNaoEncontrado se ela
+    não existir lá.
+    """
+    diretorio = _diretorio_cache(config)
+    nome = hashlib.sha256(pagamento.miniatura_id.encode()).hexdigest()
+    encontrados = glob.glob(os.path.join(diretorio, f'{nome}.*'))
+    if not encontrados:
+        encontrados = [_copiar_para_cache(config, diretorio, nome, pagamento.miniatura_id)]
+    caminho = encontrados[0]
+    return caminho, mimetypes.guess_type(caminho)[0] or 'application/octet-stream'
+
+
+def _copiar_para_cache(config, diretorio, nome, chave):
+    temporario = os.path.join(diretorio, f'parcial-{uuid.uuid4().hex}')
+    try:
+        inicio = b''
+        with open(temporario, 'wb') as destino:
+            for bloco in obter_armazenamento(config).get(chave):
+                if len(inicio) < BYTES_ASSINATURA:
+                    inicio += bloco[:BYTES_ASSINATURA]
+                destino.write(bloco)
+        # A chave do Cloudinary não tem extensão: o tipo vem dos primeiros bytes
+        ext = identificar_formato(inicio) or os.path.splitext(chave)[1] or '.bin'
+        caminho = os.path.join(diretorio, f'{nome}{ext}')
+        os.replace(temporario, caminho)  # requisições simultâneas gravam o mesmo conteúdo
+        return caminho
+    finally:
+        descartar_spool(temporario)
+
+
+def descartar_preview(config, miniatura_id):
+    """Remove a cópia em disco de uma miniatura (comprovante apagado)"""
+    if not miniatura_id:
+        return
+    nome = hashlib.sha256(miniatura_id.encode()).hexdigest()
+    for caminho in glob.glob(os.path.join(_diretorio_cache(config), f'{nome}.*')):
+        descartar_spool(caminho)
+
+
+# ==================== GERAÇÃO ====================
+
+def gerar_miniatura(config, public_id):
+    """
+    Gera e envia a miniatura de um comprovante já armazenado
+
+    O tipo é conferido pelos primeiros bytes (PDFs são ignorados sem baixar o arquivo).
+    Retorna a chave da miniatura no armazenamento, ou None se o comprovante não tem miniatura.
+    """
+    armazenamento = obter_armazenamento(config)
+    ext = identificar_formato(armazenamento.ler_inicio(public_id, BYTES_ASSINATURA))
+    if ext is None or ext == '.pdf':
+        return None
+
+    original = os.path.join(_diretorio_cache(config), f'original-{uuid.uuid4().hex}{ext}')
+    miniatura = None
+    try:
+        with open(original, 'wb') as destino:
+            for bloco in armazenamento.get(public_id):
+                destino.write(bloco)
+        miniatura = miniatura_comprovante(config, original)
+        if miniatura is None:
+            return None
+        with open(miniatura, 'rb') as arquivo:
+            objeto = armazenamento.put(chave_miniatura(public_id, os.path.splitext(miniatura)[1]), arquivo)
+        return objeto.chave
+    finally:
+        descartar_spool(original)
+        descartar_spool(miniatura)
+
+
+def preencher_miniatura(config, public_id):
+    """
+    Gera a miniatura do comprovante e grava miniatura_id nos pagamentos que usam o objeto
+
+    Não faz commit. Retorna a chave da miniatura (ou None).
+    """
+    chave = gerar_miniatura(config, public_id)
+    if chave:
+        db.session.query(Pagamento).filter(
+            Pagamento.public_id == public_id,
+            Pagamento.miniatura_id.is_(None)
+        ).update({Pagamento.miniatura_id: chave}, synchronize_session=False)
+    return chave
@@ -0,0 +1,163 @@
+"""
+Cache em memória dos dados de referência (professores, horários e modalidades)
+
+Esses dados são lidos em quase todas as telas de cadastro, notas e matrículas, mas mudam
+poucas vezes por mês. O cache é uma fotografia imutável carregada com poucas consultas e
+guardada no processo:
+
+- No mesmo processo, qualquer commit que altere Professor/HorarioProfessor/Modalidade
+  invalida o cache na hora (eventos da Session).
+- Entre workers, a cada CACHE_REFERENCIA_INTERVALO segundos o cache compara as versões em
+  versoes_tabelas (incrementadas em toda escrita) e recarrega se alguma mudou.
+"""
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models.professor import db, Professor
+from app.models.horario_professor import HorarioProfessor
+from app.models.modalidade import Modalidade, professor_modalidades
+from app.models.versao_tabela import obter_versoes
+
+# Tabelas cujas versões determinam a validade do cache
+TABELAS_REFERENCIA = ['professores', 'horarios_professor', 'modalidades']
+INTERVALO_VERIFICACAO_PADRAO = 5  # segundos
+
+_MODELOS_REFERENCIA = (Professor, HorarioProfessor, Modalidade)
+_CAMPOS_PROFESSOR = [
+    'id', 'nome', 'telefone', 'ativo',
+    'dublagem_presencial', 'dublagem_online', 'teatro_presencial', 'teatro_online',
+    'musical', 'locucao', 'teatro_tv_cinema', 'curso_apresentador'
+]
+
+_lock = threading.Lock()
+_cache = {
+    'dados': None,         # fotografia atual (ver _carregar)
+    'versoes': None,       # versões das tabelas quando a fotografia foi carregada
+    'verificado_em': 0.0,  # time.monotonic() da última comparação de versões
+}
+
+
+def _carregar():
+    """Carrega a fotografia dos dados de referência (4 consultas)"""
+    professores = {}
+    for professor in Professor.query.order_by(Professor.nome).all():
+        dados = {campo: getattr(professor, campo) for campo in _CAMPOS_PROFESSOR}
+        dados['modalidades'] = []
+        dados['horarios'] = []
+        professores[professor.id] = dados
+
+    horarios = HorarioProfessor.query.order_by(
+        HorarioProfessor.professor_id, HorarioProfessor.dia_semana_num, HorarioProfessor.inicio_min
+    ).all()
+    for horario in horarios:
+        if horario.professor_id in professores:
+            professores[horario.professor_id]['horarios'].append(horario.to_dict())
+
+    modalidades = Modalidade.query.order_by(Modalidade.ordem).all()
+    codigos_por_id = {m.id: m.codigo for m in modalidades}
+    associacoes = db.session.query(
+        professor_modalidades.c.professor_id, professor_modalidades.c.modalidade_id
+    ).all()
+    for professor_id, modalidade_id in associacoes:
+        if professor_id in professores and modalidade_id in codigos_por_id:
+            professores[professor_id]['modalidades'].append(codigos_por_id[modalidade_id])
+
+    return {
+        'professores': professores,  # {id: dados} em ordem alfabética
+        'rotulos_modalidades': {m.codigo: m.nome for m in modalidades},
+    }
+
+
+def obter_referencia():
+    """
+    Retorna a fotografia atual dos dados de referência, recarregando se estiver desatualizada
+
+    Os dicionários retornados são compartilhados entre requisições: não devem ser alterados.
+    """
+    agora = time.monotonic()
+    intervalo = current_app.config.get('CACHE_REFERENCIA_INTERVALO', INTERVALO_VERIFICACAO_PADRAO)
+    dados = _cache['dados']
+    if dados is not None and agora - _cache['verificado_em'] < intervalo:
+        return dados
+
+    with _lock:
+        # Outra thread pode ter recarregado enquanto esperávamos o lock
+        if _cache['dados'] is not None and agora - _cache['verificado_em'] < intervalo:
+            return _cache['dados']
+
+        versoes = obter_versoes(TABELAS_REFERENCIA)
+        if _cache['dados'] is None or versoes != _cache['versoes']:
+            _cache['dados'] = _carregar()
+            _cache['versoes'] = versoes
+        _cache['verificado_em'] = time.monotonic()
+        return _cache['dados']
+
+
+def invalidar_cache_referencia():
+    """Descarta a fotografia atual; a próxima leitura recarrega do banco"""
+    with _lock:
+        _cache['dados'] = None
+        _cache['versoes'] = None
+        _cache['verificado_em'] = 0.0
+
+
+def rotulos_modalidades():
+    """Retorna {codigo: nome de exibição} das modalidades"""
+    return obter_referencia()['rotulos_modalidades']
+
+
+def professores_por_modalidade(modalidade, somente_ativos=True):
+    """
+    Professores (dicts) com a modalidade informada, em ordem alfabética
+
+    Returns:
+        None se a modalidade não existe; caso contrário, a lista (possivelmente vazia)
+    """
+    referencia = obter_referencia()
+    if modalidade not in referencia['rotulos_modalidades']:
+        return None
+    return [
+        professor for professor in referencia['professores'].values()
+        if modalidade in professor['modalidades'] and (professor['ativo'] or not somente_ativos)
+    ]
+
+
+def horarios_do_professor(professor_id, modalidade=None):
+    """Horários (dicts) do professor ordenados por dia/horário; None se o professor não existe"""
+    professor = obter_referencia()['professores'].get(professor_id)
+    if professor is None:
+        return None
+    if modalidade:
+        return [h for h in professor['horarios'] if h['modalidade'] == modalidade]
+    return professor['horarios']
+
+
+# ==================== INVALIDAÇÃO ====================
+
+@event.listens_for(Session, 'after_flush')
+def _marcar_referencia_alterada(session, flush_context):
+    """Marca a sessão quando o flush altera dados de referência"""
+    alterados = list(session.new) + list(session.deleted) + list(session.dirty)
+    if any(isinstance(obj, _MODELOS_REFERENCIA) for obj in alterados):
+        session.info['referencia_alterada'] = True
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _marcar_referencia_alterada_bulk(contexto):
+    if contexto.mapper.class_ in _MODELOS_REFERENCIA:
+        contexto.session.info['referencia_alterada'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_apos_commit(session):
+    """Só invalida depois do commit, para não recarregar dados que ainda podem sofrer rollback"""
+    if session.info.pop('referencia_alterada', False):
+        invalidar_cache_referencia()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar_marca_rollback(session, previous_transaction):
+    session.info.pop('referencia_alterada', None)
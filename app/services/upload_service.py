@@ -0,0 +1,629 @@
+"""
+Envio assíncrono de comprovantes de pagamento
+
+A requisição só grava o arquivo num diretório local (spool) e cria o Pagamento com status
+'enviando'; um pool de threads em segundo plano envia o arquivo para o armazenamento, grava
+url_comprovante/public_id e passa o pagamento para 'pendente'. Falhas são repetidas com
+espera exponencial (UPLOAD_TENTATIVAS, UPLOAD_ESPERA_BASE); esgotadas as tentativas o
+pagamento fica 'falha_envio' e o arquivo continua no spool: na inicialização esses envios são
+retomados (retomar_envios_pendentes) e o administrador pode reenviar um pagamento
+(reenviar_comprovante); ao apagar o pagamento o arquivo sai do spool.
+
+O corpo multipart é lido em blocos direto da conexão (ler_upload_multipart): o tipo é
+identificado pelos primeiros bytes do arquivo, o tamanho máximo é conferido durante a leitura
+e cada bloco vai para o spool já somado ao SHA-256 — o arquivo não passa pelo temporário do
+Werkzeug nem fica inteiro na memória. Reenvios do mesmo arquivo (mesmo SHA-256) para o mesmo
+aluno e mês não geram outro envio nem outro pagamento.
+
+Com envio direto (UPLOAD_DIRETO; preparar_envio_direto / concluir_envio_direto), o navegador recebe um destino
+assinado e de curta duração e manda o arquivo direto ao armazenamento; o servidor só assina,
+confere o objeto enviado (tamanho e primeiros bytes) e cria o pagamento.
+
+Antes do envio, imagens são reduzidas/recodificadas e ganham uma miniatura (ver
+imagem_service.py), cuja chave fica em Pagamento.miniatura_id; PDFs vão como estão. O destino é o backend de ARMAZENAMENTO_BACKEND
+(ver armazenamento_service.py).
+"""
+import os
+import glob
+import hashlib
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from app.models.professor import db
+from app.models.pagamento import Pagamento
+from app.services.armazenamento_service import (
+    obter_armazenamento, tipo_conteudo, ObjetoNaoEncontrado, TAMANHO_BLOCO
+)
+from app.services.imagem_service import otimizar_comprovante
+
+STATUS_ENVIANDO = 'enviando'
+STATUS_FALHA_ENVIO = 'falha_envio'
+
+# Assinaturas (primeiros bytes) dos formatos aceitos: (prefixo, deslocamento, extensão)
+ASSINATURAS = [
+    (b'%PDF-', 0, '.pdf'),
+    (b'\x89PNG\r\n\x1a\n', 0, '.png'),
+    (b'\xff\xd8\xff', 0, '.jpg'),
+    (b'GIF87a', 0, '.gif'),
+    (b'GIF89a', 0, '.gif'),
+    (b'WEBP', 8, '.webp'),  # RIFF....WEBP
+]
+BYTES_ASSINATURA = 12
+TAMANHO_BLOCO_INICIAL = 4 * 1024  # leitura até achar o início do arquivo
+TAMANHO_MAXIMO_CAMPOS = 64 * 1024  # campos de texto do formulário (somados)
+EXTENSOES_PERMITIDAS = {ext for _, _, ext in ASSINATURAS} | {'.jpeg'}
+MARGEM_CONCLUSAO = 15 * 60  # segundos após a expiração da assinatura para concluir o envio
+
+ArquivoRecebido = namedtuple('ArquivoRecebido', ['caminho', 'ext', 'tamanho', 'hash_comprovante'])
+
+
+class UploadInvalido(Exception):
+    """Upload recusado (tipo não permitido, tamanho excedido, corpo inválido, envio direto inválido)"""
+
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+
+_lock = threading.Lock()
+_executor = None
+
+
+# ==================== SPOOL ====================
+
+def _diretorio_spool(config):
+    diretorio = config['UPLOAD_SPOOL_DIR']
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
+
+
+def _caminho_spool(config, pagamento_id, ext):
+    return os.path.join(_diretorio_spool(config), f'{pagamento_id}{ext}')
+
+
+def _arquivo_spool(config, pagamento_id):
+    """Arquivo do spool de um pagamento (o nome é o id do pagamento + extensão original)"""
+    encontrados = glob.glob(os.path.join(_diretorio_spool(config), f'{pagamento_id}.*'))
+    return encontrados[0] if encontrados else None
+
+
+def chave_comprovante(aluno_id, ext):
+    """Chave nova (aleatória, não adivinhável) de um comprovante do aluno"""
+    return f'comprovantes/{aluno_id}/{uuid.uuid4().hex}{ext}'
+
+
+def chave_miniatura(chave, ext):
+    """Chave da miniatura de um comprovante: mesmo nome com o sufixo '-miniatura'"""
+    return f'{os.path.splitext(chave)[0]}-miniatura{ext}'
+
+
+# ==================== RECEBIMENTO ====================
+
+def identificar_formato(inicio):
+    """Extensão do formato pelos primeiros bytes do arquivo, ou None se não for aceito"""
+    for assinatura, deslocamento, ext in ASSINATURAS:
+        if inicio[deslocamento:deslocamento + len(assinatura)] == assinatura:
+            if ext == '.webp' and not inicio.startswith(b'RIFF'):
+                continue
+            return ext
+    return None
+
+
+class _GravacaoComprovante:
+    """Recebe os blocos do arquivo: identifica o formato, limita o tamanho, soma o hash e grava no spool"""
+
+    def __init__(self, config, tamanho_maximo):
+        self.diretorio = _diretorio_spool(config)
+        self.tamanho_maximo = tamanho_maximo
+        self.inicio = b''
+        self.tamanho = 0
+        self.sha256 = hashlib.sha256()
+        self.destino = None
+        self.caminho = None
+        self.ext = None
+
+    def escrever(self, bloco):
+        self.tamanho += len(bloco)
+        if self.tamanho > self.tamanho_maximo:
+            raise UploadInvalido(
+                f'Arquivo muito grande. Máximo: {self.tamanho_maximo // (1024 * 1024)}MB', 413
+            )
+        if self.destino is None:
+            self.inicio += bloco
+            if len(self.inicio) < BYTES_ASSINATURA:
+                return  # espera os primeiros bytes
+            self._abrir()
+            bloco, self.inicio = self.inicio, b''
+        self.sha256.update(bloco)
+        self.destino.write(bloco)
+
+    def _abrir(self):
+        self.ext = identificar_formato(self.inicio)
+        if self.ext is None:
+            raise UploadInvalido('Formato não permitido. Envie PDF, PNG, JPG, GIF ou WEBP')
+        self.caminho = os.path.join(self.diretorio, f'recebendo-{uuid.uuid4().hex}{self.ext}')
+        self.destino = open(self.caminho, 'wb')
+
+    def concluir(self):
+        if self.destino is None:
+            if not self.inicio:
+                raise UploadInvalido('Comprovante é obrigatório')
+            self._abrir()  # arquivo menor que BYTES_ASSINATURA
+            self.sha256.update(self.inicio)
+            self.destino.write(self.inicio)
+        self.destino.close()
+        return ArquivoRecebido(self.caminho, self.ext, self.tamanho, self.sha256.hexdigest())
+
+    def descartar(self):
+        if self.destino is not None:
+            self.destino.close()
+            descartar_spool(self.caminho)
+
+
+def ler_upload_multipart(requisicao, campo_arquivo='comprovante', tamanho_maximo=None):
+    """
+    Lê um corpo multipart/form-data em blocos direto de requisicao.stream
+
+    Retorna (campos, arquivo): campos é um dict com os campos de texto e arquivo é um
+    ArquivoRecebido já gravado no spool (ou None se o campo do arquivo não veio). Levanta
+    UploadInvalido assim que o problema aparece: Content-Length acima do limite antes de ler,
+    formato inválido no primeiro bloco e excesso de tamanho no bloco que ultrapassar o máximo.
+    Não pode ser usada depois de acessar request.form/request.files.
+    """
+    config = current_app.config
+    tamanho_maximo = tamanho_maximo or config.get('UPLOAD_TAMANHO_MAXIMO', 10 * 1024 * 1024)
+
+    tipo, opcoes = parse_options_header(requisicao.content_type or '')
+    boundary = opcoes.get('boundary')
+    if tipo != 'multipart/form-data' or not boundary:
+        raise UploadInvalido('Envie o formulário como multipart/form-data')
+    if requisicao.content_length and requisicao.content_length > tamanho_maximo + TAMANHO_MAXIMO_CAMPOS:
+        raise UploadInvalido(f'Arquivo muito grande. Máximo: {tamanho_maximo // (1024 * 1024)}MB', 413)
+
+    decodificador = MultipartDecoder(boundary.encode('latin-1'))
+    campos = {}
+    gravacao = None
+    arquivo = None
+    parte = None  # ('campo', nome, [bytes]) | ('arquivo', nome) | ('ignorar', nome)
+    tamanho_campos = 0
+    try:
+        fim = False
+        while not fim:
+            # Blocos pequenos até identificar o formato: arquivo inválido é recusado nos primeiros KB
+            identificado = gravacao is not None and gravacao.destino is not None
+            bloco = requisicao.stream.read(TAMANHO_BLOCO if identificado else TAMANHO_BLOCO_INICIAL)
+            decodificador.receive_data(bloco or None)
+            while True:
+                evento = decodificador.next_event()
+                if isinstance(evento, NeedData):
+                    if not bloco:
+                        raise UploadInvalido('Corpo multipart incompleto')
+                    break
+                if isinstance(evento, Epilogue):
+                    fim = True
+                    break
+                if isinstance(evento, File):
+                    if evento.name == campo_arquivo and gravacao is None and evento.filename:
+                        gravacao = _GravacaoComprovante(config, tamanho_maximo)
+                        parte = ('arquivo', evento.name)
+                    else:
+                        parte = ('ignorar', evento.name)
+                elif isinstance(evento, Field):
+                    parte = ('campo', evento.name, [])
+                elif isinstance(evento, Data):
+                    if parte[0] == 'arquivo':
+                        gravacao.escrever(evento.data)
+                        if not evento.more_data:
+                            arquivo = gravacao.concluir()
+                    elif parte[0] == 'campo':
+                        tamanho_campos += len(evento.data)
+                        if tamanho_campos > TAMANHO_MAXIMO_CAMPOS:
+                            raise UploadInvalido('Campos do formulário muito grandes', 413)
+                        parte[2].append(evento.data)
+                        if not evento.more_data:
+                            campos[parte[1]] = b''.join(parte[2]).decode('utf-8', 'replace')
+        if gravacao is not None and arquivo is None:
+            arquivo = gravacao.concluir()
+        return campos, arquivo
+    except Exception as e:
+        if gravacao is not None:
+            gravacao.descartar()
+        if isinstance(e, RequestEntityTooLarge):  # MAX_CONTENT_LENGTH do Flask
+            raise UploadInvalido(f'Arquivo muito grande. Máximo: {tamanho_maximo // (1024 * 1024)}MB', 413)
+        if isinstance(e, ValueError):
+            raise UploadInvalido('Corpo multipart inválido')
+        raise
+
+
+def buscar_comprovante_igual(aluno_id, mes_referencia, ano_referencia, hash_comprovante):
+    """
+    Pagamento do aluno no mesmo mês com o mesmo arquivo (mesmo SHA-256)
+
+    Prefere um pagamento em andamento/aprovado; um rejeitado só é retornado se não houver
+    outro. Pagamentos com falha no envio são ignorados.
+    """
+    candidatos = Pagamento.query.filter(
+        Pagamento.hash_comprovante == hash_comprovante,
+        Pagamento.aluno_id == aluno_id,
+        Pagamento.mes_referencia == mes_referencia,
+        Pagamento.ano_referencia == ano_referencia,
+        Pagamento.status != STATUS_FALHA_ENVIO
+    ).order_by(Pagamento.id.desc()).all()
+    ativos = [p for p in candidatos if p.status != 'rejeitado']
+    return (ativos or candidatos or [None])[0]
+
+
+def receber_comprovante(pagamento, recebido):
+    """
+    Adiciona na sessão o pagamento do comprovante recebido (ArquivoRecebido de ler_upload_multipart)
+
+    Se o mesmo arquivo já foi enviado para o aluno no mesmo mês de referência:
+    - pagamento em andamento ou aprovado: retorna esse pagamento e nada é gravado nem enviado
+    - apenas pagamentos rejeitados: o novo pagamento reaproveita o objeto já armazenado e fica
+      'pendente' direto (sem novo envio)
+    Caso contrário o pagamento fica 'enviando' e o arquivo aguarda agendar_envio(pagamento.id).
+
+    A consulta prévia evita o trabalho na maioria dos reenvios; quem garante a deduplicação é o
+    índice único uq_pagamentos_comprovante_ativo: o INSERT roda num savepoint e, se um envio
+    simultâneo do mesmo arquivo gravou primeiro, o pagamento dele é retornado.
+
+    Não faz commit. Retorna (pagamento, caminho no spool ou None se não há envio a fazer); o
+    pagamento retornado é o existente quando não for o recebido como parâmetro.
+    """
+    caminho, ext, hash_comprovante = recebido.caminho, recebido.ext, recebido.hash_comprovante
+    try:
+        existente = buscar_comprovante_igual(
+            pagamento.aluno_id, pagamento.mes_referencia, pagamento.ano_referencia, hash_comprovante
+        )
+        if existente is not None and existente.status != 'rejeitado':
+            descartar_spool(caminho)
+            return existente, None
+
+        pagamento.hash_comprovante = hash_comprovante
+        reaproveitado = existente is not None and existente.public_id
+        if reaproveitado:
+            # Mesmo arquivo de um pagamento rejeitado: o objeto já está no armazenamento
+            pagamento.url_comprovante = existente.url_comprovante
+            pagamento.public_id = existente.public_id
+            pagamento.miniatura_id = existente.miniatura_id
+            pagamento.status = 'pendente'
+        else:
+            pagamento.status = STATUS_ENVIANDO
+            pagamento.url_comprovante = None
+            pagamento.public_id = None
+            pagamento.miniatura_id = None
+
+        try:
+            with db.session.begin_nested():
+                db.session.add(pagamento)
+                db.session.flush()  # gera o id, usado como nome do arquivo no spool
+        except IntegrityError:
+            existente = buscar_comprovante_igual(
+                pagamento.aluno_id, pagamento.mes_referencia, pagamento.ano_referencia, hash_comprovante
+            )
+            if existente is None:
+                raise
+            descartar_spool(caminho)
+            return existente, None
+
+        if reaproveitado:
+            descartar_spool(caminho)
+            return pagamento, None
+
+        destino = _caminho_spool(current_app.config, pagamento.id, ext)
+        os.replace(caminho, destino)
+        return pagamento, destino
+    except Exception:
+        descartar_spool(caminho)
+        raise
+
+
+def reenviar_comprovante(pagamento):
+    """
+    Volta para 'enviando' um pagamento com falha no envio cujo arquivo ainda está no spool
+
+    Não faz commit; depois do commit chame agendar_envio(pagamento.id).
+
+    Raises:
+        UploadInvalido: pagamento não está com falha no envio (409), arquivo não está mais no
+            spool (410) ou o mesmo arquivo já foi reenviado em outro pagamento do mês (409)
+    """
+    if pagamento.status != STATUS_FALHA_ENVIO:
+        raise UploadInvalido('Só pagamentos com falha no envio podem ser reenviados', 409)
+    if _arquivo_spool(current_app.config, pagamento.id) is None:
+        raise UploadInvalido('O arquivo deste comprovante não está mais no servidor; o aluno precisa enviá-lo de novo', 410)
+    try:
+        with db.session.begin_nested():
+            pagamento.status = STATUS_ENVIANDO
+            db.session.flush()
+    except IntegrityError:
+        # uq_pagamentos_comprovante_ativo: o aluno já reenviou o mesmo arquivo
+        raise UploadInvalido('Este comprovante já foi enviado de novo em outro pagamento do mesmo mês', 409)
+
+
+def descartar_spool_pagamento(pagamento, config=None):
+    """Remove do spool o arquivo de um pagamento com falha no envio (ex.: pagamento apagado)"""
+    if pagamento.status == STATUS_FALHA_ENVIO:
+        descartar_spool(_arquivo_spool(config or current_app.config, pagamento.id))
+
+
+def descartar_spool(caminho):
+    try:
+        if caminho and os.path.exists(caminho):
+            os.remove(caminho)
+    except OSError as e:
+        print(f"⚠️  Não foi possível remover o arquivo do spool {caminho}: {e}")
+
+
+# ==================== ENVIO DIRETO ====================
+
+def _serializador_envio(config):
+    from itsdangerous import URLSafeTimedSerializer
+    return URLSafeTimedSerializer(config['SECRET_KEY'], salt='envio-direto-comprovante')
+
+
+def envio_direto_habilitado(config=None):
+    """True se UPLOAD_DIRETO está ligado e o backend permite envio direto"""
+    config = config or current_app.config
+    return bool(config.get('UPLOAD_DIRETO')) and obter_armazenamento(config).suporta_envio_direto
+
+
+def preparar_envio_direto(aluno_id, ext):
+    """
+    Destino assinado para o navegador enviar um comprovante do aluno direto ao armazenamento
+
+    A chave fica em comprovantes/<aluno_id>/ e a assinatura vale UPLOAD_DIRETO_EXPIRACAO
+    segundos. Retorna dict com url e campos do formulário (o arquivo vai no campo 'file'), a
+    chave e o token que deve ser enviado para concluir_envio_direto.
+    """
+    config = current_app.config
+    armazenamento = obter_armazenamento(config)
+    if not envio_direto_habilitado(config):
+        raise UploadInvalido('Envio direto desabilitado; use /pagamentos/upload', 501)
+    ext = (ext or '').lower()
+    if not ext.startswith('.'):
+        ext = f'.{ext}'
+    if ext not in EXTENSOES_PERMITIDAS:
+        raise UploadInvalido('Formato não permitido. Envie PDF, PNG, JPG, GIF ou WEBP')
+
+    expiracao = config.get('UPLOAD_DIRETO_EXPIRACAO', 300)
+    chave = chave_comprovante(aluno_id, ext)
+    assinado = armazenamento.assinar_envio(
+        chave, tipo_conteudo(chave), config.get('UPLOAD_TAMANHO_MAXIMO', 10 * 1024 * 1024), expiracao
+    )
+    token = _serializador_envio(config).dumps({'aluno_id': aluno_id, 'chave': assinado.chave})
+    return {
+        'url': assinado.url,
+        'campos': assinado.campos,
+        'chave': assinado.chave,
+        'token': token,
+        'expira_em': expiracao,
+    }
+
+
+def concluir_envio_direto(pagamento, token):
+    """
+    Confere o objeto enviado direto ao armazenamento e adiciona o pagamento na sessão
+
+    O token (de preparar_envio_direto) precisa ser do mesmo aluno do pagamento. O objeto
+    precisa existir, respeitar UPLOAD_TAMANHO_MAXIMO e ter um formato aceito pelos primeiros
+    bytes; se não respeitar, é apagado. Concluir duas vezes o mesmo envio retorna o pagamento
+    já criado. Não faz commit. Retorna (pagamento, criado).
+    """
+    from itsdangerous import BadSignature, SignatureExpired
+    config = current_app.config
+    try:
+        dados = _serializador_envio(config).loads(
+            token or '', max_age=config.get('UPLOAD_DIRETO_EXPIRACAO', 300) + MARGEM_CONCLUSAO
+        )
+    except SignatureExpired:
+        raise UploadInvalido('Envio expirado. Envie o comprovante novamente')
+    except BadSignature:
+        raise UploadInvalido('Token de envio inválido')
+    if dados.get('aluno_id') != pagamento.aluno_id:
+        raise UploadInvalido('Token de envio não pertence a este aluno', 403)
+    chave = dados['chave']
+
+    existente = Pagamento.query.filter_by(public_id=chave).first()
+    if existente is not None:
+        return existente, False
+
+    armazenamento = obter_armazenamento(config)
+    try:
+        objeto = armazenamento.metadados(chave)
+    except ObjetoNaoEncontrado:
+        raise UploadInvalido('Comprovante não encontrado no armazenamento. Envie o arquivo antes de concluir')
+
+    tamanho_maximo = config.get('UPLOAD_TAMANHO_MAXIMO', 10 * 1024 * 1024)
+    if objeto.tamanho is not None and objeto.tamanho > tamanho_maximo:
+        armazenamento.delete(chave)
+        raise UploadInvalido(f'Arquivo muito grande. Máximo: {tamanho_maximo // (1024 * 1024)}MB', 413)
+    if identificar_formato(armazenamento.ler_inicio(chave, BYTES_ASSINATURA)) is None:
+        armazenamento.delete(chave)
+        raise UploadInvalido('Formato não permitido. Envie PDF, PNG, JPG, GIF ou WEBP')
+
+    pagamento.url_comprovante = objeto.url
+    pagamento.public_id = chave
+    pagamento.status = 'pendente'
+    db.session.add(pagamento)
+    return pagamento, True
+
+
+# ==================== WORKERS ====================
+
+def _obter_executor(config):
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=config.get('UPLOAD_WORKERS', 2),
+                thread_name_prefix='upload-comprovante'
+            )
+        return _executor
+
+
+def agendar_envio(pagamento_id, app=None):
+    """Coloca o envio do comprovante do pagamento na fila dos workers"""
+    app = app or current_app._get_current_object()
+    return _obter_executor(app.config).submit(_processar_envio, app, pagamento_id)
+
+
+def _processar_envio(app, pagamento_id):
+    with app.app_context():
+        try:
+            _enviar_com_tentativas(app.config, pagamento_id)
+        except Exception as e:
+            import traceback
+            print(f"❌ Erro no envio do comprovante do pagamento {pagamento_id}: {e}")
+            print(traceback.format_exc())
+        finally:
+            db.session.remove()
+
+
+def _enviar_com_tentativas(config, pagamento_id):
+    pagamento = db.session.get(Pagamento, pagamento_id)
+    caminho = _arquivo_spool(config, pagamento_id)
+    if pagamento is None:
+        # Pagamento apagado antes do envio
+        descartar_spool(caminho)
+        return
+    if pagamento.status != STATUS_ENVIANDO:
+        return
+    if caminho is None:
+        print(f"❌ Arquivo do comprovante do pagamento {pagamento_id} não está no spool")
+        _concluir_envio(pagamento_id, status=STATUS_FALHA_ENVIO)
+        return
+
+    aluno_id = pagamento.aluno_id
+    db.session.rollback()  # não segurar a transação durante a otimização e o envio
+
+    # Imagens: versão reduzida sem metadados + miniatura (PDFs e falhas: arquivo original)
+    otimizada = otimizar_comprovante(config, caminho)
+    enviar = caminho if otimizada is None else otimizada[0]
+    chave = chave_comprovante(aluno_id, os.path.splitext(enviar)[1])
+
+    armazenamento = obter_armazenamento(config)
+    tentativas = config.get('UPLOAD_TENTATIVAS', 5)
+    espera_base = config.get('UPLOAD_ESPERA_BASE', 1.0)
+    miniatura_id = None
+    for tentativa in range(1, tentativas + 1):
+        try:
+            with open(enviar, 'rb') as arquivo:
+                objeto = armazenamento.put(chave, arquivo)
+            if otimizada is not None:
+                miniatura = otimizada[1]
+                with open(miniatura, 'rb') as arquivo:
+                    miniatura_id = armazenamento.put(
+                        chave_miniatura(chave, os.path.splitext(miniatura)[1]), arquivo
+                    ).chave
+            break
+        except Exception as e:
+            # Arquivo sumiu do spool: outro worker já concluiu este pagamento (ou ele foi apagado)
+            if tentativa == tentativas or isinstance(e, FileNotFoundError):
+                print(f"❌ Envio do comprovante do pagamento {pagamento_id} falhou "
+                      f"(tentativa {tentativa}/{tentativas}): {e}")
+                _concluir_envio(pagamento_id, status=STATUS_FALHA_ENVIO)
+                for derivado in otimizada or ():
+                    descartar_spool(derivado)  # o original continua no spool
+                return
+            # Espera exponencial com variação aleatória (evita reenvios sincronizados)
+            espera = espera_base * (2 ** (tentativa - 1)) * random.uniform(0.5, 1.5)
+            print(f"⚠️  Envio do comprovante do pagamento {pagamento_id} falhou "
+                  f"(tentativa {tentativa}/{tentativas}), nova tentativa em {espera:.1f}s: {e}")
+            time.sleep(espera)
+
+    for arquivo_enviado in (caminho, *(otimizada or ())):
+        descartar_spool(arquivo_enviado)
+    if not _concluir_envio(pagamento_id, url_comprovante=objeto.url, public_id=objeto.chave,
+                           miniatura_id=miniatura_id, status='pendente'):
+        print(f"⚠️  Pagamento {pagamento_id} apagado ou já concluído durante o envio; "
+              f"objeto {objeto.chave} fica para a limpeza de órfãos")
+        return
+    print(f"✅ Comprovante do pagamento {pagamento_id} enviado")
+
+
+def _concluir_envio(pagamento_id, **valores):
+    """
+    Grava o resultado do envio só se o pagamento ainda estiver 'enviando'
+
+    O mesmo pagamento pode ser agendado duas vezes (retomada na inicialização e reenvio pelo
+    administrador); o UPDATE condicional impede que o segundo worker sobrescreva o resultado
+    do primeiro (ex.: 'pendente' virando 'falha_envio').
+
+    Returns:
+        True se o pagamento foi atualizado
+    """
+    resultado = db.session.execute(
+        db.update(Pagamento)
+        .where(Pagamento.id == pagamento_id, Pagamento.status == STATUS_ENVIANDO)
+        .values(**valores)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return resultado.rowcount == 1
+
+
+def agendar_miniatura(pagamento_id, app=None):
+    """Coloca na fila dos workers a miniatura de um comprovante já armazenado (ex.: envio direto)"""
+    app = app or current_app._get_current_object()
+    return _obter_executor(app.config).submit(_processar_miniatura, app, pagamento_id)
+
+
+def _processar_miniatura(app, pagamento_id):
+    from app.services.preview_service import preencher_miniatura
+    with app.app_context():
+        try:
+            pagamento = db.session.get(Pagamento, pagamento_id)
+            if pagamento is None or not pagamento.public_id or pagamento.miniatura_id:
+                return
+            public_id = pagamento.public_id
+            db.session.rollback()  # não segurar a transação durante o download e a miniatura
+            if preencher_miniatura(app.config, public_id):
+                db.session.commit()
+                print(f"✅ Miniatura do comprovante do pagamento {pagamento_id} gerada")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️  Não foi possível gerar a miniatura do pagamento {pagamento_id}: {e}")
+        finally:
+            db.session.remove()
+
+
+def retomar_envios_pendentes(app):
+    """
+    Reagenda os pagamentos que ficaram 'enviando' (ex.: reinício do servidor no meio do envio) e
+    os com falha no envio cujo arquivo ainda está no spool (o armazenamento pode ter voltado)
+    """
+    if multiprocessing.parent_process() is not None:
+        return  # processo filho do pool de imagens (spawn reimporta o módulo principal)
+    with app.app_context():
+        try:
+            reenviados = 0
+            for pagamento in Pagamento.query.filter(Pagamento.status == STATUS_FALHA_ENVIO).all():
+                try:
+                    reenviar_comprovante(pagamento)
+                    reenviados += 1
+                except UploadInvalido:
+                    pass  # arquivo fora do spool ou já reenviado pelo aluno: continua com falha
+            db.session.commit()
+
+            pendentes = db.session.query(Pagamento.id).filter(
+                Pagamento.status == STATUS_ENVIANDO
+            ).all()
+            db.session.rollback()
+            for (pagamento_id,) in pendentes:
+                agendar_envio(pagamento_id, app)
+            if pendentes:
+                print(f"🔄 {len(pendentes)} envio(s) de comprovante retomado(s)"
+                      f"{f' ({reenviados} com falha anterior)' if reenviados else ''}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️  Não foi possível retomar os envios de comprovantes: {e}")
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
@@ -20,7 +21,6 @@ class Config:
         # No Render, usar diretório temporário se não houver DATABASE_URL
         if os.environ.get('RENDER'):
             # Render sem DATABASE_URL - usar diretório temporário (dados serão perdidos ao reiniciar)
-            import tempfile
             temp_dir = tempfile.gettempdir()
             DB_PATH = os.path.join(temp_dir, 'controle_dublagem.db')
             # Garantir que o diretório existe
@@ -57,8 +57,55 @@ class Config:
     TWILIO_WHATSAPP_FROM = os.environ.get('TWILIO_WHATSAPP_FROM') or 'whatsapp:+14155238886'
     WHATSAPP_ENABLED = os.environ.get('WHATSAPP_ENABLED', 'true').lower() == 'true'
     
-    # Tamanho máximo de upload (10MB)
-    MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB
+    # Cache em memória de professores/horários/modalidades: intervalo (segundos) para
+    # conferir se outro worker alterou os dados (ver app/services/referencia_service.py)
+    CACHE_REFERENCIA_INTERVALO = int(os.environ.get('CACHE_REFERENCIA_INTERVALO', '5'))
+    
+    # Armazenamento dos comprovantes (ver app/services/armazenamento_service.py)
+    # ARMAZENAMENTO_BACKEND: 'cloudinary', 'local', 's3' ou 'fake' (testes de carga sem rede)
+    ARMAZENAMENTO_BACKEND = os.environ.get('ARMAZENAMENTO_BACKEND', 'cloudinary').lower()
+    ARMAZENAMENTO_LOCAL_DIR = os.environ.get('ARMAZENAMENTO_LOCAL_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'armazenamento'
+    )
+    ARMAZENAMENTO_LOCAL_URL = os.environ.get('ARMAZENAMENTO_LOCAL_URL', '/armazenamento/')
+    ARMAZENAMENTO_S3_BUCKET = os.environ.get('ARMAZENAMENTO_S3_BUCKET') or ''
+    ARMAZENAMENTO_S3_ENDPOINT = os.environ.get('ARMAZENAMENTO_S3_ENDPOINT') or ''  # MinIO, R2, etc.
+    ARMAZENAMENTO_S3_REGIAO = os.environ.get('ARMAZENAMENTO_S3_REGIAO') or ''
+    ARMAZENAMENTO_S3_ACCESS_KEY = os.environ.get('ARMAZENAMENTO_S3_ACCESS_KEY') or ''
+    ARMAZENAMENTO_S3_SECRET_KEY = os.environ.get('ARMAZENAMENTO_S3_SECRET_KEY') or ''
+    ARMAZENAMENTO_S3_URL_PUBLICA = os.environ.get('ARMAZENAMENTO_S3_URL_PUBLICA') or ''  # CDN/domínio do bucket
+    ARMAZENAMENTO_FAKE_LATENCIA = float(os.environ.get('ARMAZENAMENTO_FAKE_LATENCIA', '0.5'))  # segundos
+    ARMAZENAMENTO_FAKE_FALHAS = float(os.environ.get('ARMAZENAMENTO_FAKE_FALHAS', '0'))  # fração de 0 a 1
+    
+    # Envio assíncrono de comprovantes (ver app/services/upload_service.py)
+    UPLOAD_SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR') or os.path.join(
+        tempfile.gettempdir(), 'comprovantes_spool'
+    )
+    UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', '2'))
+    UPLOAD_TENTATIVAS = int(os.environ.get('UPLOAD_TENTATIVAS', '5'))
+    UPLOAD_ESPERA_BASE = float(os.environ.get('UPLOAD_ESPERA_BASE', '1'))  # segundos, dobra a cada tentativa
+    UPLOAD_TAMANHO_MAXIMO = 10 * 1024 * 1024  # 10MB por comprovante, conferido durante a leitura
+    # Envio direto ao armazenamento (s3/cloudinary), desligado por padrão: o arquivo não passa
+    # pelo servidor, então não tem deduplicação por SHA-256 nem redução das imagens
+    UPLOAD_DIRETO = os.environ.get('UPLOAD_DIRETO', 'false').lower() == 'true'
+    # Validade da assinatura do envio direto em segundos
+    UPLOAD_DIRETO_EXPIRACAO = int(os.environ.get('UPLOAD_DIRETO_EXPIRACAO', '300'))
+    
+    # Otimização das imagens dos comprovantes (ver app/services/imagem_service.py, requer Pillow)
+    IMAGEM_OTIMIZAR = os.environ.get('IMAGEM_OTIMIZAR', 'true').lower() == 'true'
+    IMAGEM_FORMATO = os.environ.get('IMAGEM_FORMATO', 'webp').lower()  # 'webp' ou 'jpeg'
+    IMAGEM_QUALIDADE = int(os.environ.get('IMAGEM_QUALIDADE', '80'))
+    IMAGEM_DIMENSAO_MAXIMA = int(os.environ.get('IMAGEM_DIMENSAO_MAXIMA', '1600'))  # px, maior lado
+    IMAGEM_DIMENSAO_MINIATURA = int(os.environ.get('IMAGEM_DIMENSAO_MINIATURA', '320'))  # px
+    IMAGEM_PROCESSOS = int(os.environ.get('IMAGEM_PROCESSOS', '1'))
+    IMAGEM_TIMEOUT = int(os.environ.get('IMAGEM_TIMEOUT', '60'))  # segundos por imagem
+    # Cópia em disco das miniaturas servidas por /api/v1/pagamentos/<id>/preview (descartável)
+    PREVIEW_CACHE_DIR = os.environ.get('PREVIEW_CACHE_DIR') or os.path.join(
+        tempfile.gettempdir(), 'comprovantes_preview'
+    )
+    
+    # Tamanho máximo da requisição: comprovante de até 10MB + campos do formulário
+    MAX_CONTENT_LENGTH = UPLOAD_TAMANHO_MAXIMO + 64 * 1024
     
     @staticmethod
     def get_environment():
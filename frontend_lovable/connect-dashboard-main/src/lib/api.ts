@@ -71,6 +71,8 @@ interface Pagamento {
   data_vencimento: string;
   data_pagamento: string | null;
   status: string;
+  url_comprovante?: string | null;
+  url_preview?: string | null;  // miniatura do comprovante (imagens)
 }
 
 interface Nota {
@@ -94,6 +96,8 @@ interface Nota {
 }
 
 class ApiClient {
+  private envioDireto: Promise<boolean> | null = null;
+
   private getToken(): string | null {
     return localStorage.getItem('token');
   }
@@ -114,6 +118,27 @@ class ApiClient {
     return headers;
   }
 
+  // Listagens paginadas por cursor (/notas, /matriculas): segue next_cursor até a última página
+  private async buscarTodasPaginas<T>(caminho: string, params: URLSearchParams): Promise<ApiResponse<T[]>> {
+    const itens: T[] = [];
+    params.set('limite', '500');
+    let cursor: string | null = null;
+    do {
+      if (cursor) params.set('cursor', cursor);
+      const response = await fetch(`${API_BASE_URL}${caminho}?${params}`, {
+        headers: this.getHeaders(),
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      const pagina = await response.json();
+      if (!pagina.success) return pagina;
+      itens.push(...(pagina.data ?? []));
+      cursor = pagina.next_cursor ?? null;
+    } while (cursor);
+    return { success: true, count: itens.length, data: itens };
+  }
+
   async login(username: string, password: string): Promise<LoginResponse> {
     try {
       const response = await fetch(`${API_BASE_URL}/auth/login`, {
@@ -416,14 +441,7 @@ class ApiClient {
       if (filters?.professor_id) params.append('professor_id', filters.professor_id.toString());
       if (filters?.tipo_curso) params.append('tipo_curso', filters.tipo_curso);
       
-      const url = `${API_BASE_URL}/notas${params.toString() ? `?${params}` : ''}`;
-      const response = await fetch(url, {
-        headers: this.getHeaders(),
-      });
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-      return response.json();
+      return await this.buscarTodasPaginas<Nota>('/notas', params);
     } catch (error) {
       console.error('Erro ao buscar notas:', error);
       return {
@@ -769,6 +787,27 @@ class ApiClient {
     }
   }
 
+  async reenviarPagamento(id: number): Promise<ApiResponse<Pagamento>> {
+    try {
+      const response = await fetch(`${API_BASE_URL}/pagamentos/${id}/reenviar`, {
+        method: 'POST',
+        headers: this.getHeaders(),
+      });
+      const resultado = await response.json();
+      if (!response.ok) {
+        return { success: false, error: resultado.error || 'Erro ao reenviar comprovante', data: {} as Pagamento };
+      }
+      return resultado;
+    } catch (error) {
+      console.error('Erro ao reenviar comprovante:', error);
+      return {
+        success: false,
+        error: 'Erro ao reenviar comprovante',
+        data: {} as Pagamento
+      };
+    }
+  }
+
   async getMatriculas(filters?: { aluno_id?: number; professor_id?: number; tipo_curso?: string }): Promise<ApiResponse<any[]>> {
     try {
       const params = new URLSearchParams();
@@ -776,14 +815,7 @@ class ApiClient {
       if (filters?.professor_id) params.append('professor_id', filters.professor_id.toString());
       if (filters?.tipo_curso) params.append('tipo_curso', filters.tipo_curso);
       
-      const url = `${API_BASE_URL}/matriculas${params.toString() ? `?${params}` : ''}`;
-      const response = await fetch(url, {
-        headers: this.getHeaders(),
-      });
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-      return response.json();
+      return await this.buscarTodasPaginas<any>('/matriculas', params);
     } catch (error) {
       console.error('Erro ao buscar matrículas:', error);
       return {
@@ -804,6 +836,17 @@ class ApiClient {
     observacoes?: string
   ): Promise<ApiResponse<any>> {
     try {
+      // Envio direto ao armazenamento só quando o servidor habilita (UPLOAD_DIRETO); senão o
+      // servidor recebe o arquivo (deduplicação e redução das imagens)
+      if (await this.envioDiretoHabilitado()) {
+        const direto = await this.uploadComprovanteDireto(
+          alunoId, mesReferencia, anoReferencia, valorPago, dataPagamento, comprovante, observacoes
+        );
+        if (direto) {
+          return direto;
+        }
+      }
+
       const formData = new FormData();
       formData.append('aluno_id', alunoId.toString());
       formData.append('mes_referencia', mesReferencia.toString());
@@ -838,6 +881,72 @@ class ApiClient {
     }
   }
 
+  private envioDiretoHabilitado(): Promise<boolean> {
+    if (!this.envioDireto) {
+      this.envioDireto = fetch(`${API_BASE_URL}/pagamentos/upload/config`, { headers: this.getHeaders() })
+        .then((response) => (response.ok ? response.json() : null))
+        .then((resultado) => Boolean(resultado?.data?.envio_direto))
+        .catch(() => {
+          this.envioDireto = null;  // falha de rede: perguntar de novo no próximo envio
+          return false;
+        });
+    }
+    return this.envioDireto;
+  }
+
+  private async uploadComprovanteDireto(
+    alunoId: number,
+    mesReferencia: number,
+    anoReferencia: number,
+    valorPago: number,
+    dataPagamento: string,
+    comprovante: File,
+    observacoes?: string
+  ): Promise<ApiResponse<any> | null> {
+    const assinatura = await fetch(`${API_BASE_URL}/pagamentos/upload/assinatura`, {
+      method: 'POST',
+      headers: this.getHeaders(),
+      body: JSON.stringify({ aluno_id: alunoId, nome_arquivo: comprovante.name }),
+    });
+    if (assinatura.status === 501) {
+      return null;
+    }
+    if (!assinatura.ok) {
+      const errorData = await assinatura.json();
+      throw new Error(errorData.error || `HTTP error! status: ${assinatura.status}`);
+    }
+    const { data: envio } = await assinatura.json();
+
+    const formData = new FormData();
+    Object.entries(envio.campos as Record<string, string | number>).forEach(([campo, valor]) => {
+      formData.append(campo, String(valor));
+    });
+    formData.append('file', comprovante);  // o arquivo precisa ser o último campo
+    const envioArquivo = await fetch(envio.url, { method: 'POST', body: formData });
+    if (!envioArquivo.ok) {
+      throw new Error(`Falha ao enviar o comprovante ao armazenamento (status ${envioArquivo.status})`);
+    }
+
+    const conclusao = await fetch(`${API_BASE_URL}/pagamentos/upload/concluir`, {
+      method: 'POST',
+      headers: this.getHeaders(),
+      body: JSON.stringify({
+        token: envio.token,
+        aluno_id: alunoId,
+        mes_referencia: mesReferencia,
+        ano_referencia: anoReferencia,
+        valor_pago: valorPago,
+        data_pagamento: dataPagamento,
+        observacoes: observacoes || '',
+      }),
+    });
+    if (!conclusao.ok) {
+      const errorData = await conclusao.json();
+      throw new Error(errorData.error || `HTTP error! status: ${conclusao.status}`);
+    }
+    return conclusao.json();
+  }
+
   isAuthenticated(): boolean {
     return !!this.getToken();
   }
@@ -956,4 +1065,7 @@ class ApiClient {
 }
 
 export const api = new ApiClient();
+
+// URLs relativas devolvidas pela API (ex.: url_preview) apontam para o servidor da API
+export const resolverUrlApi = (caminho: string): string => new URL(caminho, API_BASE_URL).toString();
 export type { Aluno, Professor, Pagamento, Nota, DashboardStats, LoginResponse, ApiResponse };
@@ -1,7 +1,7 @@
 import { useEffect, useState } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { MainLayout } from '@/components/layout/MainLayout';
-import { api } from '@/lib/api';
+import { api, resolverUrlApi } from '@/lib/api';
 import { Badge } from '@/components/ui/badge';
 import { Button } from '@/components/ui/button';
 import { Loader2, ArrowLeft, User, Phone, MapPin, Calendar, CreditCard, BookOpen, GraduationCap, Upload } from 'lucide-react';
@@ -289,6 +289,16 @@ export default function AlunoDetalhes() {
                                 Data do pagamento: {formatDate(pag.data_pagamento)}
                               </p>
                             )}
+                            {pag.url_comprovante && pag.url_preview && (
+                              <a href={pag.url_comprovante} target="_blank" rel="noopener noreferrer" className="block mt-2">
+                                <img
+                                  src={resolverUrlApi(pag.url_preview)}
+                                  alt="Comprovante"
+                                  loading="lazy"
+                                  className="w-16 h-16 rounded object-cover border border-border"
+                                />
+                              </a>
+                            )}
                             {pag.url_comprovante && (
                               <a
                                 href={pag.url_comprovante}
@@ -303,11 +313,13 @@ export default function AlunoDetalhes() {
                           <Badge
                             variant={
                               pag.status === 'aprovado' || pag.status === 'pago' ? 'default' :
-                              pag.status === 'pendente' ? 'secondary' : 'destructive'
+                              pag.status === 'pendente' || pag.status === 'enviando' ? 'secondary' : 'destructive'
                             }
                           >
                             {pag.status === 'aprovado' ? 'Aprovado' :
                              pag.status === 'pendente' ? 'Pendente' :
+                             pag.status === 'enviando' ? 'Enviando comprovante' :
+                             pag.status === 'falha_envio' ? 'Falha no envio' :
                              pag.status === 'rejeitado' ? 'Rejeitado' : pag.status}
                           </Badge>
                         </div>
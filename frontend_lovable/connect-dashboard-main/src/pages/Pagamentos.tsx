@@ -1,10 +1,10 @@
 import { useEffect, useState } from 'react';
 import { useSearchParams } from 'react-router-dom';
 import { MainLayout } from '@/components/layout/MainLayout';
-import { api, Pagamento, Professor } from '@/lib/api';
+import { api, Pagamento, Professor, resolverUrlApi } from '@/lib/api';
 import { Badge } from '@/components/ui/badge';
 import { Button } from '@/components/ui/button';
-import { Loader2, CreditCard, Calendar, User, Check, X } from 'lucide-react';
+import { Loader2, CreditCard, Calendar, User, Check, X, RotateCcw } from 'lucide-react';
 import { useToast } from '@/hooks/use-toast';
 import { cn } from '@/lib/utils';
 import {
@@ -110,6 +110,14 @@ export default function Pagamentos() {
         label: 'Atrasado', 
         className: 'bg-destructive/10 text-destructive border-destructive/20' 
       },
+      enviando: { 
+        label: 'Enviando comprovante', 
+        className: 'bg-muted text-muted-foreground' 
+      },
+      falha_envio: { 
+        label: 'Falha no envio', 
+        className: 'bg-destructive/10 text-destructive border-destructive/20' 
+      },
     };
 
     const config = statusMap[status.toLowerCase()] || { 
@@ -184,6 +192,26 @@ export default function Pagamentos() {
     }
   };
 
+  const handleReenviar = async (id: number) => {
+    const response = await api.reenviarPagamento(id);
+    if (response.success) {
+      toast({
+        title: 'Sucesso',
+        description: 'Envio do comprovante reiniciado',
+      });
+      const res = await api.getPagamentos({ status: filter || undefined });
+      if (res.success) {
+        setPagamentos(res.data);
+      }
+    } else {
+      toast({
+        title: 'Erro',
+        description: response.error || 'Erro ao reenviar comprovante',
+        variant: 'destructive',
+      });
+    }
+  };
+
   const filters = [
     { value: '', label: 'Todos' },
     { value: 'pendente', label: 'Pendentes' },
@@ -274,9 +302,20 @@ export default function Pagamentos() {
                     >
                       <td className="px-6 py-4">
                         <div className="flex items-center gap-3">
-                          <div className="w-10 h-10 rounded-full bg-primary/10 flex items-center justify-center">
-                            <User size={18} className="text-primary" />
-                          </div>
+                          {pagamento.url_preview && pagamento.url_comprovante ? (
+                            <a href={pagamento.url_comprovante} target="_blank" rel="noopener noreferrer" title="Ver comprovante">
+                              <img
+                                src={resolverUrlApi(pagamento.url_preview)}
+                                alt="Comprovante"
+                                loading="lazy"
+                                className="w-10 h-10 rounded object-cover border border-border"
+                              />
+                            </a>
+                          ) : (
+                            <div className="w-10 h-10 rounded-full bg-primary/10 flex items-center justify-center">
+                              <User size={18} className="text-primary" />
+                            </div>
+                          )}
                           <span className="font-medium text-foreground">
                             {pagamento.aluno_nome || `Aluno #${pagamento.aluno_id}`}
                           </span>
@@ -372,6 +411,12 @@ export default function Pagamentos() {
                             </AlertDialog>
                           </div>
                         )}
+                        {pagamento.status === 'falha_envio' && (
+                          <Button size="sm" variant="outline" onClick={() => handleReenviar(pagamento.id)}>
+                            <RotateCcw size={16} className="mr-1" />
+                            Reenviar
+                          </Button>
+                        )}
                       </td>
                     </tr>
                   ))}
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Script para remover do armazenamento os comprovantes órfãos (sem pagamento no banco)
+Executar via cron job, fora do horário de uso (ver app/services/limpeza_service.py)
+
+Uso:
+    python limpar_comprovantes_orfaos.py --dry-run        (só lista o que seria removido)
+    python limpar_comprovantes_orfaos.py [--lote 100] [--intervalo 1] [--idade-minima 24]
+                                         [--relatorio arquivo.json]
+
+Ou adicionar ao crontab:
+    0 3 * * 0 cd /caminho/do/projeto && /usr/bin/python3 limpar_comprovantes_orfaos.py
+    (Executa todo domingo às 3h)
+"""
+import os
+import sys
+import argparse
+from datetime import datetime
+
+# Adicionar o diretório do projeto ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.services.armazenamento_service import verificar_configuracao
+from app.services.limpeza_service import limpar_orfaos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Remove do armazenamento os comprovantes sem pagamento')
+    parser.add_argument('--dry-run', action='store_true', help='Não remove nada, só gera o relatório')
+    parser.add_argument('--lote', type=int, default=100, help='Objetos removidos por lote (padrão: 100)')
+    parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos de espera entre os lotes (padrão: 1)')
+    parser.add_argument('--idade-minima', type=float, default=24,
+                        help='Só remove objetos com mais de N horas (padrão: 24)')
+    parser.add_argument('--relatorio', help='Arquivo JSON do relatório (padrão: limpeza_comprovantes_<data>.json)')
+    args = parser.parse_args()
+
+    caminho_relatorio = args.relatorio or f"limpeza_comprovantes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+    app = create_app()
+    with app.app_context():
+        erro_configuracao = verificar_configuracao()
+        if erro_configuracao:
+            print(f"❌ {erro_configuracao}")
+            sys.exit(1)
+
+        print(f"🔄 Procurando comprovantes órfãos{' (simulação)' if args.dry_run else ''}...")
+        try:
+            relatorio = limpar_orfaos(
+                app.config,
+                simular=args.dry_run,
+                tamanho_lote=args.lote,
+                intervalo=args.intervalo,
+                idade_minima_horas=args.idade_minima,
+                caminho_relatorio=caminho_relatorio
+            )
+        except Exception as e:
+            import traceback
+            print(f"❌ Erro durante a limpeza: {e}")
+            print(traceback.format_exc())
+            sys.exit(1)
+
+        print(f"📊 {relatorio['listados']} objeto(s) listado(s): {relatorio['referenciados']} em uso, "
+              f"{relatorio['recentes']} recente(s), {relatorio['orfaos']} órfão(s) "
+              f"({relatorio['bytes_orfaos'] / (1024 * 1024):.1f}MB)")
+        if args.dry_run:
+            print("✅ Simulação concluída: nada foi removido")
+        else:
+            print(f"✅ {relatorio['removidos']} removido(s), {relatorio['falhas']} falha(s)")
+        print(f"📄 Relatório: {caminho_relatorio}")
+        if relatorio['falhas']:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
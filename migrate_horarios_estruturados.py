@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Script para preencher dia_semana_num, inicio_min e fim_min em horarios_professor e matriculas
+a partir dos textos existentes (ex: "Segunda-feira", "17:00 às 19:00").
+As colunas e índices são criados automaticamente pelo create_app(); este script faz o backfill.
+Funciona com SQLite e PostgreSQL
+"""
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app
+from app.models.professor import db
+from app.models.horario_professor import (
+    DIAS_SEMANA, converter_dia_semana, converter_horario_aula, formatar_horario_aula
+)
+from sqlalchemy import text
+
+TABELAS = ['horarios_professor', 'matriculas']
+TAMANHO_LOTE = 500
+
+
+def preencher_tabela(tabela):
+    """Preenche os campos estruturados de uma tabela; retorna (atualizados, sem_conversao)"""
+    linhas = db.session.execute(text(f"""
+        SELECT id, dia_semana, horario_aula FROM {tabela}
+        WHERE dia_semana_num IS NULL OR inicio_min IS NULL
+    """)).fetchall()
+
+    atualizacoes = []
+    sem_conversao = []
+    for linha in linhas:
+        dia_num = converter_dia_semana(linha.dia_semana)
+        inicio, fim = converter_horario_aula(linha.horario_aula)
+        if dia_num is None and inicio is None:
+            if linha.dia_semana or linha.horario_aula:
+                sem_conversao.append(linha)
+            continue
+        atualizacoes.append({
+            'id': linha.id,
+            'dia_semana_num': dia_num,
+            'inicio_min': inicio,
+            'fim_min': fim,
+            # Texto de exibição derivado dos campos estruturados (quando convertido)
+            'dia_semana': DIAS_SEMANA[dia_num] if dia_num is not None else linha.dia_semana,
+            'horario_aula': formatar_horario_aula(inicio, fim) if inicio is not None else linha.horario_aula
+        })
+
+    for i in range(0, len(atualizacoes), TAMANHO_LOTE):
+        db.session.execute(text(f"""
+            UPDATE {tabela}
+            SET dia_semana_num = :dia_semana_num, inicio_min = :inicio_min, fim_min = :fim_min,
+                dia_semana = :dia_semana, horario_aula = :horario_aula
+            WHERE id = :id
+        """), atualizacoes[i:i + TAMANHO_LOTE])
+        db.session.commit()
+
+    return len(atualizacoes), sem_conversao
+
+
+def migrate():
+    app = create_app()
+    with app.app_context():
+        try:
+            for tabela in TABELAS:
+                print(f"🔄 Preenchendo campos estruturados em '{tabela}'...")
+                atualizados, sem_conversao = preencher_tabela(tabela)
+                print(f"✅ {atualizados} registro(s) atualizado(s) em '{tabela}'")
+                for linha in sem_conversao:
+                    print(f"⚠️  {tabela} id={linha.id}: não foi possível interpretar "
+                          f"'{linha.dia_semana}' / '{linha.horario_aula}'")
+        except Exception as e:
+            db.session.rollback()
+            import traceback
+            print(f"❌ Erro durante a migração: {e}")
+            print(traceback.format_exc())
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Script para preencher a coluna media das notas existentes (média dos critérios preenchidos).
+A coluna é criada e preenchida automaticamente pelo create_app() (um único UPDATE no banco,
+sem carregar as notas); este script executa o mesmo preenchimento e mostra o resultado.
+Funciona com SQLite e PostgreSQL
+"""
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app
+from app.models.professor import db
+from app.migracoes import preencher_medias_notas
+
+
+def migrate():
+    app = create_app()
+    with app.app_context():
+        try:
+            print("🔄 Calculando a média das notas sem média gravada...")
+            atualizadas = preencher_medias_notas()
+            print(f"✅ {atualizadas} nota(s) atualizada(s)")
+        except Exception as e:
+            db.session.rollback()
+            import traceback
+            print(f"❌ Erro durante a migração: {e}")
+            print(traceback.format_exc())
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Script para gerar as miniaturas dos comprovantes já armazenados (coluna miniatura_id).
+A coluna é criada automaticamente pelo create_app(); este script faz o backfill dos
+pagamentos com comprovante de imagem e sem miniatura. PDFs são reconhecidos pelos primeiros
+bytes e ignorados sem baixar o arquivo. Pode ser interrompido e executado de novo: cada
+comprovante é gravado assim que a miniatura é enviada.
+
+Uso: python migrate_miniaturas_comprovantes.py [--limite N]
+Funciona com SQLite e PostgreSQL (requer Pillow)
+"""
+import sys
+import os
+import argparse
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app
+from app.models.professor import db
+from app.models.pagamento import Pagamento
+from app.services.armazenamento_service import verificar_configuracao
+from app.services.imagem_service import pil_disponivel
+from app.services.preview_service import preencher_miniatura
+from app.services.upload_service import STATUS_ENVIANDO, STATUS_FALHA_ENVIO
+
+
+def migrate(limite=None):
+    app = create_app()
+    with app.app_context():
+        erro_configuracao = verificar_configuracao()
+        if erro_configuracao:
+            print(f"❌ {erro_configuracao}")
+            sys.exit(1)
+        if not pil_disponivel():
+            print("❌ Pillow não está instalado (necessário para gerar as miniaturas)")
+            sys.exit(1)
+
+        # Um objeto pode ser usado por vários pagamentos (reenvio do mesmo arquivo)
+        query = db.session.query(Pagamento.public_id).filter(
+            Pagamento.public_id.isnot(None),
+            Pagamento.miniatura_id.is_(None),
+            Pagamento.status.notin_([STATUS_ENVIANDO, STATUS_FALHA_ENVIO])
+        ).distinct().order_by(Pagamento.public_id)
+        if limite:
+            query = query.limit(limite)
+        chaves = [public_id for (public_id,) in query]
+        db.session.rollback()
+        print(f"🔄 {len(chaves)} comprovante(s) sem miniatura")
+
+        geradas = ignorados = falhas = 0
+        for public_id in chaves:
+            try:
+                if preencher_miniatura(app.config, public_id):
+                    db.session.commit()
+                    geradas += 1
+                else:
+                    ignorados += 1  # PDF ou imagem ilegível
+            except Exception as e:
+                db.session.rollback()
+                falhas += 1
+                print(f"⚠️  {public_id}: {e}")
+
+        print(f"✅ {geradas} miniatura(s) gerada(s), {ignorados} comprovante(s) sem miniatura (PDF), {falhas} falha(s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera as miniaturas dos comprovantes já armazenados')
+    parser.add_argument('--limite', type=int, help='Máximo de comprovantes processados nesta execução')
+    migrate(parser.parse_args().limite)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Script para (re)preencher a tabela de modalidades e as associações professor_modalidades
+e aluno_modalidades a partir dos horários dos professores e das matrículas ativas.
+As associações são mantidas automaticamente a cada gravação; use este script para
+reconstruí-las por completo (ex: após alterações feitas direto no banco).
+Funciona com SQLite e PostgreSQL
+"""
+import sys
+import os
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app
+from app.models.professor import db
+from app.models.modalidade import (
+    garantir_modalidades, recalcular_modalidades_professores, recalcular_modalidades_alunos,
+    professor_modalidades, aluno_modalidades
+)
+
+
+def migrate():
+    app = create_app()
+    with app.app_context():
+        try:
+            novas = garantir_modalidades()
+            print(f"✅ Modalidades cadastradas: {novas} nova(s)")
+            
+            print("🔄 Recalculando modalidades dos professores...")
+            recalcular_modalidades_professores(db.session.connection())
+            print("🔄 Recalculando modalidades dos alunos...")
+            recalcular_modalidades_alunos(db.session.connection())
+            db.session.commit()
+            
+            total_professores = db.session.query(professor_modalidades).count()
+            total_alunos = db.session.query(aluno_modalidades).count()
+            print(f"✅ {total_professores} associação(ões) professor/modalidade")
+            print(f"✅ {total_alunos} associação(ões) aluno/modalidade")
+        except Exception as e:
+            db.session.rollback()
+            import traceback
+            print(f"❌ Erro durante a migração: {e}")
+            print(traceback.format_exc())
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    migrate()
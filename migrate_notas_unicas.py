@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Script para remover notas duplicadas (mesmo aluno, professor, curso e número da prova) e
+criar o índice único uq_notas_aluno_professor_curso_prova.
+Mantém a nota mais recente (maior id) de cada grupo.
+O create_app() não sobe enquanto houver duplicadas (app/migracoes.py) e nunca apaga notas;
+a remoção é feita só aqui. Antes de apagar, todas as notas dos grupos duplicados são
+mostradas e exportadas para um CSV, para que possam ser conferidas ou restauradas.
+Use --simular para só listar e exportar, sem apagar nada.
+Funciona com SQLite e PostgreSQL
+"""
+import sys
+import os
+import csv
+from datetime import datetime
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from app import create_app
+from app.models.professor import db
+from app.models.nota import Nota
+from app.models.versao_tabela import chave_turma, incrementar_versoes
+from app.migracoes import buscar_notas_duplicadas
+
+
+def exportar_notas(notas, caminho):
+    """Grava as notas (todas as colunas da tabela) em um CSV"""
+    colunas = [coluna.name for coluna in Nota.__table__.columns]
+    with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(colunas)
+        for nota in notas:
+            escritor.writerow([getattr(nota, coluna) for coluna in colunas])
+
+
+def migrate(simular=False):
+    # Sem bloquear: a aplicação não sobe enquanto as duplicadas existirem
+    app = create_app(bloquear_migracoes=False)
+    with app.app_context():
+        try:
+            print("🔄 Procurando notas duplicadas...")
+            grupos = buscar_notas_duplicadas()
+            if not grupos:
+                print("✅ Nenhuma nota duplicada encontrada")
+            else:
+                ids = [id_nota for grupo in grupos for id_nota in grupo['ids']]
+                notas = {nota.id: nota for nota in Nota.query.filter(Nota.id.in_(ids)).all()}
+
+                caminho = os.path.abspath(f"notas_duplicadas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+                exportar_notas([notas[id_nota] for id_nota in ids], caminho)
+                print(f"📄 {len(ids)} nota(s) de {len(grupos)} grupo(s) exportada(s) para {caminho}")
+
+                remover = []
+                for grupo in grupos:
+                    mantida = grupo['ids'][-1]
+                    print(f"\n   Aluno {grupo['aluno_id']} | Professor {grupo['professor_id']} | "
+                          f"{grupo['tipo_curso']} | Prova {grupo['numero_prova']}")
+                    for id_nota in grupo['ids']:
+                        nota = notas[id_nota]
+                        acao = 'mantida' if id_nota == mantida else 'REMOVER'
+                        print(f"   - id {nota.id} ({acao}): critérios {nota.criterio1}, {nota.criterio2}, "
+                              f"{nota.criterio3}, {nota.criterio4} | valor {nota.valor} | "
+                              f"data {nota.data_avaliacao} | cadastro {nota.data_cadastro}")
+                    remover.extend(grupo['ids'][:-1])
+
+                if simular:
+                    print(f"\nℹ️  Simulação: {len(remover)} nota(s) seriam removidas; nada foi alterado")
+                    return
+
+                Nota.query.filter(Nota.id.in_(remover)).delete(synchronize_session=False)
+                incrementar_versoes(db.session.connection(), {'notas'} | {
+                    chave_turma(grupo['professor_id'], grupo['tipo_curso']) for grupo in grupos
+                })
+                db.session.commit()
+                print(f"\n✅ {len(remover)} nota(s) duplicada(s) removida(s) (ids: {remover})")
+
+            for indice in Nota.__table__.indexes:
+                if indice.name == 'uq_notas_aluno_professor_curso_prova':
+                    indice.create(bind=db.engine, checkfirst=True)
+            print("✅ Índice único uq_notas_aluno_professor_curso_prova criado")
+        except Exception as e:
+            db.session.rollback()
+            import traceback
+            print(f"❌ Erro durante a migração: {e}")
+            print(traceback.format_exc())
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    migrate(simular='--simular' in sys.argv[1:])
@@ -0,0 +1,110 @@
+"""
+Fixtures dos testes (pytest)
+
+Os testes usam um banco SQLite temporário: as variáveis de ambiente são definidas antes de
+importar o Config, que lê o banco na importação. Cada teste começa com as tabelas vazias.
+"""
+import os
+import sys
+import tempfile
+from datetime import date
+
+import pytest
+
+DIRETORIO_TESTES = tempfile.mkdtemp(prefix='testes_controle_')
+os.environ['DATABASE_PATH'] = DIRETORIO_TESTES
+os.environ['DATABASE_URL'] = ''  # vazio: o .env não sobrescreve e o Config usa o SQLite
+os.environ['ENVIRONMENT'] = 'dev'
+os.environ.pop('RENDER', None)
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.models.professor import db, Professor
+from app.models.aluno import Aluno
+from app.models.horario_professor import HorarioProfessor
+from app.models.usuario import Usuario
+
+SENHA = 'senha-teste'
+
+# Tabela de referência preenchida pelo create_app (inicializar_modalidades)
+TABELAS_PRESERVADAS = {'modalidades'}
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config.update(
+        TESTING=True,
+        UPLOAD_SPOOL_DIR=os.path.join(DIRETORIO_TESTES, 'spool'),
+        ARMAZENAMENTO_BACKEND='fake',
+        ARMAZENAMENTO_FAKE_LATENCIA=0,
+        ARMAZENAMENTO_FAKE_FALHAS=0,
+    )
+    return app
+
+
+@pytest.fixture(autouse=True)
+def banco(app):
+    """Contexto da aplicação com as tabelas esvaziadas ao fim de cada teste"""
+    with app.app_context():
+        yield db
+        db.session.rollback()
+        for tabela in reversed(db.metadata.sorted_tables):
+            if tabela.name not in TABELAS_PRESERVADAS:
+                db.session.execute(tabela.delete())
+        db.session.commit()
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def dados(banco):
+    """Professor com dois horários, dois alunos e os usuários admin e professor"""
+    professor = Professor(nome='Professor Teste', telefone='+55 11 999999999', dublagem_online=True)
+    db.session.add(professor)
+    db.session.flush()
+    segunda = HorarioProfessor(
+        professor_id=professor.id, dia_semana='Segunda-feira', horario_aula='17:00 às 19:00',
+        modalidade='dublagem_online', idade_minima=8, idade_maxima=15
+    )
+    terca = HorarioProfessor(
+        professor_id=professor.id, dia_semana='Terça-feira', horario_aula='19:00 às 21:00',
+        modalidade='dublagem_online', idade_minima=16, idade_maxima=99
+    )
+    alunos = [
+        Aluno(nome=f'Aluno {n}', telefone=str(n), cidade='São Paulo', estado='SP', forma_pagamento='Pix',
+              data_vencimento=date.today(), dublagem_online=True)
+        for n in (1, 2)
+    ]
+    db.session.add_all([segunda, terca, *alunos])
+    db.session.flush()
+
+    admin = Usuario(username='admin', email='admin@teste', role='admin')
+    admin.set_password(SENHA)
+    usuario_professor = Usuario(username='professor', email='professor@teste', role='professor',
+                                professor_id=professor.id)
+    usuario_professor.set_password(SENHA)
+    db.session.add_all([admin, usuario_professor])
+    db.session.commit()
+    return {
+        'professor_id': professor.id,
+        'horarios': [segunda.id, terca.id],
+        'alunos': [aluno.id for aluno in alunos],
+    }
+
+
+def autenticar(client, username):
+    """Headers com o token JWT da API para o usuário"""
+    resposta = client.post('/api/v1/auth/login', json={'username': username, 'password': SENHA})
+    assert resposta.status_code == 200, resposta.get_json()
+    return {'Authorization': f"Bearer {resposta.get_json()['token']}"}
+
+
+@pytest.fixture
+def admin_headers(client, dados):
+    return autenticar(client, 'admin')
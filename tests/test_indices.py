@@ -0,0 +1,207 @@
+"""
+As consultas mais frequentes precisam usar índices
+
+Cada consulta de CONSULTAS passa pelo EXPLAIN (SQLite e PostgreSQL) depois de popular o banco
+acima de LIMITE_LINHAS por tabela; o teste falha quando o plano faz leitura sequencial de uma
+tabela desse tamanho.
+
+O PostgreSQL só é testado com TEST_DATABASE_URL apontando para um banco descartável (as tabelas
+são criadas e apagadas pelo teste); sem a variável, ou sem conexão, o teste é pulado.
+"""
+import os
+import re
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from app.models.professor import db, Professor
+from app.models.aluno import Aluno
+from app.models.matricula import Matricula
+from app.models.nota import Nota
+from app.models.pagamento import Pagamento
+from app.models.horario_professor import HorarioProfessor
+from app.models.usuario import Usuario
+from app.models.senha_reset import SenhaReset
+
+# Em tabelas pequenas o PostgreSQL prefere leitura sequencial mesmo com índice
+LIMITE_LINHAS = 1000
+LINHAS_POR_TABELA = 1500
+PROFESSORES = 50
+
+
+def _consultas():
+    """(descrição, SELECT) das consultas filtradas por papel/relacionamento usadas nas telas e na API"""
+    hoje = date.today()
+    alunos_do_professor = db.select(Matricula.aluno_id).where(Matricula.professor_id == 1)
+    return [
+        ('Matrículas do aluno', db.select(Matricula).where(Matricula.aluno_id == 1)),
+        ('Matrículas da turma', db.select(Matricula).where(
+            Matricula.professor_id == 1, Matricula.tipo_curso == 'dublagem_online')),
+        ('Notas do aluno', db.select(Nota).where(Nota.aluno_id == 1)),
+        ('Notas da turma', db.select(Nota).where(
+            Nota.professor_id == 1, Nota.tipo_curso == 'dublagem_online')),
+        ('Notas da matrícula', db.select(Nota).where(Nota.matricula_id == 1)),
+        ('Pagamentos do aluno', db.select(Pagamento).where(Pagamento.aluno_id == 1).order_by(
+            Pagamento.ano_referencia.desc(), Pagamento.mes_referencia.desc())),
+        ('Pagamentos pendentes', db.select(Pagamento).where(Pagamento.status == 'pendente')),
+        ('Comprovante já enviado (hash)', db.select(Pagamento).where(
+            Pagamento.hash_comprovante == '0' * 64)),
+        ('Comprovantes em uso (limpeza de órfãos)', db.select(Pagamento.public_id).where(
+            Pagamento.public_id.in_(['comprovantes/1/a', 'comprovantes/1/b']))),
+        ('Miniaturas em uso (limpeza de órfãos)', db.select(Pagamento.miniatura_id).where(
+            Pagamento.miniatura_id.in_(['comprovantes/1/a', 'comprovantes/1/b']))),
+        ('Pagamentos dos alunos do professor', db.select(Pagamento).where(
+            Pagamento.aluno_id.in_(alunos_do_professor))),
+        ('Horários do professor', db.select(HorarioProfessor).where(HorarioProfessor.professor_id == 1)),
+        ('Alunos do professor', db.select(Aluno).join(Matricula, Matricula.aluno_id == Aluno.id).where(
+            Matricula.professor_id == 1)),
+        ('Alunos pendentes de aprovação', db.select(Aluno).where(
+            Aluno.ativo == True, Aluno.aprovado == False).order_by(Aluno.nome)),
+        ('Vencimentos da semana', db.select(Aluno).where(
+            Aluno.data_vencimento.between(hoje, hoje + timedelta(days=7)))),
+        ('Usuário do professor', db.select(Usuario).where(Usuario.professor_id == 1)),
+        ('Usuário do aluno', db.select(Usuario).where(Usuario.aluno_id == 1)),
+        ('Códigos de recuperação do usuário', db.select(SenhaReset).where(SenhaReset.usuario_id == 1)),
+        ('Matrículas ativas do aluno', db.select(Matricula).where(
+            Matricula.aluno_id == 1, Matricula.ativa)),
+        ('Matrículas vigentes da turma', db.select(Matricula).where(
+            Matricula.professor_id == 1, Matricula.tipo_curso == 'dublagem_online', Matricula.vigente)),
+    ]
+
+
+def _popular():
+    """Insere LINHAS_POR_TABELA linhas nas tabelas consultadas, com valores variados"""
+    hoje = date.today()
+    agora = datetime.now()
+    n = LINHAS_POR_TABELA
+    tipos = ['dublagem_online', 'dublagem_presencial', 'locucao', 'teatro_presencial']
+    dias = ['Segunda-feira', 'Terça-feira', 'Quarta-feira', 'Quinta-feira', 'Sexta-feira']
+
+    db.session.execute(db.insert(Professor.__table__), [
+        {'id': i, 'nome': f'Professor {i}', 'telefone': str(i)} for i in range(1, PROFESSORES + 1)
+    ])
+    db.session.execute(db.insert(Aluno.__table__), [
+        {'id': i, 'nome': f'Aluno {i}', 'telefone': str(i), 'cidade': 'São Paulo', 'estado': 'SP',
+         'forma_pagamento': 'Pix', 'data_vencimento': hoje + timedelta(days=i % 365),
+         'ativo': i % 20 != 0, 'aprovado': i % 50 != 0}
+        for i in range(1, n + 1)
+    ])
+    db.session.execute(db.insert(HorarioProfessor.__table__), [
+        {'id': i, 'professor_id': i % PROFESSORES + 1, 'dia_semana': dias[i % 5],
+         'horario_aula': f'{8 + i % 12:02d}:00 às {9 + i % 12:02d}:00', 'modalidade': tipos[i % 4]}
+        for i in range(1, n + 1)
+    ])
+    db.session.execute(db.insert(Matricula.__table__), [
+        {'id': i, 'aluno_id': i, 'professor_id': i % PROFESSORES + 1, 'tipo_curso': tipos[i % 4],
+         'valor_mensalidade': 100, 'data_encerramento': hoje - timedelta(days=30) if i % 10 == 0 else None}
+        for i in range(1, n + 1)
+    ])
+    db.session.execute(db.insert(Nota.__table__), [
+        {'id': i, 'aluno_id': i, 'professor_id': i % PROFESSORES + 1, 'matricula_id': i,
+         'tipo_curso': tipos[i % 4], 'numero_prova': 1, 'data_avaliacao': hoje, 'valor': 7}
+        for i in range(1, n + 1)
+    ])
+    db.session.execute(db.insert(Pagamento.__table__), [
+        {'id': i, 'aluno_id': i, 'mes_referencia': 1 + i % 12, 'ano_referencia': 2025, 'valor_pago': 100,
+         'data_pagamento': hoje, 'status': 'pendente' if i % 25 == 0 else 'aprovado',
+         'hash_comprovante': f'{i:064x}', 'public_id': f'comprovantes/{i}/{i}.pdf',
+         'miniatura_id': f'comprovantes/{i}/{i}_miniatura.webp'}
+        for i in range(1, n + 1)
+    ])
+    db.session.execute(db.insert(Usuario.__table__), [
+        {'id': i, 'username': f'usuario{i}', 'email': f'usuario{i}@teste', 'password_hash': 'x',
+         'role': 'professor' if i <= PROFESSORES else 'aluno',
+         'professor_id': i if i <= PROFESSORES else None, 'aluno_id': i if i > PROFESSORES else None}
+        for i in range(1, n + 1)
+    ])
+    db.session.execute(db.insert(SenhaReset.__table__), [
+        {'id': i, 'usuario_id': i, 'codigo': f'{i:012d}', 'data_expiracao': agora + timedelta(days=1)}
+        for i in range(1, n + 1)
+    ])
+    db.session.commit()
+
+
+def _leituras_sequenciais_sqlite(sql):
+    """Tabelas lidas sem índice segundo o EXPLAIN QUERY PLAN ('SCAN tabela' sem 'USING')"""
+    tabelas = []
+    for linha in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')):
+        detalhe = linha[-1]
+        match = re.match(r'^SCAN (?:TABLE )?(\w+)', detalhe)
+        if match and 'USING' not in detalhe:
+            tabelas.append(match.group(1))
+    return tabelas
+
+
+def _leituras_sequenciais_postgresql(sql):
+    """Tabelas com nó 'Seq Scan' no plano JSON do EXPLAIN"""
+    plano = db.session.execute(db.text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar()
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+
+    tabelas = []
+    pendentes = [plano[0]['Plan']]
+    while pendentes:
+        no = pendentes.pop()
+        if no.get('Node Type') == 'Seq Scan':
+            tabelas.append(no.get('Relation Name'))
+        pendentes.extend(no.get('Plans', []))
+    return tabelas
+
+
+def _falhas(leituras_sequenciais):
+    """Lista de 'descrição: tabela (linhas)' das leituras sequenciais em tabelas grandes"""
+    tamanhos = {}
+    falhas = []
+    for descricao, consulta in _consultas():
+        sql = str(consulta.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        for tabela in leituras_sequenciais(sql):
+            if tabela not in tamanhos:
+                tamanhos[tabela] = db.session.execute(db.text(f'SELECT COUNT(*) FROM {tabela}')).scalar()
+            if tamanhos[tabela] > LIMITE_LINHAS:
+                falhas.append(f'{descricao}: leitura sequencial em {tabela} ({tamanhos[tabela]} linhas)')
+    return falhas
+
+
+def test_consultas_usam_indices_sqlite(banco):
+    _popular()
+    assert _falhas(_leituras_sequenciais_sqlite) == []
+
+
+def test_leitura_sequencial_e_detectada_sqlite(banco):
+    """O teste acima só vale se uma consulta sem índice for acusada"""
+    _popular()
+    assert _leituras_sequenciais_sqlite('SELECT * FROM alunos WHERE telefone = \'1\'') == ['alunos']
+
+
+@pytest.fixture
+def app_postgresql():
+    url = os.environ.get('TEST_DATABASE_URL', '')
+    if not url.startswith(('postgres://', 'postgresql://')):
+        pytest.skip('TEST_DATABASE_URL (PostgreSQL) não configurada')
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=url, SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(app)
+    with app.app_context():
+        try:
+            db.session.execute(db.text('SELECT 1'))
+        except Exception as e:
+            pytest.skip(f'PostgreSQL indisponível: {e}')
+        db.drop_all()
+        db.create_all()
+        try:
+            yield app
+        finally:
+            db.session.rollback()
+            db.drop_all()
+            db.session.remove()
+
+
+def test_consultas_usam_indices_postgresql(app_postgresql):
+    _popular()
+    db.session.execute(db.text('ANALYZE'))
+    assert _falhas(_leituras_sequenciais_postgresql) == []
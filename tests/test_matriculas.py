@@ -0,0 +1,81 @@
+"""Matrícula vigente (aluno ativo e matrícula não encerrada) e o uso dela no dashboard"""
+from datetime import date, timedelta
+
+import pytest
+
+from app.models.professor import db
+from app.models.aluno import Aluno
+from app.models.matricula import Matricula
+
+
+@pytest.fixture
+def matriculas(dados):
+    """Aluno 1: uma matrícula aberta e uma encerrada; aluno 2: matrícula que encerra no futuro"""
+    aluno1, aluno2 = dados['alunos']
+    base = {'professor_id': dados['professor_id'], 'tipo_curso': 'dublagem_online', 'valor_mensalidade': 100}
+    criadas = [
+        Matricula(aluno_id=aluno1, **base),
+        Matricula(aluno_id=aluno1, data_encerramento=date.today() - timedelta(days=1), **base),
+        Matricula(aluno_id=aluno2, data_encerramento=date.today() + timedelta(days=30), **base),
+    ]
+    db.session.add_all(criadas)
+    db.session.commit()
+    return [m.id for m in criadas]
+
+
+def _vigentes():
+    return sorted(m.id for m in Matricula.query.filter(Matricula.vigente))
+
+
+def test_vigente_exige_aluno_ativo_e_matricula_aberta(dados, matriculas):
+    aberta, encerrada, encerra_no_futuro = matriculas
+    assert _vigentes() == [aberta, encerra_no_futuro]
+    assert [db.session.get(Matricula, i).vigente for i in matriculas] == [True, False, True]
+
+    db.session.get(Aluno, dados['alunos'][1]).ativo = False
+    db.session.commit()
+    assert _vigentes() == [aberta]
+    assert db.session.get(Matricula, encerra_no_futuro).vigente is False
+
+
+def test_vigente_em_consulta_com_join_de_alunos(dados, matriculas):
+    db.session.get(Aluno, dados['alunos'][1]).ativo = False
+    db.session.commit()
+    alunos = db.session.query(Aluno.id).join(Matricula, Aluno.id == Matricula.aluno_id).filter(
+        Matricula.vigente
+    ).distinct().all()
+    assert alunos == [(dados['alunos'][0],)]
+
+
+def test_dashboard_conta_apenas_alunos_com_matricula_vigente(client, admin_headers, dados, matriculas):
+    assert client.get('/api/v1/dashboard/stats', headers=admin_headers).get_json()['data']['total_alunos'] == 2
+
+    db.session.get(Aluno, dados['alunos'][1]).ativo = False
+    db.session.commit()
+    assert client.get('/api/v1/dashboard/stats', headers=admin_headers).get_json()['data']['total_alunos'] == 1
+
+
+def test_edicao_do_aluno_preserva_matriculas_inalteradas(client, admin_headers, dados):
+    aluno_id = dados['alunos'][0]
+    item = {'professor_id': dados['professor_id'], 'modalidade': 'dublagem_online',
+            'horario_id': dados['horarios'][0], 'valor_mensalidade': 100}
+    url = f'/api/v1/alunos/{aluno_id}'
+    assert client.put(url, headers=admin_headers, json={'matriculas': [item]}).status_code == 200
+    matricula_id = Matricula.query.filter_by(aluno_id=aluno_id).one().id
+
+    assert client.put(url, headers=admin_headers, json={'matriculas': [item]}).status_code == 200
+    assert [m.id for m in Matricula.query.filter_by(aluno_id=aluno_id)] == [matricula_id]
+
+    # Removida da lista: encerrada, não apagada
+    assert client.put(url, headers=admin_headers, json={'matriculas': []}).status_code == 200
+    assert db.session.get(Matricula, matricula_id).data_encerramento is not None
+
+
+@pytest.mark.parametrize('campo', ['professor_id', 'horario_id'])
+def test_edicao_do_aluno_recusa_ids_nao_numericos(client, admin_headers, dados, campo):
+    item = {'professor_id': dados['professor_id'], 'modalidade': 'dublagem_online',
+            'horario_id': dados['horarios'][0], campo: 'abc'}
+    resposta = client.put(f"/api/v1/alunos/{dados['alunos'][0]}", headers=admin_headers, json={'matriculas': [item]})
+    assert resposta.status_code == 400
+    assert campo in resposta.get_json()['error']
+    assert Matricula.query.count() == 0
@@ -0,0 +1,94 @@
+"""Lançamento de notas: upsert em lote e unicidade por aluno/professor/curso/prova"""
+import pytest
+
+from app.models.professor import db
+from app.models.matricula import Matricula
+from app.models.nota import Nota
+from app.migracoes import MigracaoBloqueada, criar_indices_faltantes, verificar_notas_duplicadas
+
+
+@pytest.fixture
+def turma(dados):
+    """Os dois alunos matriculados na turma dublagem_online do professor"""
+    for aluno_id in dados['alunos']:
+        db.session.add(Matricula(
+            aluno_id=aluno_id, professor_id=dados['professor_id'], tipo_curso='dublagem_online',
+            valor_mensalidade=100, dia_semana='Segunda-feira', horario_aula='17:00 às 19:00'
+        ))
+    db.session.commit()
+    return dados
+
+
+def _lote(turma, notas, numero_prova=1):
+    return {
+        'professor_id': turma['professor_id'], 'tipo_curso': 'dublagem_online',
+        'numero_prova': numero_prova, 'data_avaliacao': '2026-03-10', 'notas': notas,
+    }
+
+
+def test_lote_insere_e_depois_atualiza_a_mesma_prova(client, admin_headers, turma):
+    aluno1, aluno2 = turma['alunos']
+    resposta = client.post('/api/v1/notas/batch', headers=admin_headers, json=_lote(turma, [
+        {'aluno_id': aluno1, 'criterio1': 8, 'criterio2': 6},
+        {'aluno_id': aluno2, 'valor': 5},
+    ]))
+    assert resposta.status_code == 200, resposta.get_json()
+    assert (resposta.get_json()['criadas'], resposta.get_json()['atualizadas']) == (2, 0)
+
+    resposta = client.post('/api/v1/notas/batch', headers=admin_headers, json=_lote(turma, [
+        {'aluno_id': aluno1, 'criterio1': 10, 'criterio2': 9},
+    ]))
+    assert resposta.status_code == 200, resposta.get_json()
+    assert (resposta.get_json()['criadas'], resposta.get_json()['atualizadas']) == (0, 1)
+
+    notas = Nota.query.filter_by(aluno_id=aluno1, numero_prova=1).all()
+    assert len(notas) == 1
+    assert (notas[0].criterio1, notas[0].criterio2, notas[0].media) == (10, 9, 9.5)
+    assert Nota.query.filter_by(aluno_id=aluno2).one().valor == 5
+
+
+def test_lote_com_item_invalido_nao_grava_nada(client, admin_headers, turma):
+    aluno1, _ = turma['alunos']
+    resposta = client.post('/api/v1/notas/batch', headers=admin_headers, json=_lote(turma, [
+        {'aluno_id': aluno1, 'criterio1': 8},
+        {'aluno_id': aluno1, 'criterio1': 9},
+    ]))
+    assert resposta.status_code == 400
+    assert Nota.query.count() == 0
+
+
+def test_nota_repetida_retorna_409(client, admin_headers, turma):
+    nota = {'aluno_id': turma['alunos'][0], 'professor_id': turma['professor_id'],
+            'tipo_curso': 'dublagem_online', 'valor': 7, 'numero_prova': 1}
+    assert client.post('/api/v1/notas', headers=admin_headers, json=nota).status_code == 201
+    assert client.post('/api/v1/notas', headers=admin_headers, json=nota).status_code == 409
+
+    resposta = client.post('/api/v1/notas', headers=admin_headers, json=dict(nota, numero_prova=2))
+    assert resposta.status_code == 201
+    nota_id = resposta.get_json()['data']['id']
+    resposta = client.put(f'/api/v1/notas/{nota_id}', headers=admin_headers, json={'numero_prova': 1})
+    assert resposta.status_code == 409
+    assert Nota.query.count() == 2
+
+
+def test_notas_duplicadas_bloqueiam_a_inicializacao_sem_apagar(turma):
+    aluno1, _ = turma['alunos']
+    db.session.execute(db.text('DROP INDEX uq_notas_aluno_professor_curso_prova'))
+    try:
+        for valor in (6, 8):
+            db.session.execute(db.insert(Nota.__table__).values(
+                aluno_id=aluno1, professor_id=turma['professor_id'], tipo_curso='dublagem_online',
+                numero_prova=1, valor=valor, data_avaliacao=db.func.current_date()
+            ))
+        db.session.commit()
+
+        with pytest.raises(MigracaoBloqueada, match='ids'):
+            verificar_notas_duplicadas()
+        with pytest.raises(MigracaoBloqueada):
+            criar_indices_faltantes()
+        assert Nota.query.count() == 2
+    finally:
+        db.session.rollback()
+        db.session.execute(db.delete(Nota.__table__))
+        db.session.commit()
+        criar_indices_faltantes()
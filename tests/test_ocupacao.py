@@ -0,0 +1,81 @@
+"""Capacidade das turmas: ocupação por professor, modalidade e horário, conferida em toda matrícula nova"""
+from datetime import date, timedelta
+
+import pytest
+
+from app.models.professor import db
+from app.models.aluno import Aluno
+from app.models.matricula import Matricula
+from app.models.horario_professor import HorarioProfessor
+
+
+@pytest.fixture
+def turma_de_uma_vaga(dados):
+    """Horário de segunda 17:00 (dublagem_online) com uma vaga e locução no mesmo horário, também com uma"""
+    segunda = db.session.get(HorarioProfessor, dados['horarios'][0])
+    segunda.capacidade = 1
+    locucao = HorarioProfessor(
+        professor_id=dados['professor_id'], dia_semana='Segunda-feira', horario_aula='17:00 às 19:00',
+        modalidade='locucao', capacidade=1
+    )
+    db.session.add(locucao)
+    db.session.commit()
+    return dict(dados, dublagem=segunda.id, locucao=locucao.id)
+
+
+def _matricular(client, headers, turma, aluno_id, horario, tipo_curso='dublagem_online'):
+    return client.post('/api/v1/matriculas', headers=headers, json={
+        'aluno_id': aluno_id, 'professor_id': turma['professor_id'], 'tipo_curso': tipo_curso,
+        'horario_id': turma[horario], 'valor_mensalidade': 100,
+    })
+
+
+def test_turma_lotada_recusa_nova_matricula(client, admin_headers, turma_de_uma_vaga):
+    aluno1, aluno2 = turma_de_uma_vaga['alunos']
+    assert _matricular(client, admin_headers, turma_de_uma_vaga, aluno1, 'dublagem').status_code == 201
+
+    resposta = _matricular(client, admin_headers, turma_de_uma_vaga, aluno2, 'dublagem')
+    assert resposta.status_code == 409
+    assert resposta.get_json()['error'] == 'Turma lotada'
+    assert Matricula.query.count() == 1
+
+
+def test_ocupacao_e_separada_por_modalidade(client, admin_headers, turma_de_uma_vaga):
+    aluno1, aluno2 = turma_de_uma_vaga['alunos']
+    assert _matricular(client, admin_headers, turma_de_uma_vaga, aluno1, 'dublagem').status_code == 201
+    # Mesmo professor e horário, outra modalidade: a vaga da locução continua livre
+    resposta = _matricular(client, admin_headers, turma_de_uma_vaga, aluno2, 'locucao', tipo_curso='locucao')
+    assert resposta.status_code == 201, resposta.get_json()
+
+    resposta = client.get('/api/v1/horarios/ocupacao', headers=admin_headers)
+    ocupacao = {d['id']: (d['ocupadas'], d['lotado']) for d in resposta.get_json()['data']}
+    assert ocupacao[turma_de_uma_vaga['dublagem']] == (1, True)
+    assert ocupacao[turma_de_uma_vaga['locucao']] == (1, True)
+    assert ocupacao[turma_de_uma_vaga['horarios'][1]] == (0, False)
+
+
+def test_matricula_encerrada_libera_a_vaga(client, admin_headers, turma_de_uma_vaga):
+    aluno1, aluno2 = turma_de_uma_vaga['alunos']
+    matricula_id = _matricular(client, admin_headers, turma_de_uma_vaga, aluno1, 'dublagem').get_json()['data']['id']
+    db.session.get(Matricula, matricula_id).data_encerramento = date.today() - timedelta(days=1)
+    db.session.commit()
+
+    assert _matricular(client, admin_headers, turma_de_uma_vaga, aluno2, 'dublagem').status_code == 201
+
+
+def test_cadastro_e_edicao_de_aluno_respeitam_a_capacidade(client, admin_headers, turma_de_uma_vaga):
+    aluno1, aluno2 = turma_de_uma_vaga['alunos']
+    assert _matricular(client, admin_headers, turma_de_uma_vaga, aluno1, 'dublagem').status_code == 201
+    matriculas = [{'professor_id': turma_de_uma_vaga['professor_id'], 'modalidade': 'dublagem_online',
+                   'horario_id': turma_de_uma_vaga['dublagem'], 'valor_mensalidade': 100}]
+
+    resposta = client.post('/api/v1/alunos', headers=admin_headers, json={
+        'nome': 'Aluno Novo', 'telefone': '3', 'cidade': 'São Paulo', 'estado': 'SP',
+        'forma_pagamento': 'Pix', 'data_vencimento': '2026-04-10', 'matriculas': matriculas,
+    })
+    assert resposta.status_code == 409
+    assert Aluno.query.count() == 2
+
+    resposta = client.put(f'/api/v1/alunos/{aluno2}', headers=admin_headers, json={'matriculas': matriculas})
+    assert resposta.status_code == 409
+    assert Matricula.query.filter_by(aluno_id=aluno2).count() == 0
@@ -0,0 +1,109 @@
+"""Upload de comprovantes: deduplicação pelo SHA-256 do arquivo (uq_pagamentos_comprovante_ativo)"""
+import io
+import hashlib
+from datetime import date
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import app.services.upload_service as upload_service
+from app.models.professor import db
+from app.models.pagamento import Pagamento
+
+COMPROVANTE = b'%PDF-1.4 comprovante de teste ' * 100
+
+
+@pytest.fixture
+def envios(monkeypatch):
+    """Ids agendados para envio (os workers não rodam nos testes)"""
+    agendados = []
+    monkeypatch.setattr(upload_service, 'agendar_envio', lambda pagamento_id, app=None: agendados.append(pagamento_id))
+    return agendados
+
+
+def _enviar(client, headers, aluno_id, conteudo=COMPROVANTE, mes=3):
+    return client.post('/api/v1/pagamentos/upload', headers=headers, content_type='multipart/form-data', data={
+        'aluno_id': str(aluno_id), 'mes_referencia': str(mes), 'ano_referencia': '2026',
+        'valor_pago': '100', 'data_pagamento': '2026-03-05',
+        'comprovante': (io.BytesIO(conteudo), 'comprovante.pdf'),
+    })
+
+
+def _pagamento(aluno_id, status, **campos):
+    pagamento = Pagamento(
+        aluno_id=aluno_id, mes_referencia=3, ano_referencia=2026, valor_pago=100,
+        data_pagamento=date(2026, 3, 5), status=status,
+        hash_comprovante=hashlib.sha256(COMPROVANTE).hexdigest(), **campos
+    )
+    db.session.add(pagamento)
+    db.session.commit()
+    return pagamento
+
+
+def test_mesmo_arquivo_no_mes_devolve_o_pagamento_existente(client, admin_headers, dados, envios):
+    aluno_id = dados['alunos'][0]
+    primeiro = _enviar(client, admin_headers, aluno_id)
+    assert primeiro.status_code == 202, primeiro.get_json()
+    assert primeiro.get_json()['data']['status'] == 'enviando'
+
+    segundo = _enviar(client, admin_headers, aluno_id)
+    assert segundo.status_code == 200
+    assert segundo.get_json()['duplicado'] is True
+    assert segundo.get_json()['data']['id'] == primeiro.get_json()['data']['id']
+    assert Pagamento.query.count() == 1
+    assert envios == [primeiro.get_json()['data']['id']]
+
+    # Outro mês ou outro arquivo não é duplicado
+    assert _enviar(client, admin_headers, aluno_id, mes=4).status_code == 202
+    assert _enviar(client, admin_headers, aluno_id, conteudo=b'%PDF-1.4 outro' * 100).status_code == 202
+    assert Pagamento.query.count() == 3
+
+
+def test_envio_simultaneo_do_mesmo_arquivo_cai_no_indice_unico(client, admin_headers, dados, envios, monkeypatch):
+    aluno_id = dados['alunos'][0]
+    primeiro = _enviar(client, admin_headers, aluno_id).get_json()['data']['id']
+
+    # A consulta prévia não vê o pagamento gravado pelo outro envio (corrida)
+    buscar = upload_service.buscar_comprovante_igual
+    chamadas = []
+
+    def buscar_depois_do_insert(*args):
+        chamadas.append(args)
+        return None if len(chamadas) == 1 else buscar(*args)
+
+    monkeypatch.setattr(upload_service, 'buscar_comprovante_igual', buscar_depois_do_insert)
+    segundo = _enviar(client, admin_headers, aluno_id)
+    assert segundo.status_code == 200
+    assert segundo.get_json()['duplicado'] is True
+    assert segundo.get_json()['data']['id'] == primeiro
+    assert len(chamadas) == 2
+    assert Pagamento.query.count() == 1
+
+
+def test_arquivo_de_pagamento_rejeitado_e_reaproveitado(client, admin_headers, dados, envios):
+    aluno_id = dados['alunos'][0]
+    rejeitado = _pagamento(aluno_id, 'rejeitado', public_id='comprovantes/1/a.pdf',
+                           url_comprovante='http://armazenamento/comprovantes/1/a.pdf')
+
+    resposta = _enviar(client, admin_headers, aluno_id)
+    assert resposta.status_code == 201, resposta.get_json()
+    novo = db.session.get(Pagamento, resposta.get_json()['data']['id'])
+    assert novo.id != rejeitado.id
+    assert (novo.status, novo.public_id) == ('pendente', 'comprovantes/1/a.pdf')
+    assert envios == []
+
+    # O rejeitado não pode voltar a valer enquanto o reenvio do mesmo arquivo estiver ativo
+    resposta = client.put(f'/api/v1/pagamentos/{rejeitado.id}/aprovar', headers=admin_headers, json={})
+    assert resposta.status_code == 409
+    assert db.session.get(Pagamento, rejeitado.id).status == 'rejeitado'
+
+
+def test_indice_unico_ignora_rejeitados_e_falhas_de_envio(dados):
+    aluno_id = dados['alunos'][0]
+    _pagamento(aluno_id, 'rejeitado')
+    _pagamento(aluno_id, 'falha_envio')
+    _pagamento(aluno_id, 'pendente')
+    with pytest.raises(IntegrityError):
+        _pagamento(aluno_id, 'aprovado')
+    db.session.rollback()
+    assert Pagamento.query.count() == 3
@@ -3,6 +3,10 @@ import os
 
 app = create_app()
 
+# Reenviar comprovantes que ficaram no spool (servidor reiniciado no meio do envio)
+from app.services.upload_service import retomar_envios_pendentes
+retomar_envios_pendentes(app)
+
 # Para desenvolvimento local
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))